@@ -1,57 +1,24 @@
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
 from typing import List, Optional
 import logging
 from datetime import datetime, timedelta
-from models import Location, ErrorResponse
-from main import app, is_cache_valid
+from models import Location, LocationWithDistance, ErrorResponse
+from main import app, is_cache_valid, CACHE_TTL
+import derived_fields
+import geo_queries
+import pagination
+import read_models
+import fast_json
+import http_cache
+import stale_cache
+from config import settings
+from suggest_index import suggest_index
+from spatial_index import spatial_index, fetch_hits
 import httpx
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Calculate distance between two points using Haversine formula
-def calculate_distance(lat1, lon1, lat2, lon2):
-    # Earth radius in kilometers
-    from math import radians, sin, cos, sqrt, atan2
-    R = 6371.0
-    
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    
-    return R * c  # Distance in km
-
-# Filter locations by parameters
-def filter_by_parameters(location, parameters):
-    if not location.get('parameters') or not parameters:
-        return False
-    return any(param in location.get('parameters', []) for param in parameters)
-
-# Filter locations by radius
-def filter_by_radius(location, lat, lon, radius):
-    loc_lat = location.get('coordinates', {}).get('latitude')
-    loc_lon = location.get('coordinates', {}).get('longitude')
-    
-    if not loc_lat or not loc_lon:
-        return False
-        
-    distance = calculate_distance(lat, lon, loc_lat, loc_lon)
-    return distance <= radius
-
-# Filter locations by bounding box
-def filter_by_bbox(location, min_lat, min_lon, max_lat, max_lon):
-    loc_lat = location.get('coordinates', {}).get('latitude')
-    loc_lon = location.get('coordinates', {}).get('longitude')
-    
-    if not loc_lat or not loc_lon:
-        return False
-        
-    return (min_lat <= loc_lat <= max_lat) and (min_lon <= loc_lon <= max_lon)
-
 # Log API requests for debugging
 async def log_api_request(url, params, headers):
     logger.info(f"API Request: {url}")
@@ -61,7 +28,7 @@ async def log_api_request(url, params, headers):
 # New endpoint for advanced location filtering
 @app.get(
     "/api/locations",
-    response_model=List[Location],
+    response_model=read_models.LocationWithDistanceList,
     responses={
         400: {"model": ErrorResponse},
         404: {"model": ErrorResponse}
@@ -78,15 +45,22 @@ async def get_filtered_locations(
     max_lat: Optional[float] = Query(None, description="Maximum latitude for bounding box"),
     max_lon: Optional[float] = Query(None, description="Maximum longitude for bounding box"),
     parameters: Optional[str] = Query(None, description="Comma-separated list of parameters (e.g. pm25,o3)"),
+    all_parameters: bool = Query(False, description="Require every listed parameter instead of any of them"),
     has_recent: bool = Query(False, description="Only include locations with recent measurements"),
     exclude_unknown: bool = Query(False, description="Exclude locations with unknown names"),
     limit: int = Query(50, ge=1, le=1000, description="Maximum number of results"),
     page: int = Query(1, ge=1, description="Page number"),
-    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API")
+    cursor: Optional[str] = Query(None, description="Token of the next page (X-Next-Cursor header)"),
+    with_total: bool = Query(False, description="Return the number of matches in X-Total-Count"),
+    fields: Optional[str] = Query(None, description="summary, or comma-separated summary fields (e.g. id,name)"),
+    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API"),
+    request: Request = None,
+    response: Response = None
 ):
     """
     Fetch monitoring locations with advanced filtering options.
     Filter by city, country, coordinates (radius or bbox), parameters, etc.
+    Pages are chained with the X-Next-Cursor token; `page` still works.
     """
     try:
         # Parse parameters if provided
@@ -97,12 +71,9 @@ async def get_filtered_locations(
         # Build query
         query = {}
         
-        # City filter
+        # City filter (prefix seek on the normalized city/locality keys)
         if city:
-            query["$or"] = [
-                {"city": {"$regex": f".*{city}.*", "$options": "i"}},
-                {"locality": {"$regex": f".*{city}.*", "$options": "i"}}
-            ]
+            query.update(derived_fields.city_prefix_query(city))
             
         # Country filter    
         if country:
@@ -111,40 +82,78 @@ async def get_filtered_locations(
         # Exclude unknown locations
         if exclude_unknown:
             query["name"] = {"$ne": None, "$nin": ["", "Unknown", "unknown"]}
+
+        # Parameter filter (multikey index on the normalized pollutants)
+        if param_list:
+            query.update(derived_fields.pollutant_query(param_list, match_all=all_parameters))
             
         logger.info(f"MongoDB Query: {query}")
 
+        # Spatial filters run before pagination: in memory for plain map views,
+        # otherwise in MongoDB on the 2dsphere index
+        radius_search = latitude is not None and longitude is not None
+        bbox_search = min_lat is not None and min_lon is not None and max_lat is not None and max_lon is not None
+        in_memory = spatial_index.built and not query and (radius_search or bbox_search)
+        # Distance-ordered results page by offset, the others by a keyset on id
+        by_distance = in_memory or radius_search
+        offset = (page - 1) * limit
+        after = None
+        if cursor and by_distance:
+            offset = pagination.decode_offset(cursor)
+        elif cursor:
+            after = pagination.decode_cursor(cursor, "id")
+
+        # Slim summaries read through a projection (fields=...)
+        selected = read_models.parse_fields(fields)
+        projection = read_models.projection(selected) if selected else None
+
         # Check cache first
         cached_locations = []
+        next_page = None
+        total = None
         try:
-            # Use to_list to get all matching documents at once
-            cursor = app.mongodb.locations.find(query).skip((page - 1) * limit).limit(limit)
-            cached_docs = await cursor.to_list(length=limit)
+            cached_docs = []
+            if in_memory:
+                if radius_search:
+                    hits = spatial_index.within_radius(latitude, longitude, radius)
+                else:
+                    station_ids = spatial_index.within_bbox(min_lat, min_lon, max_lat, max_lon)
+                    hits = [(station_id, None) for station_id in station_ids]
+                total = len(hits)
+                cached_docs = await fetch_hits(app.mongodb.locations, hits[offset:offset + limit], projection)
+            elif radius_search:
+                # $geoNear: stations within the radius, nearest first, with their distance
+                pipeline = geo_queries.near_pipeline(
+                    query, latitude, longitude, radius, offset, limit, projection=projection
+                )
+                cached_docs = await app.mongodb.locations.aggregate(pipeline).to_list(length=limit)
+            else:
+                # $geoWithin for a bounding box (None when the box is empty)
+                bbox = {}
+                if bbox_search:
+                    bbox = geo_queries.bbox_query(min_lat, min_lon, max_lat, max_lon)
+                if bbox is not None:
+                    query.update(bbox)
+                    page_query = {"$and": [query, pagination.keyset_query("id", *after)]} if after else query
+                    db_cursor = app.mongodb.locations.find(page_query, projection).sort(pagination.sort_spec("id"))
+                    if not after:
+                        db_cursor = db_cursor.skip(offset)
+                    # Use to_list to get all matching documents at once
+                    db_cursor = db_cursor.limit(limit)
+                    cached_docs = await db_cursor.to_list(length=limit)
+                    next_page = pagination.next_cursor(cached_docs, limit, "id")
+                    if with_total:
+                        total = await pagination.count_cache.count(app.mongodb.locations, query)
+            if by_distance and len(cached_docs) == limit:
+                next_page = pagination.encode_offset(offset + limit)
             
             for loc in cached_docs:
                 try:
-                    # Convert to Location object
-                    location = Location(**loc)
-                    
-                    # Apply post-query filters
-                    skip = False
-                    
-                    # Filter by parameters
-                    if param_list and not filter_by_parameters(loc, param_list):
-                        skip = True
-                        
-                    # Filter by radius
-                    if latitude is not None and longitude is not None and not filter_by_radius(
-                            loc, latitude, longitude, radius):
-                        skip = True
-                        
-                    # Filter by bounding box
-                    if min_lat is not None and min_lon is not None and max_lat is not None and max_lon is not None:
-                        if not filter_by_bbox(loc, min_lat, min_lon, max_lat, max_lon):
-                            skip = True
-                    
-                    if not skip:
-                        cached_locations.append(location)
+                    # Convert to Location object (with its distance for radius searches)
+                    if selected:
+                        cached_locations.append(read_models.to_summary(loc))
+                    else:
+                        cached_locations.append(LocationWithDistance(**loc))
                         
                 except Exception as e:
                     logger.error(f"Error parsing cached location: {e}")
@@ -153,8 +162,30 @@ async def get_filtered_locations(
         except Exception as e:
             logger.error(f"Error querying cache: {e}")
 
+        if cursor and not cached_locations:
+            # Past the last page of a cursor walk
+            return []
+
         if cached_locations:
             logger.info(f"Found {len(cached_locations)} locations in cache")
+            # The paging headers describe this page only, not the city fallback below
+            if response is not None:
+                if next_page:
+                    response.headers["X-Next-Cursor"] = next_page
+                if with_total and total is not None:
+                    response.headers["X-Total-Count"] = str(total)
+            # 304 when the client already has this page of the same data
+            last_fetched = stale_cache.newest(loc.last_fetched for loc in cached_locations)
+            unchanged = http_cache.validate(
+                request, response, last_fetched, CACHE_TTL,
+                http_cache.query_variant(request), len(cached_locations)
+            )
+            if unchanged:
+                return unchanged
+            if selected:
+                return read_models.respond(cached_locations, selected, response)
+            if settings.FAST_JSON:
+                return fast_json.respond(cached_locations, List[LocationWithDistance], response)
             return cached_locations
 
         # If we need to fetch from OpenAQ API, we'll still use the city-based approach
@@ -165,7 +196,7 @@ async def get_filtered_locations(
                 from main import get_locations
                 
                 # Get the existing implementation to handle the OpenAQ API call
-                return await get_locations(city, force_refresh)
+                return await get_locations(city, force_refresh, request=request, response=response, fields=fields)
             except Exception as e:
                 logger.error(f"Failed to call get_locations: {e}")
                 raise HTTPException(
@@ -176,6 +207,8 @@ async def get_filtered_locations(
         # If no city specified but cache is empty or invalid, return empty list
         return []
         
+    except (pagination.InvalidCursor, read_models.InvalidFields) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error in get_filtered_locations: {e}", exc_info=True)
         raise HTTPException(
@@ -200,9 +233,13 @@ async def get_city_suggestions(
     Returns a list of city names matching the query string.
     """
     try:
-        # Recherche dans MongoDB avec regex insensible à la casse
+        # Index en mémoire (préfixe + trigrammes), sans aller-retour MongoDB
+        if suggest_index.built:
+            return suggest_index.suggest(q, limit=10)
+
+        # Recherche par préfixe sur les clés normalisées (index, sans casse ni accents)
         cursor = app.mongodb.locations.aggregate([
-            {"$match": {"city": {"$regex": f".*{q}.*", "$options": "i"}}},
+            {"$match": {"city_key": derived_fields.prefix_pattern(q)}},
             {"$group": {"_id": {"city": "$city"}}},
             {"$project": {"_id": 0, "city": "$_id.city"}},
             {"$match": {"city": {"$ne": None, "$nin": ["", "Unknown", "unknown"]}}},
@@ -216,7 +253,7 @@ async def get_city_suggestions(
         # Si on a peu de résultats, compléter avec les localités
         if len(result) < 5:
             cursor = app.mongodb.locations.aggregate([
-                {"$match": {"locality": {"$regex": f".*{q}.*", "$options": "i"}}},
+                {"$match": {"locality_key": derived_fields.prefix_pattern(q)}},
                 {"$group": {"_id": {"locality": "$locality"}}},
                 {"$project": {"_id": 0, "locality": "$_id.locality"}},
                 {"$match": {"locality": {"$ne": None, "$nin": ["", "Unknown", "unknown"]}}},
@@ -240,3 +277,38 @@ async def get_city_suggestions(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fetching city suggestions: {str(e)}"
         )
+
+
+# Stations les plus proches d'un point (vues cartographiques)
+@app.get(
+    "/api/stations/nearest",
+    response_model=List[LocationWithDistance],
+    responses={
+        400: {"model": ErrorResponse}
+    }
+)
+async def get_nearest_stations(
+    latitude: float = Query(..., ge=-90, le=90, description="Latitude of the point"),
+    longitude: float = Query(..., ge=-180, le=180, description="Longitude of the point"),
+    limit: int = Query(10, ge=1, le=100, description="Number of stations"),
+    max_distance: Optional[float] = Query(None, gt=0, description="Maximum distance in kilometers")
+):
+    """
+    Return the `limit` stations closest to a point, nearest first, with
+    their distance in kilometers.
+    """
+    try:
+        if spatial_index.built:
+            hits = spatial_index.nearest(latitude, longitude, limit, max_distance)
+            docs = await fetch_hits(app.mongodb.locations, hits)
+        else:
+            pipeline = geo_queries.near_pipeline({}, latitude, longitude, max_distance, limit=limit)
+            docs = await app.mongodb.locations.aggregate(pipeline).to_list(length=limit)
+        return [LocationWithDistance(**doc) for doc in docs]
+
+    except Exception as e:
+        logger.error(f"Error in get_nearest_stations: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching nearest stations: {str(e)}"
+        )
@@ -1,17 +1,36 @@
-from fastapi import FastAPI, HTTPException, Request, Query, status, Depends
+from fastapi import FastAPI, HTTPException, Request, Response, Query, status, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from models import (
-    Location, Measurement, LocationResponse, MeasurementSummary,
+    Location, LocationWithDistance, Measurement, LocationResponse, MeasurementSummary,
     ErrorResponse, PaginatedResponse
 )
 from config import settings
+from compression import CompressionMiddleware
+import openaq_client
+from singleflight import upstream_flight, make_key
+from utils import gather_bounded
+import rate_limiter
+import stale_cache
+import persistence
+from write_behind import write_queue, pending_results
+import measurement_store
+import derived_fields
+import geo_queries
+import pagination
+import read_models
+import fast_json
+import http_cache
+from derived_fields import derive_location_fields, derive_pollutants
+from suggest_index import suggest_index
+from spatial_index import spatial_index, fetch_hits
+from pymongo import DeleteMany
 from datetime import datetime, timedelta
 import httpx
 from typing import List, Optional, Dict, Union
 import statistics
 from fastapi.responses import JSONResponse
-from math import radians, sin, cos, sqrt, atan2
+from math import ceil
 import logging
 
 # Configure logging
@@ -40,6 +59,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (cached bodies are only compressed once)
+app.add_middleware(CompressionMiddleware)
+
 # MongoDB connection setup
 @app.on_event("startup")
 async def startup_db_client():
@@ -52,16 +74,35 @@ async def startup_db_client():
     await app.mongodb.locations.create_index([("coordinates.latitude", 1), ("coordinates.longitude", 1)])
     await app.mongodb.locations.create_index("country.code")
     await app.mongodb.locations.create_index("parameters")
-    await app.mongodb.measurements.create_index([
-        ("location_id", 1),
-        ("parameter", 1),
-        ("date", -1)
-    ])
+    await derived_fields.ensure_indexes(app.mongodb)
+    await derived_fields.backfill(app.mongodb)
+    await geo_queries.ensure_index(app.mongodb)
+    await geo_queries.backfill(app.mongodb)
+    if not suggest_index.built:
+        await suggest_index.build(app.mongodb)
+    if not spatial_index.built:
+        await spatial_index.build(app.mongodb)
+    # Measurement storage (document or time-series collection, see MEASUREMENTS_STORAGE)
+    await measurement_store.get_store().ensure(app.mongodb)
+
+    # MongoDB writes of the routes are committed in the background
+    write_queue.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Commit the queued writes before the connection goes away
+    await write_queue.stop()
     app.mongodb_client.close()
 
+# Shared OpenAQ HTTP client (pooled connections reused by every route)
+@app.on_event("startup")
+async def startup_openaq_client():
+    await openaq_client.start_client()
+
+@app.on_event("shutdown")
+async def shutdown_openaq_client():
+    await openaq_client.close_client()
+
 # Constants
 OPENAQ_BASE_URL = "https://api.openaq.org/v2"
 CACHE_DURATION = timedelta(hours=1)  # Cache OpenAQ responses for 1 hour
@@ -77,48 +118,6 @@ async def is_cache_valid(last_fetched: Optional[datetime]) -> bool:
     
     return time_diff < CACHE_DURATION
 
-# Calculate distance between two points using Haversine formula
-def calculate_distance(lat1, lon1, lat2, lon2):
-    # Earth radius in kilometers
-    R = 6371.0
-    
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    
-    return R * c  # Distance in km
-
-# Filter locations by parameters
-def filter_by_parameters(location, parameters):
-    if not location.get('parameters') or not parameters:
-        return False
-    return any(param in location.get('parameters', []) for param in parameters)
-
-# Filter locations by radius
-def filter_by_radius(location, lat, lon, radius):
-    loc_lat = location.get('coordinates', {}).get('latitude')
-    loc_lon = location.get('coordinates', {}).get('longitude')
-    
-    if not loc_lat or not loc_lon:
-        return False
-        
-    distance = calculate_distance(lat, lon, loc_lat, loc_lon)
-    return distance <= radius
-
-# Filter locations by bounding box
-def filter_by_bbox(location, min_lat, min_lon, max_lat, max_lon):
-    loc_lat = location.get('coordinates', {}).get('latitude')
-    loc_lon = location.get('coordinates', {}).get('longitude')
-    
-    if not loc_lat or not loc_lon:
-        return False
-        
-    return (min_lat <= loc_lat <= max_lat) and (min_lon <= loc_lon <= max_lon)
-
 # Log API requests for debugging
 async def log_api_request(url, params, headers):
     logger.info(f"API Request: {url}")
@@ -128,7 +127,7 @@ async def log_api_request(url, params, headers):
 # New endpoint for advanced location filtering
 @app.get(
     "/api/locations",
-    response_model=List[Location],
+    response_model=read_models.LocationWithDistanceList,
     responses={
         400: {"model": ErrorResponse},
         404: {"model": ErrorResponse}
@@ -145,15 +144,22 @@ async def get_filtered_locations(
     max_lat: Optional[float] = Query(None, description="Maximum latitude for bounding box"),
     max_lon: Optional[float] = Query(None, description="Maximum longitude for bounding box"),
     parameters: Optional[str] = Query(None, description="Comma-separated list of parameters (e.g. pm25,o3)"),
+    all_parameters: bool = Query(False, description="Require every listed parameter instead of any of them"),
     has_recent: bool = Query(False, description="Only include locations with recent measurements"),
     exclude_unknown: bool = Query(False, description="Exclude locations with unknown names"),
     limit: int = Query(50, ge=1, le=1000, description="Maximum number of results"),
     page: int = Query(1, ge=1, description="Page number"),
-    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API")
+    cursor: Optional[str] = Query(None, description="Token of the next page (X-Next-Cursor header)"),
+    with_total: bool = Query(False, description="Return the number of matches in X-Total-Count"),
+    fields: Optional[str] = Query(None, description="summary, or comma-separated summary fields (e.g. id,name)"),
+    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API"),
+    request: Request = None,
+    response: Response = None
 ):
     """
     Fetch monitoring locations with advanced filtering options.
     Filter by city, country, coordinates (radius or bbox), parameters, etc.
+    Pages are chained with the X-Next-Cursor token; `page` still works.
     """
     try:
         # Parse parameters if provided
@@ -164,12 +170,9 @@ async def get_filtered_locations(
         # Build query
         query = {}
         
-        # City filter
+        # City filter (prefix seek on the normalized city/locality keys)
         if city:
-            query["$or"] = [
-                {"city": {"$regex": f".*{city}.*", "$options": "i"}},
-                {"locality": {"$regex": f".*{city}.*", "$options": "i"}}
-            ]
+            query.update(derived_fields.city_prefix_query(city))
             
         # Country filter    
         if country:
@@ -178,40 +181,78 @@ async def get_filtered_locations(
         # Exclude unknown locations
         if exclude_unknown:
             query["name"] = {"$ne": None, "$nin": ["", "Unknown", "unknown"]}
+
+        # Parameter filter (multikey index on the normalized pollutants)
+        if param_list:
+            query.update(derived_fields.pollutant_query(param_list, match_all=all_parameters))
             
         logger.info(f"MongoDB Query: {query}")
 
+        # Spatial filters run before pagination: in memory for plain map views,
+        # otherwise in MongoDB on the 2dsphere index
+        radius_search = latitude is not None and longitude is not None
+        bbox_search = min_lat is not None and min_lon is not None and max_lat is not None and max_lon is not None
+        in_memory = spatial_index.built and not query and (radius_search or bbox_search)
+        # Distance-ordered results page by offset, the others by a keyset on id
+        by_distance = in_memory or radius_search
+        offset = (page - 1) * limit
+        after = None
+        if cursor and by_distance:
+            offset = pagination.decode_offset(cursor)
+        elif cursor:
+            after = pagination.decode_cursor(cursor, "id")
+
+        # Slim summaries read through a projection (fields=...)
+        selected = read_models.parse_fields(fields)
+        projection = read_models.projection(selected) if selected else None
+
         # Check cache first
         cached_locations = []
+        next_page = None
+        total = None
         try:
-            # Use to_list to get all matching documents at once
-            cursor = app.mongodb.locations.find(query).skip((page - 1) * limit).limit(limit)
-            cached_docs = await cursor.to_list(length=limit)
+            cached_docs = []
+            if in_memory:
+                if radius_search:
+                    hits = spatial_index.within_radius(latitude, longitude, radius)
+                else:
+                    station_ids = spatial_index.within_bbox(min_lat, min_lon, max_lat, max_lon)
+                    hits = [(station_id, None) for station_id in station_ids]
+                total = len(hits)
+                cached_docs = await fetch_hits(app.mongodb.locations, hits[offset:offset + limit], projection)
+            elif radius_search:
+                # $geoNear: stations within the radius, nearest first, with their distance
+                pipeline = geo_queries.near_pipeline(
+                    query, latitude, longitude, radius, offset, limit, projection=projection
+                )
+                cached_docs = await app.mongodb.locations.aggregate(pipeline).to_list(length=limit)
+            else:
+                # $geoWithin for a bounding box (None when the box is empty)
+                bbox = {}
+                if bbox_search:
+                    bbox = geo_queries.bbox_query(min_lat, min_lon, max_lat, max_lon)
+                if bbox is not None:
+                    query.update(bbox)
+                    page_query = {"$and": [query, pagination.keyset_query("id", *after)]} if after else query
+                    db_cursor = app.mongodb.locations.find(page_query, projection).sort(pagination.sort_spec("id"))
+                    if not after:
+                        db_cursor = db_cursor.skip(offset)
+                    # Use to_list to get all matching documents at once
+                    db_cursor = db_cursor.limit(limit)
+                    cached_docs = await db_cursor.to_list(length=limit)
+                    next_page = pagination.next_cursor(cached_docs, limit, "id")
+                    if with_total:
+                        total = await pagination.count_cache.count(app.mongodb.locations, query)
+            if by_distance and len(cached_docs) == limit:
+                next_page = pagination.encode_offset(offset + limit)
             
             for loc in cached_docs:
                 try:
-                    # Convert to Location object
-                    location = Location(**loc)
-                    
-                    # Apply post-query filters
-                    skip = False
-                    
-                    # Filter by parameters
-                    if param_list and not filter_by_parameters(loc, param_list):
-                        skip = True
-                        
-                    # Filter by radius
-                    if latitude is not None and longitude is not None and not filter_by_radius(
-                            loc, latitude, longitude, radius):
-                        skip = True
-                        
-                    # Filter by bounding box
-                    if min_lat is not None and min_lon is not None and max_lat is not None and max_lon is not None:
-                        if not filter_by_bbox(loc, min_lat, min_lon, max_lat, max_lon):
-                            skip = True
-                    
-                    if not skip:
-                        cached_locations.append(location)
+                    # Convert to Location object (with its distance for radius searches)
+                    if selected:
+                        cached_locations.append(read_models.to_summary(loc))
+                    else:
+                        cached_locations.append(LocationWithDistance(**loc))
                         
                 except Exception as e:
                     logger.error(f"Error parsing cached location: {e}")
@@ -220,6 +261,10 @@ async def get_filtered_locations(
         except Exception as e:
             logger.error(f"Error querying cache: {e}")
 
+        if cursor and not cached_locations:
+            # Past the last page of a cursor walk
+            return []
+
         if cached_locations:
             logger.info(f"Found {len(cached_locations)} locations in cache")
 
@@ -233,17 +278,37 @@ async def get_filtered_locations(
             
             if any(cache_validity):
                 logger.info(f"Returning {len(cached_locations)} filtered locations from cache")
+                # The paging headers describe this page only, not the city fallback below
+                if response is not None:
+                    if next_page:
+                        response.headers["X-Next-Cursor"] = next_page
+                    if with_total and total is not None:
+                        response.headers["X-Total-Count"] = str(total)
+                # 304 when the client already has this page of the same data
+                last_fetched = stale_cache.newest(loc.last_fetched for loc in cached_locations)
+                unchanged = http_cache.validate(
+                    request, response, last_fetched, CACHE_DURATION,
+                    http_cache.query_variant(request), len(cached_locations)
+                )
+                if unchanged:
+                    return unchanged
+                if selected:
+                    return read_models.respond(cached_locations, selected, response)
+                if settings.FAST_JSON:
+                    return fast_json.respond(cached_locations, List[LocationWithDistance], response)
                 return cached_locations
 
         # If we need to fetch from OpenAQ API, we'll still use the city-based approach
         # since that's what the OpenAQ API supports best
         if city:
             # Get the existing implementation to handle the OpenAQ API call
-            return await get_locations_by_city(city, force_refresh)
+            return await get_locations_by_city(city, force_refresh, request=request, response=response, fields=fields)
             
         # If no city specified but cache is empty or invalid, return empty list
         return []
         
+    except (pagination.InvalidCursor, read_models.InvalidFields) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error in get_filtered_locations: {e}", exc_info=True)
         raise HTTPException(
@@ -254,7 +319,7 @@ async def get_filtered_locations(
 # Legacy endpoint for city-based locations
 @app.get(
     "/api/locations/{city}",
-    response_model=List[Location],
+    response_model=read_models.LocationList,
     responses={
         400: {"model": ErrorResponse},
         404: {"model": ErrorResponse}
@@ -262,7 +327,10 @@ async def get_filtered_locations(
 )
 async def get_locations_by_city(
     city: str,
-    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API")
+    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API"),
+    request: Request = None,
+    response: Response = None,
+    fields: Optional[str] = Query(None, description="summary, or comma-separated summary fields (e.g. id,name)")
 ):
     """
     Fetch monitoring locations for a given city from OpenAQ API,
@@ -272,21 +340,24 @@ async def get_locations_by_city(
         logger.info(f"=== Fetching locations for city: {city} ===")
         logger.info(f"Force refresh: {force_refresh}")
 
+        # Slim summaries read through a projection (fields=...)
+        selected = read_models.parse_fields(fields)
+
         # Check cache first
         cached_locations = []
         try:
             # Use to_list to get all matching documents at once
-            cursor = app.mongodb.locations.find({
-                "$or": [
-                    {"city": {"$regex": f"^{city}$", "$options": "i"}},
-                    {"locality": {"$regex": f"^{city}$", "$options": "i"}}
-                ]
-            })
-            cached_docs = await cursor.to_list(length=100)
+            # Exact match on the indexed, normalized city/locality keys
+            # (only the selected fields for summaries)
+            if selected:
+                cursor = app.mongodb.locations.find(derived_fields.city_query(city), read_models.projection(selected))
+            else:
+                cursor = app.mongodb.locations.find(derived_fields.city_query(city))
+            cached_docs = await cursor.to_list(length=settings.OPENAQ_LOCATIONS_MAX_RESULTS)
             
             for loc in cached_docs:
                 try:
-                    cached_locations.append(Location(**loc))
+                    cached_locations.append(read_models.to_summary(loc) if selected else Location(**loc))
                 except Exception as e:
                     logger.error(f"Error parsing cached location: {e}")
                     continue
@@ -297,144 +368,65 @@ async def get_locations_by_city(
         if cached_locations:
             logger.info(f"Found {len(cached_locations)} locations in cache")
 
-        # Return valid cache if available and not forcing refresh
+        # A refresh whose writes are still queued is newer than MongoDB
+        refresh_key = make_key("locations_by_city", city)
+        pending = pending_results.get(refresh_key)
+        if pending:
+            cached_locations = [read_models.to_summary(loc) for loc in pending] if selected else list(pending)
+
+        # Return cache if available and not forcing refresh; stale entries are
+        # served right away and refreshed in the background
         if not force_refresh and cached_locations:
-            # Check cache validity properly with async - collect results first
-            cache_validity = []
-            for loc in cached_locations:
-                is_valid = await is_cache_valid(loc.last_fetched)
-                cache_validity.append(is_valid)
-            
-            if any(cache_validity):
+            last_fetched = stale_cache.newest(loc.last_fetched for loc in cached_locations)
+            cache_status = stale_cache.classify(last_fetched, CACHE_DURATION)
+            if cache_status == stale_cache.STALE:
+                logger.info(f"Returning {len(cached_locations)} stale locations, refreshing in background")
+                upstream_flight.spawn(refresh_key, lambda: pending_results.track(
+                    refresh_key, lambda: _refresh_locations_by_city(city, [] if selected else cached_locations)
+                ))
+            elif cache_status == stale_cache.HIT:
                 logger.info(f"Returning {len(cached_locations)} locations from cache")
-                return cached_locations
-
-        # Fetch from OpenAQ API
-        async with httpx.AsyncClient() as client:
-            headers = {"accept": "application/json"}
-            params = {"limit": 100, "page": 1, "sort": "desc", "order_by": "lastUpdated"}
-
-            # Search by city using OpenAQ API
-            try:
-                params["city"] = city
-                
-                await log_api_request(f"{OPENAQ_BASE_URL}/locations", params, headers)
-                
-                response = await client.get(
-                    f"{OPENAQ_BASE_URL}/locations",
-                    headers=headers,
-                    params=params,
-                    timeout=20.0
+            if cache_status:
+                stale_cache.set_headers(response, cache_status, last_fetched)
+                # 304 when the client already has this version
+                unchanged = http_cache.validate(
+                    request, response, last_fetched, CACHE_DURATION, selected, len(cached_locations)
                 )
+                if unchanged:
+                    return unchanged
+                if selected:
+                    return read_models.respond(cached_locations, selected, response)
+                if settings.FAST_JSON:
+                    return fast_json.respond(cached_locations, List[Location], response)
+                return cached_locations
 
-                response.raise_for_status()
-                logger.info(f"OpenAQ Response Status: {response.status_code}")
-
-                # Process API response
-                if response.status_code == 200:
-                    data = response.json()
-                    api_locations = data.get("results", [])
-                    
-                    if not api_locations:
-                        logger.warning(f"OpenAQ API returned no locations for city: {city}")
-                        if cached_locations:
-                            # Return stale cache if no fresh data available
-                            logger.warning("Returning stale cache as fallback")
-                            return cached_locations
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"No locations found for city: {city}"
-                        )
-
-                    # Update MongoDB and process response
-                    processed_locations = []
-                    
-                    for loc_data in api_locations:
-                        # Skip locations without coordinates
-                        if "coordinates" not in loc_data or not loc_data["coordinates"]:
-                            continue
-                            
-                        # Add last_fetched timestamp
-                        loc_data["last_fetched"] = datetime.utcnow()
-                        
-                        # Get parameters for this location by fetching latest measurements
-                        try:
-                            params = {"location_id": loc_data["id"], "limit": 5}
-                            measurements_response = await client.get(
-                                f"{OPENAQ_BASE_URL}/latest/measurements",
-                                headers=headers,
-                                params=params
-                            )
-                            
-                            if measurements_response.status_code == 200:
-                                measurements_data = measurements_response.json()
-                                parameters = []
-                                
-                                for measurement in measurements_data.get("results", []):
-                                    param = measurement.get("parameter")
-                                    if param and param not in parameters:
-                                        parameters.append(param)
-                                
-                                loc_data["parameters"] = parameters
-                                loc_data["measurement_count"] = len(measurements_data.get("results", []))
-                                
-                                # Check if any measurements are from the last 24 hours
-                                loc_data["has_recent"] = False
-                                for m in measurements_data.get("results", []):
-                                    if m.get("date", {}).get("utc"):
-                                        utc_date_str = m["date"]["utc"]
-                                        try:
-                                            utc_date = datetime.fromisoformat(utc_date_str.replace("Z", "+00:00"))
-                                            if datetime.utcnow() - utc_date < timedelta(hours=24):
-                                                loc_data["has_recent"] = True
-                                                break
-                                        except Exception as e:
-                                            logger.error(f"Error parsing date: {e}")
-                                            continue
-                            
-                        except Exception as e:
-                            logger.error(f"Error fetching measurements for location {loc_data['id']}: {e}")
-                            loc_data["parameters"] = []
-                            loc_data["measurement_count"] = 0
-                            loc_data["has_recent"] = False
-                        
-                        # Create Location object for response
-                        try:
-                            location = Location(**loc_data)
-                            processed_locations.append(location)
-                            
-                            # Upsert to MongoDB
-                            await app.mongodb.locations.update_one(
-                                {"id": loc_data["id"]},
-                                {"$set": loc_data},
-                                upsert=True
-                            )
-                        except Exception as e:
-                            logger.error(f"Error processing location {loc_data.get('id')}: {e}")
-                    
-                    logger.info(f"Processed and saved {len(processed_locations)} locations")
-                    return processed_locations
-                else:
-                    # Return cache as fallback if API call fails
-                    if cached_locations:
-                        logger.warning(f"API returned status {response.status_code}, using cache as fallback")
-                        return cached_locations
-                    raise HTTPException(
-                        status_code=status.HTTP_502_BAD_GATEWAY,
-                        detail=f"OpenAQ API returned status {response.status_code}"
-                    )
-                    
-            except httpx.RequestError as e:
-                logger.error(f"HTTP Request error: {e}")
-                if cached_locations:
-                    # Return stale cache as fallback
-                    logger.warning(f"HTTP error: {str(e)}, using cache as fallback")
-                    return cached_locations
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail=f"Error connecting to OpenAQ API: {str(e)}"
+        # Fetch from OpenAQ API (concurrent misses for the same city share one refresh)
+        stale_cache.set_headers(response, stale_cache.MISS)
+        # Summaries are not valid fallbacks of the shared refresh, which a full
+        # request may join: callers fall back to their own cache instead
+        try:
+            locations = await upstream_flight.do(
+                refresh_key,
+                lambda: pending_results.track(
+                    refresh_key, lambda: _refresh_locations_by_city(city, [] if selected else cached_locations)
                 )
-                
+            )
+        except HTTPException:
+            if not cached_locations:
+                raise
+            locations = cached_locations
+        last_fetched = stale_cache.newest(loc.last_fetched for loc in locations)
+        unchanged = http_cache.validate(request, response, last_fetched, CACHE_DURATION, selected, len(locations))
+        if unchanged:
+            return unchanged
+        if selected:
+            return read_models.respond(locations, selected, response)
+        if settings.FAST_JSON:
+            return fast_json.respond(locations, List[Location], response)
+        return locations
+            
+    except read_models.InvalidFields as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except HTTPException:
         raise
         
@@ -445,6 +437,195 @@ async def get_locations_by_city(
             detail=f"Error fetching locations: {str(e)}"
         )
 
+# Fields set by _enrich_location, left untouched in MongoDB when it fails
+ENRICHMENT_FIELDS = ("parameters", "measurement_count", "has_recent", "pollutants")
+
+async def _enrich_location(loc_data: dict, headers: dict):
+    """
+    Add parameters, measurement_count and has_recent to an OpenAQ location
+    from its latest measurements. Raises when the API call fails; the
+    OPENAQ_ENRICH_TIMEOUT applies to the call, not to the rate limiter wait.
+    """
+    params = {"location_id": loc_data["id"], "limit": 5}
+    measurements_response = await openaq_client.get(
+        f"{OPENAQ_BASE_URL}/latest/measurements",
+        headers=headers,
+        params=params,
+        attempt_timeout=settings.OPENAQ_ENRICH_TIMEOUT
+    )
+    
+    if measurements_response.status_code != 200:
+        raise httpx.HTTPStatusError(
+            f"OpenAQ API returned status {measurements_response.status_code}",
+            request=measurements_response.request,
+            response=measurements_response
+        )
+    
+    measurements_data = measurements_response.json()
+    parameters = []
+    
+    for measurement in measurements_data.get("results", []):
+        param = measurement.get("parameter")
+        if param and param not in parameters:
+            parameters.append(param)
+    
+    loc_data["parameters"] = parameters
+    loc_data["measurement_count"] = len(measurements_data.get("results", []))
+    
+    # Check if any measurements are from the last 24 hours
+    loc_data["has_recent"] = False
+    for m in measurements_data.get("results", []):
+        if m.get("date", {}).get("utc"):
+            utc_date_str = m["date"]["utc"]
+            try:
+                utc_date = datetime.fromisoformat(utc_date_str.replace("Z", "+00:00")).replace(tzinfo=None)
+                if datetime.utcnow() - utc_date < timedelta(hours=24):
+                    loc_data["has_recent"] = True
+                    break
+            except Exception as e:
+                logger.error(f"Error parsing date: {e}")
+                continue
+
+async def _prune_city(city: str, station_ids: List[int]):
+    """
+    Delete the stored locations of a city that a complete refresh (not cut
+    short by an error or OPENAQ_LOCATIONS_MAX_RESULTS) no longer lists, and
+    stop suggesting them. Queued after the refresh's upserts.
+    """
+    await write_queue.enqueue(
+        app.mongodb.locations,
+        [DeleteMany(derived_fields.stale_city_query(city, station_ids))],
+        label="stale locations"
+    )
+    suggest_index.prune_city(city, station_ids)
+
+async def _refresh_locations_by_city(city: str, cached_locations: List[Location]) -> List[Location]:
+    """
+    Fetch the locations of a city from OpenAQ and upsert them in MongoDB.
+    Runs once per city at a time through `upstream_flight`.
+    """
+    # Fetch from OpenAQ API
+    headers = {"accept": "application/json"}
+    params = {"sort": "desc", "order_by": "lastUpdated"}
+
+    # Search by city using OpenAQ API
+    try:
+        params["city"] = city
+        
+        await log_api_request(f"{OPENAQ_BASE_URL}/locations", params, headers)
+        
+        processed_locations = []
+        failed_enrichments = 0
+        results_count = 0
+        cached_by_id = {loc.id: loc for loc in cached_locations}
+        station_ids = []  # Every station OpenAQ listed, with coordinates or not
+        complete = False
+        
+        # Stream the result pages: the next page is prefetched while this one is enriched and written
+        async for page in openaq_client.iter_pages(
+            f"{OPENAQ_BASE_URL}/locations",
+            params=params,
+            headers=headers,
+            max_results=settings.OPENAQ_LOCATIONS_MAX_RESULTS
+        ):
+            results_count += len(page.results)
+            station_ids += [loc.get("id") for loc in page.results]
+            complete = page.complete
+            logger.info(f"OpenAQ page {page.number}: {page.fetched} of {page.found} locations found")
+            
+            # Only keep locations with coordinates
+            api_locations = [loc for loc in page.results if loc.get("coordinates")]
+            
+            # Get parameters for each location from its latest measurements (bounded concurrent fan-out)
+            outcomes = await gather_bounded(
+                api_locations,
+                lambda loc_data: _enrich_location(loc_data, headers),
+                limit=settings.OPENAQ_ENRICH_CONCURRENCY
+            )
+            
+            # Update MongoDB and process response
+            operations = []
+            for loc_data, outcome in zip(api_locations, outcomes):
+                # Add last_fetched timestamp
+                loc_data["last_fetched"] = datetime.utcnow()
+                document = {
+                    **loc_data,
+                    **derive_location_fields(loc_data),
+                    **derive_pollutants(loc_data),
+                    **geo_queries.geo_fields(loc_data)
+                }
+                
+                if isinstance(outcome, BaseException):
+                    failed_enrichments += 1
+                    logger.error(f"Error fetching measurements for location {loc_data['id']}: {outcome!r}")
+                    # Keep the stored enrichment rather than overwriting it with empty values
+                    for field in ENRICHMENT_FIELDS:
+                        document.pop(field, None)
+                    previous = cached_by_id.get(loc_data["id"])
+                    loc_data["parameters"] = previous.parameters if previous else []
+                    loc_data["measurement_count"] = previous.measurement_count if previous else 0
+                
+                # Create Location object for response
+                try:
+                    location = Location(**loc_data)
+                    processed_locations.append(location)
+                    
+                    # Queue the MongoDB upsert, written with the rest of the page below
+                    operations.append(persistence.upsert_op({"id": loc_data["id"]}, document))
+                    suggest_index.add_location(loc_data)
+                    spatial_index.add_location(loc_data)
+                except Exception as e:
+                    logger.error(f"Error processing location {loc_data.get('id')}: {e}")
+
+            # Hand the page to the write-behind queue (one unordered bulk write per batch)
+            await write_queue.enqueue(app.mongodb.locations, operations, label="locations")
+        
+        if not results_count:
+            logger.warning(f"OpenAQ API returned no locations for city: {city}")
+            if cached_locations:
+                # Return stale cache if no fresh data available
+                logger.warning("Returning stale cache as fallback")
+                return cached_locations
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No locations found for city: {city}"
+            )
+        
+        if failed_enrichments:
+            logger.warning(f"Enrichment failed for {failed_enrichments}/{results_count} locations")
+        logger.info(f"Processed and saved {len(processed_locations)} locations")
+        if complete and processed_locations:
+            await _prune_city(city, station_ids)
+        return processed_locations
+            
+    except httpx.HTTPStatusError as e:
+        # Return cache as fallback if API call fails
+        if cached_locations:
+            logger.warning(f"API returned status {e.response.status_code}, using cache as fallback")
+            return cached_locations
+        if e.response.status_code == 429:
+            retry_after = rate_limiter.retry_after_seconds(e.response.headers) or 60
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OpenAQ rate limit reached, please retry later",
+                headers={"Retry-After": str(ceil(retry_after))}
+            )
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"OpenAQ API returned status {e.response.status_code}"
+        )
+            
+    except httpx.RequestError as e:
+        logger.error(f"HTTP Request error: {e}")
+        if cached_locations:
+            # Return stale cache as fallback
+            logger.warning(f"HTTP error: {str(e)}, using cache as fallback")
+            return cached_locations
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Error connecting to OpenAQ API: {str(e)}"
+        )
+
 # Endpoint pour les suggestions de villes (autocomplete)
 @app.get(
     "/api/cities/suggest",
@@ -462,9 +643,13 @@ async def get_city_suggestions(
     Returns a list of city names matching the query string.
     """
     try:
-        # Recherche dans MongoDB avec regex insensible à la casse
+        # Index en mémoire (préfixe + trigrammes), sans aller-retour MongoDB
+        if suggest_index.built:
+            return suggest_index.suggest(q, limit=10)
+
+        # Recherche par préfixe sur les clés normalisées (index, sans casse ni accents)
         cursor = app.mongodb.locations.aggregate([
-            {"$match": {"city": {"$regex": f".*{q}.*", "$options": "i"}}},
+            {"$match": {"city_key": derived_fields.prefix_pattern(q)}},
             {"$group": {"_id": {"city": "$city"}}},
             {"$project": {"_id": 0, "city": "$_id.city"}},
             {"$match": {"city": {"$ne": None, "$nin": ["", "Unknown", "unknown"]}}},
@@ -478,7 +663,7 @@ async def get_city_suggestions(
         # Si on a peu de résultats, compléter avec les localités
         if len(result) < 5:
             cursor = app.mongodb.locations.aggregate([
-                {"$match": {"locality": {"$regex": f".*{q}.*", "$options": "i"}}},
+                {"$match": {"locality_key": derived_fields.prefix_pattern(q)}},
                 {"$group": {"_id": {"locality": "$locality"}}},
                 {"$project": {"_id": 0, "locality": "$_id.locality"}},
                 {"$match": {"locality": {"$ne": None, "$nin": ["", "Unknown", "unknown"]}}},
@@ -505,3 +690,38 @@ async def get_city_suggestions(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fetching city suggestions: {str(e)}"
         )
+
+
+# Stations les plus proches d'un point (vues cartographiques)
+@app.get(
+    "/api/stations/nearest",
+    response_model=List[LocationWithDistance],
+    responses={
+        400: {"model": ErrorResponse}
+    }
+)
+async def get_nearest_stations(
+    latitude: float = Query(..., ge=-90, le=90, description="Latitude of the point"),
+    longitude: float = Query(..., ge=-180, le=180, description="Longitude of the point"),
+    limit: int = Query(10, ge=1, le=100, description="Number of stations"),
+    max_distance: Optional[float] = Query(None, gt=0, description="Maximum distance in kilometers")
+):
+    """
+    Return the `limit` stations closest to a point, nearest first, with
+    their distance in kilometers.
+    """
+    try:
+        if spatial_index.built:
+            hits = spatial_index.nearest(latitude, longitude, limit, max_distance)
+            docs = await fetch_hits(app.mongodb.locations, hits)
+        else:
+            pipeline = geo_queries.near_pipeline({}, latitude, longitude, max_distance, limit=limit)
+            docs = await app.mongodb.locations.aggregate(pipeline).to_list(length=limit)
+        return [LocationWithDistance(**doc) for doc in docs]
+
+    except Exception as e:
+        logger.error(f"Error in get_nearest_stations: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching nearest stations: {str(e)}"
+        )
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the measurement serialization paths.
+
+Usage:
+    python bench_serialization.py [--count 1000] [--repeat 20]
+
+"default" reproduces what a route returning models with a response_model
+costs: one model per document, FastAPI's dump + second validation +
+serialization, then json.dumps. "fast" is the FAST_JSON path: one
+TypeAdapter validation of the documents and a single Rust dump_json.
+Times are per `--count` measurements (best of `--repeat` runs).
+"""
+from datetime import datetime, timedelta
+from typing import List
+import argparse
+import json
+import sys
+import timeit
+
+from bson import ObjectId
+
+import fast_json
+from models import Measurement
+
+
+def make_documents(count: int) -> List[dict]:
+    """Measurement documents shaped like the ones stored in MongoDB."""
+    now = datetime.utcnow()
+    parameters = ["pm25", "pm10", "no2", "o3", "so2", "co"]
+    return [
+        {
+            "_id": ObjectId(),
+            "location": "Paris Centre",
+            "location_id": 4153,
+            "parameter": parameters[i % len(parameters)],
+            "value": 10.0 + (i % 97) / 7,
+            "unit": "µg/m³",
+            "date": now - timedelta(minutes=10 * i),
+            "coordinates": {"latitude": 48.8566, "longitude": 2.3522},
+            "country": {"id": 22, "code": "FR", "name": "France"},
+            "city": "Paris",
+            "last_fetched": now,
+            "is_demo": False
+        }
+        for i in range(count)
+    ]
+
+
+def default_path(docs: List[dict]) -> bytes:
+    adapter = fast_json.adapter(List[Measurement])
+    models = [Measurement(**doc) for doc in docs]  # Route
+    content = [m.model_dump() for m in models]  # FastAPI: prepare response content
+    value = adapter.validate_python(content)  # FastAPI: response_model validation
+    data = adapter.dump_python(value, mode="json")  # FastAPI: serialize
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()  # JSONResponse
+
+
+def fast_path(docs: List[dict]) -> bytes:
+    models = fast_json.from_documents(Measurement, docs)
+    return fast_json.adapter(List[Measurement]).dump_json(models)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark measurement serialization")
+    parser.add_argument("--count", type=int, default=1000, help="Measurements per response")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    docs = make_documents(args.count)
+    if json.loads(default_path(docs)) != json.loads(fast_path(docs)):
+        print("The two paths produce different JSON")
+        return 1
+
+    results = {}
+    for name, path in (("default", default_path), ("fast", fast_path)):
+        runs = timeit.repeat(lambda: path(docs), number=1, repeat=args.repeat)
+        results[name] = min(runs)
+        print(f"{name:>8}: {results[name] * 1000:8.2f} ms per {args.count} measurements")
+    print(f" speedup: {results['default'] / results['fast']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Response compression (gzip, or brotli when the optional package is installed).
+
+CompressionMiddleware is a plain ASGI middleware. It picks an encoding from
+the request's Accept-Encoding, and compresses complete response bodies of a
+textual type (JSON...) of at least COMPRESSION_MIN_SIZE bytes. Streaming
+responses (several body messages) are sent unchanged.
+
+Compressed bodies are kept in a small LRU (CompressedCache) keyed by the
+encoding and a digest of the uncompressed body. A cached location list or
+measurement response asked for again before its data is refreshed has the
+same body, so it is not compressed again; a refresh changes the body, and
+so the key. Hashing a body costs a fraction of compressing it.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import gzip
+import hashlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+GZIP = "gzip"
+BROTLI = "br"
+
+_COMPRESSIBLE_TYPES = {"application/json", "application/javascript", "application/xml"}
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported encoding of an Accept-Encoding header (brotli wins ties), or None."""
+    if not accept_encoding:
+        return None
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    best, best_quality = None, 0.0
+    for coding in ([BROTLI] if brotli is not None else []) + [GZIP]:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def request_encoding(headers: Headers) -> Optional[str]:
+    """Encoding the middleware uses for a request's responses (None when disabled or not accepted)."""
+    if not settings.COMPRESSION_ENABLED:
+        return None
+    return choose_encoding(headers.get("accept-encoding"))
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    """Whether a content type is worth compressing (text, JSON, XML)."""
+    if not content_type:
+        return False
+    media = content_type.split(";")[0].strip().lower()
+    return (
+        media.startswith("text/") or media in _COMPRESSIBLE_TYPES
+        or media.endswith("+json") or media.endswith("+xml")
+    )
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0: the same body always gives the same bytes
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressedCache:
+    """LRU of compressed bodies, bounded by their total size."""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else settings.COMPRESSION_CACHE_MAX_BYTES
+        self._bodies: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, body: bytes, encoding: str) -> bytes:
+        """`body` compressed with `encoding`, compressing it only on a miss."""
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        compressed = self._bodies.get(key)
+        if compressed is not None:
+            self._bodies.move_to_end(key)
+            self.hits += 1
+            return compressed
+        self.misses += 1
+        compressed = compress(body, encoding)
+        if len(compressed) <= self.max_bytes:
+            self._bodies[key] = compressed
+            self._size += len(compressed)
+            while self._size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
+        return compressed
+
+    def clear(self):
+        self._bodies.clear()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+
+# Process-wide cache shared by the middleware of each app
+compressed_cache = CompressedCache()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing eligible responses, see the module docstring."""
+
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None,
+                 cache: Optional[CompressedCache] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache if cache is not None else compressed_cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = request_encoding(Headers(scope=scope)) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        minimum_size = self.minimum_size if self.minimum_size is not None else settings.COMPRESSION_MIN_SIZE
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            status_code = start["status"]
+            eligible = (
+                not message.get("more_body", False)
+                and 200 <= status_code and status_code not in (204, 304)
+                and "content-encoding" not in headers
+                and compressible(headers.get("content-type"))
+                and len(body) >= minimum_size
+            )
+            if eligible:
+                compressed = self.cache.get(body, encoding)
+                if len(compressed) < len(body):
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(compressed))
+                    if "accept-encoding" not in headers.get("vary", "").lower():
+                        headers.add_vary_header("Accept-Encoding")
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+            passthrough = True
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -5,6 +5,75 @@ class Settings(BaseSettings):
     DB_NAME: str = "air_quality_db"
     OPENAQ_API_KEY: str = "6d342f2ec6b4f692d2c76effff5439f971b983830060e7d8a6c51097927d83c9"
 
+    # Shared OpenAQ HTTP client (connection pool, keep-alive, timeouts)
+    OPENAQ_MAX_CONNECTIONS: int = 20
+    OPENAQ_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    OPENAQ_KEEPALIVE_EXPIRY: float = 30.0
+    OPENAQ_HTTP2: bool = False  # Requires the optional "h2" package
+    OPENAQ_CONNECT_TIMEOUT: float = 5.0
+    OPENAQ_TIMEOUT: float = 10.0
+    OPENAQ_LOCATIONS_TIMEOUT: float = 20.0
+    OPENAQ_MEASUREMENTS_TIMEOUT: float = 10.0
+    OPENAQ_LATEST_TIMEOUT: float = 10.0
+
+    # Paginated ingestion of OpenAQ results
+    OPENAQ_PAGE_SIZE: int = 100
+    OPENAQ_PAGINATION_MAX_RESULTS: int = 1000
+    OPENAQ_LOCATIONS_MAX_RESULTS: int = 1000
+
+    # Hedged probing of measurement parameter formats when none is learned yet
+    OPENAQ_HEDGE_FORMATS: bool = True
+    OPENAQ_HEDGE_STAGGER: float = 0.25  # Seconds before starting the next candidate
+    OPENAQ_HEDGE_MAX_IN_FLIGHT: int = 2
+
+    # Per-location enrichment of city refreshes (/latest/measurements fan-out)
+    OPENAQ_ENRICH_CONCURRENCY: int = 10
+    OPENAQ_ENRICH_TIMEOUT: float = 5.0
+
+    # Cache of station-existence checks (negative results expire sooner)
+    STATION_CHECK_TTL_HOURS: float = 24.0
+    STATION_CHECK_NEGATIVE_TTL_HOURS: float = 6.0
+
+    # Measurement storage: "document" (one document per reading), "timeseries"
+    # (native MongoDB 5.0+ time-series collection, see migrate_measurements.py)
+    # or "bucket" (one document per station, parameter and day)
+    MEASUREMENTS_STORAGE: str = "document"
+
+    # Batched MongoDB writes (operations per bulk_write call)
+    MONGO_BULK_BATCH_SIZE: int = 500
+
+    # Write-behind queue committing MongoDB writes in the background
+    WRITE_BEHIND_MAX_QUEUE: int = 10000  # Operations; enqueue waits when full
+    WRITE_BEHIND_BATCH_SIZE: int = 500
+    WRITE_BEHIND_FLUSH_INTERVAL: float = 0.2  # Seconds to gather a micro-batch
+    WRITE_BEHIND_SHUTDOWN_TIMEOUT: float = 10.0
+
+    # Stale cache entries are served immediately while refreshed in the background
+    STALE_WHILE_REVALIDATE: bool = True
+    CACHE_MAX_STALENESS_HOURS: float = 24.0
+
+    # Process-wide OpenAQ rate limiter and retries
+    OPENAQ_RATE_LIMIT_PER_MINUTE: float = 60.0
+    OPENAQ_RATE_LIMIT_BURST: int = 10
+    OPENAQ_RATE_LIMIT_STATE_FILE: str = ""  # Shared by worker processes when set (needs fcntl)
+    OPENAQ_MAX_RETRIES: int = 3
+    OPENAQ_BACKOFF_BASE: float = 0.5
+    OPENAQ_BACKOFF_MAX: float = 30.0
+
+    # Totals of filtered location lists are cached this long (seconds)
+    PAGINATION_COUNT_TTL_SECONDS: float = 60.0
+
+    # Serialize the hot routes once with pydantic/orjson, without FastAPI's
+    # second validation pass (see fast_json.py and bench_serialization.py)
+    FAST_JSON: bool = False
+
+    # Compression of responses (gzip, or brotli with the optional "brotli" package)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # Bytes; smaller bodies are sent as is
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    COMPRESSION_CACHE_MAX_BYTES: int = 16 * 1024 * 1024  # Already-compressed hot bodies
+
     class Config:
         env_file = ".env"
 
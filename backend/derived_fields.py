@@ -0,0 +1,127 @@
+"""
+Normalized search keys of locations.
+
+Every location written to MongoDB carries `city_key`, `locality_key` and
+`name_key`: the lower-cased, accent-folded form of its city, locality and
+name. They are indexed, so lookups are exact matches or anchored prefix
+regexes on the key (index seeks) instead of case-insensitive regexes that
+scan the whole collection. User input is normalized the same way and
+regex-escaped.
+
+Locations also carry `pollutants`, the normalized names of the parameters
+they measure (`pm25`, `no2`...) whatever shape OpenAQ gave them in, under a
+multikey index: the `parameters=` filter is an `$in`/`$all` on it.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import re
+import unicodedata
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+KEY_FIELDS = {"city": "city_key", "locality": "locality_key", "name": "name_key"}
+
+
+def normalize(text: Optional[str]) -> Optional[str]:
+    """Lower-case, accent-fold and collapse the whitespace of `text`."""
+    if text is None:
+        return None
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(folded.casefold().split())
+
+
+def derive_location_fields(doc: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """Search keys of a location document."""
+    return {key: normalize(doc.get(field)) for field, key in KEY_FIELDS.items()}
+
+
+def normalize_parameter(name: Optional[str]) -> Optional[str]:
+    """Pollutant key of a parameter name ("PM2.5", "pm2.5" and "pm25" give "pm25")."""
+    key = normalize(name)
+    if not key:
+        return None
+    return re.sub(r"[^a-z0-9]", "", key) or None
+
+
+def _parameter_name(parameter: Any) -> Optional[str]:
+    """Name of a parameter given as "pm25", {"parameter": "pm25"} or {"parameter": {"name": "pm25"}}."""
+    if isinstance(parameter, dict):
+        parameter = parameter.get("parameter") or parameter.get("name")
+        if isinstance(parameter, dict):
+            parameter = parameter.get("name")
+    return parameter if isinstance(parameter, str) else None
+
+
+def pollutant_keys(parameters: Optional[Iterable[Any]]) -> List[str]:
+    """Distinct pollutant keys of a location's parameters, in order."""
+    keys = []
+    for parameter in parameters or []:
+        key = normalize_parameter(_parameter_name(parameter))
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def derive_pollutants(doc: Dict[str, Any]) -> Dict[str, List[str]]:
+    return {"pollutants": pollutant_keys(doc.get("parameters"))}
+
+
+def pollutant_query(parameters: Iterable[str], match_all: bool = False) -> Dict[str, Any]:
+    """Locations measuring any (or all) of `parameters`."""
+    keys = [key for key in (normalize_parameter(p) for p in parameters) if key]
+    return {"pollutants": {"$all" if match_all else "$in": keys}}
+
+
+def prefix_pattern(text: str) -> Dict[str, str]:
+    """Anchored, escaped prefix regex on a normalized key (uses its index)."""
+    return {"$regex": f"^{re.escape(normalize(text))}"}
+
+
+def city_query(city: str) -> Dict[str, Any]:
+    """Locations whose city or locality is exactly `city` (ignoring case and accents)."""
+    key = normalize(city)
+    return {"$or": [{"city_key": key}, {"locality_key": key}]}
+
+
+def stale_city_query(city: str, station_ids: Iterable[Any]) -> Dict[str, Any]:
+    """Locations of `city` other than `station_ids` (those a complete refresh no longer returns)."""
+    return {**city_query(city), "id": {"$nin": list(station_ids)}}
+
+
+def city_prefix_query(city: str) -> Dict[str, Any]:
+    """Locations whose city or locality starts with `city`."""
+    pattern = prefix_pattern(city)
+    return {"$or": [{"city_key": pattern}, {"locality_key": dict(pattern)}]}
+
+
+async def ensure_indexes(db):
+    for key in KEY_FIELDS.values():
+        await db.locations.create_index(key)
+    # Multikey index: one entry per pollutant of each location
+    await db.locations.create_index("pollutants")
+
+
+async def backfill(db, batch_size: int = 500) -> int:
+    """Add the search keys and pollutants to locations stored before they existed."""
+    cursor = db.locations.find(
+        {"$or": [{"city_key": {"$exists": False}}, {"pollutants": {"$exists": False}}]},
+        {**{field: 1 for field in KEY_FIELDS}, "parameters": 1}
+    )
+    operations = []
+    updated = 0
+    async for doc in cursor:
+        fields = {**derive_location_fields(doc), **derive_pollutants(doc)}
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(operations) >= batch_size:
+            await db.locations.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await db.locations.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    if updated:
+        logger.info(f"Added search keys to {updated} locations")
+    return updated
@@ -0,0 +1,98 @@
+"""
+Fast JSON responses (FAST_JSON setting).
+
+The routes build their models by hand and declare a `response_model`, so
+FastAPI validates everything a second time, converts it with
+jsonable_encoder and serializes it with json.dumps. With FAST_JSON the hot
+routes return a FastJSONResponse instead: models are serialized once, in
+pydantic's Rust serializer (TypeAdapter.dump_json), without being validated
+again. Trusted MongoDB documents are turned into models by one TypeAdapter
+validate_python() call for the whole list instead of one constructor per
+document. Plain content goes through orjson when it is installed.
+
+See bench_serialization.py for the cost of both paths.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type
+import json
+import logging
+
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+try:
+    import orjson
+except ImportError:  # Optional: stdlib json fallback
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON of plain content (dicts, lists, models, datetimes)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendering with orjson; already serialized bytes are sent as is."""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def adapter(tp: Any) -> TypeAdapter:
+    """TypeAdapter of a type, built once (its validator and serializer are compiled)."""
+    return TypeAdapter(tp)
+
+
+def from_documents(model: Type[BaseModel], docs: List[Dict[str, Any]]) -> List[BaseModel]:
+    """
+    Models of trusted MongoDB documents in one validation call. Falls back
+    to one document at a time, skipping the invalid ones, when any fails.
+    """
+    try:
+        return adapter(List[model]).validate_python(docs)
+    except ValidationError:
+        models = []
+        for doc in docs:
+            try:
+                models.append(model.model_validate(doc))
+            except ValidationError as e:
+                logger.error(f"Skipping invalid {model.__name__} document: {e}")
+        return models
+
+
+def respond(content: Any, tp: Any = None, response: Optional[Response] = None,
+            status_code: int = 200) -> FastJSONResponse:
+    """
+    Serialize `content` once (as `tp`, or as its own model type) and wrap it
+    in a response keeping the headers already set on `response`.
+    """
+    if tp is not None:
+        body = adapter(tp).dump_json(content)
+    elif isinstance(content, BaseModel):
+        body = content.model_dump_json().encode()
+    else:
+        body = dumps(content)
+    headers = {}
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return FastJSONResponse(content=body, status_code=status_code, headers=headers)
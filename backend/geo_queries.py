@@ -0,0 +1,121 @@
+"""
+Geospatial queries on stored locations.
+
+Every location written to MongoDB carries a GeoJSON point in `geo`
+(longitude first, as GeoJSON requires) covered by a 2dsphere index. Radius
+searches run as a `$geoNear` aggregation, which filters and sorts by
+distance in the index and returns the distance of each station. Bounding
+boxes are `$geoWithin: {$box}` queries on the point's coordinate pair,
+covered by a `2d` index: the box is planar (edges along parallels and
+meridians), like the in-memory spatial index, whereas the edges of a
+GeoJSON polygon are geodesics that bow towards the pole on wide boxes.
+Pagination is applied after the spatial filter, so pages are always full.
+"""
+from typing import Any, Dict, List, Optional
+import logging
+
+from pymongo import GEO2D, GEOSPHERE, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+GEO_FIELD = "geo"
+POINT_FIELD = "geo.coordinates"  # [longitude, latitude], a legacy coordinate pair for the 2d index
+DISTANCE_FIELD = "distance"  # Kilometers, added by near_pipeline()
+
+
+def geo_point(latitude: float, longitude: float) -> Dict[str, Any]:
+    return {"type": "Point", "coordinates": [float(longitude), float(latitude)]}
+
+
+def geo_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The `geo` field of a location document, or nothing when its coordinates
+    are missing or out of range (the 2dsphere index would reject the write).
+    """
+    coordinates = doc.get("coordinates") or {}
+    latitude, longitude = coordinates.get("latitude"), coordinates.get("longitude")
+    if latitude is None or longitude is None:
+        return {}
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return {}
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return {}
+    return {GEO_FIELD: geo_point(latitude, longitude)}
+
+
+def near_pipeline(query: Dict[str, Any], latitude: float, longitude: float, radius_km: Optional[float],
+                  skip: int = 0, limit: int = 50,
+                  projection: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    Aggregation returning the locations matching `query` within `radius_km`
+    (anywhere if None), nearest first, with their distance in km in `distance`.
+    `projection` limits the fields returned (the distance is always kept).
+    """
+    near = {
+        "near": geo_point(latitude, longitude),
+        "key": GEO_FIELD,
+        "distanceField": DISTANCE_FIELD,
+        "distanceMultiplier": 0.001,  # Report kilometers
+        "spherical": True,
+        "query": query
+    }
+    if radius_km is not None:
+        near["maxDistance"] = radius_km * 1000  # Meters for GeoJSON points
+    pipeline = [{"$geoNear": near}]
+    if skip:
+        pipeline.append({"$skip": skip})
+    pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": {**projection, DISTANCE_FIELD: 1}})
+    return pipeline
+
+
+def bbox_query(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Optional[Dict[str, Any]]:
+    """
+    Planar `$geoWithin: {$box}` filter for a bounding box, None if the box
+    is empty. A box crossing the antimeridian (min_lon > max_lon) covers all
+    longitudes and excludes the ones between max_lon and min_lon.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    west, east = max(min_lon, -180.0), min(max_lon, 180.0)
+    if min_lat >= max_lat or west == east:
+        return None
+    if west < east:
+        return {POINT_FIELD: {"$geoWithin": {"$box": [[west, min_lat], [east, max_lat]]}}}
+    return {
+        POINT_FIELD: {"$geoWithin": {"$box": [[-180.0, min_lat], [180.0, max_lat]]}},
+        f"{POINT_FIELD}.0": {"$not": {"$gt": east, "$lt": west}}
+    }
+
+
+async def ensure_index(db):
+    await db.locations.create_index([(GEO_FIELD, GEOSPHERE)])
+    # The default 2d bounds exclude longitude 180, which geo_fields() accepts
+    await db.locations.create_index([(POINT_FIELD, GEO2D)], min=-180.0, max=180.000001)
+
+
+async def backfill(db, batch_size: int = 500) -> int:
+    """Add the `geo` point to locations stored before it existed."""
+    cursor = db.locations.find(
+        {GEO_FIELD: {"$exists": False}, "coordinates": {"$exists": True}},
+        {"coordinates": 1}
+    )
+    operations = []
+    updated = 0
+    async for doc in cursor:
+        fields = geo_fields(doc)
+        if not fields:
+            continue
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(operations) >= batch_size:
+            await db.locations.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await db.locations.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    if updated:
+        logger.info(f"Added GeoJSON points to {updated} locations")
+    return updated
@@ -0,0 +1,74 @@
+"""
+Hedged requests: race several candidate upstream calls.
+
+Attempts are started one after another with a small stagger (or as soon
+as a previous attempt fails), at most `max_in_flight` at a time. The first
+attempt returning a usable result wins and the others are cancelled.
+"""
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def race(
+    attempts: List[Callable[[], Awaitable[Any]]],
+    stagger: float = 0.25,
+    max_in_flight: int = 2
+) -> Tuple[Optional[int], Any]:
+    """
+    Run `attempts` as hedged requests.
+
+    Each attempt returns a result, or a falsy value / raises when it is not
+    usable. Returns (index, result) of the first usable result, or
+    (None, None) when every attempt failed.
+    """
+    max_in_flight = max(1, max_in_flight)
+    pending = {}
+    next_index = 0
+
+    def launch() -> bool:
+        nonlocal next_index
+        if next_index >= len(attempts):
+            return False
+        task = asyncio.ensure_future(attempts[next_index]())
+        pending[task] = next_index
+        next_index += 1
+        return True
+
+    try:
+        launch()
+        while pending:
+            can_hedge = len(pending) < max_in_flight and next_index < len(attempts)
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=stagger if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                # Nothing back within the stagger delay: hedge with the next attempt
+                launch()
+                continue
+
+            for task in done:
+                index = pending.pop(task)
+                if task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    logger.debug(f"Hedged attempt {index} failed: {task.exception()}")
+                    continue
+                if task.result():
+                    return index, task.result()
+
+            # A failed attempt frees its slot: start the next one without waiting
+            if len(pending) < max_in_flight:
+                launch()
+
+        return None, None
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,112 @@
+"""
+HTTP validators for the cached read endpoints.
+
+A cached response is versioned by the `last_fetched` of the data it was
+built from (the newest one for a list), its number of items and the
+representation asked for (fields=, Accept). From that version the routes
+send a strong ETag, Last-Modified (the `last_fetched`) and
+Cache-Control: max-age with what remains of the cache TTL. A poll repeating
+the ETag in If-None-Match (or the date in If-Modified-Since) before the
+data is refreshed gets an empty 304 Not Modified instead of the body.
+
+The content coding CompressionMiddleware negotiates for the request (gzip,
+br or none) is part of the version: each encoding of the body gets its own
+strong ETag, as RFC 9110 requires for different byte representations.
+"""
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+import hashlib
+
+from fastapi import Request, Response
+
+import compression
+
+
+def etag(*parts: Any) -> str:
+    """Strong ETag of a data version (quoted, as sent in the header)."""
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def http_date(value: datetime) -> str:
+    """HTTP date of a naive UTC datetime, e.g. 'Wed, 02 Oct 2024 10:00:00 GMT'."""
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    """Naive UTC datetime of an HTTP date header, None when missing or invalid."""
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def max_age(last_fetched: datetime, ttl: timedelta) -> int:
+    """Seconds left before data fetched at `last_fetched` expires (0 once stale)."""
+    remaining = ttl - (datetime.utcnow() - last_fetched)
+    return max(0, int(remaining.total_seconds()))
+
+
+def query_variant(request: Optional[Request]) -> Any:
+    """The query string of a request (filters, page, cursor...) as an ETag part."""
+    if not isinstance(request, Request):
+        return None
+    return sorted(request.query_params.multi_items())
+
+
+def _etag_matches(if_none_match: str, tag: str) -> bool:
+    """If-None-Match comparison (weak, as required for GET)."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == tag:
+            return True
+    return False
+
+
+def not_modified(request: Optional[Request], tag: str, last_modified: datetime) -> bool:
+    """Whether the conditional headers of `request` already match this version."""
+    if not isinstance(request, Request):
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return _etag_matches(if_none_match, tag)
+    since = parse_http_date(request.headers.get("if-modified-since"))
+    return since is not None and last_modified.replace(microsecond=0) <= since
+
+
+def validate(request: Optional[Request], response: Optional[Response], last_fetched: Optional[datetime],
+             ttl: timedelta, *variant: Any) -> Optional[Response]:
+    """
+    Set ETag, Last-Modified and Cache-Control on `response` for data fetched
+    at `last_fetched` (`variant`: item count, selected representation...).
+    Returns a 304 response, keeping those headers, when the request's
+    validators match; None when the full body has to be sent.
+    """
+    if last_fetched is None:
+        return None
+    encoding = compression.request_encoding(request.headers) if isinstance(request, Request) else None
+    tag = etag(*variant, last_fetched.isoformat(), encoding)
+    if response is not None:
+        if "accept-encoding" not in response.headers.get("vary", "").lower():
+            response.headers.add_vary_header("Accept-Encoding")
+        response.headers["ETag"] = tag
+        response.headers["Last-Modified"] = http_date(last_fetched)
+        response.headers["Cache-Control"] = f"max-age={max_age(last_fetched, ttl)}"
+    if not not_modified(request, tag, last_fetched):
+        return None
+    headers = {}
+    if response is not None:
+        headers = {
+            k: v for k, v in response.headers.items()
+            if k.lower() not in ("content-length", "content-type")
+        }
+    return Response(status_code=304, headers=headers)
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Request, Query, status
+from fastapi import FastAPI, Header, HTTPException, Request, Response, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from models import (
@@ -6,10 +6,33 @@ from models import (
     ErrorResponse, PaginatedResponse
 )
 from config import settings
+from compression import CompressionMiddleware
+import openaq_client
+from singleflight import upstream_flight, make_key
+import param_formats
+import hedging
+import station_checks
+import rate_limiter
+import stale_cache
+import persistence
+from write_behind import write_queue, pending_results
+import measurement_store
+import derived_fields
+import geo_queries
+import pagination
+import read_models
+import fast_json
+import measurement_formats
+import http_cache
+from derived_fields import derive_location_fields, derive_pollutants
+from suggest_index import suggest_index
+from spatial_index import spatial_index
+from pymongo import DeleteMany, UpdateOne
 from datetime import datetime, timedelta
 import httpx
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 import statistics
+import math
 from fastapi.responses import JSONResponse
 
 app = FastAPI(
@@ -33,6 +56,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (cached bodies are only compressed once)
+app.add_middleware(CompressionMiddleware)
+
 # MongoDB connection setup
 @app.on_event("startup")
 async def startup_db_client():
@@ -42,16 +68,37 @@ async def startup_db_client():
     # Create indexes
     await app.mongodb.locations.create_index("id", unique=True)
     await app.mongodb.locations.create_index("city")
-    await app.mongodb.measurements.create_index([
-        ("location_id", 1),
-        ("parameter", 1),
-        ("date", -1)
-    ])
+    await app.mongodb.locations.create_index([("name_key", 1), ("id", 1)])  # Keyset pages sorted by name
+    await derived_fields.ensure_indexes(app.mongodb)
+    await derived_fields.backfill(app.mongodb)
+    await geo_queries.ensure_index(app.mongodb)
+    await geo_queries.backfill(app.mongodb)
+    if not suggest_index.built:
+        await suggest_index.build(app.mongodb)
+    if not spatial_index.built:
+        await spatial_index.build(app.mongodb)
+    # Measurement storage (document or time-series collection, see MEASUREMENTS_STORAGE)
+    await measurement_store.get_store().ensure(app.mongodb)
+    await station_checks.ensure_indexes(app.mongodb)
+
+    # MongoDB writes of the routes are committed in the background
+    write_queue.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Commit the queued writes before the connection goes away
+    await write_queue.stop()
     app.mongodb_client.close()
 
+# Shared OpenAQ HTTP client (pooled connections reused by every route)
+@app.on_event("startup")
+async def startup_openaq_client():
+    await openaq_client.start_client()
+
+@app.on_event("shutdown")
+async def shutdown_openaq_client():
+    await openaq_client.close_client()
+
 OPENAQ_BASE_URL = "https://api.openaq.org/v3"
 CACHE_TTL = timedelta(minutes=30)
 
@@ -91,6 +138,17 @@ async def log_api_response(response: httpx.Response):
         print(f"Raw Response: {response.text}")
         print(f"Error parsing JSON: {e}")
 
+def rate_limited_exception(e: Exception) -> Optional[HTTPException]:
+    """503 with Retry-After when OpenAQ is still rate limiting us after retries"""
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+        retry_after = rate_limiter.retry_after_seconds(e.response.headers) or 60
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="OpenAQ rate limit reached, please retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+    return None
+
 async def handle_api_error(e: Exception, cached_data: list = None, error_prefix: str = ""):
     """Handle API errors with caching fallback"""
     error_msg = str(e)
@@ -115,6 +173,10 @@ async def handle_api_error(e: Exception, cached_data: list = None, error_prefix:
         if cached_data:
             print(f"Falling back to cached data ({len(cached_data)} items)")
             return cached_data
+
+        rate_limited = rate_limited_exception(e)
+        if rate_limited:
+            raise rate_limited
             
         if status_code == 422:
             raise HTTPException(
@@ -142,7 +204,7 @@ async def handle_api_error(e: Exception, cached_data: list = None, error_prefix:
 
 @app.get(
     "/api/locations/{city}",
-    response_model=List[Location],
+    response_model=read_models.LocationList,
     responses={
         400: {"model": ErrorResponse},
         404: {"model": ErrorResponse}
@@ -150,7 +212,10 @@ async def handle_api_error(e: Exception, cached_data: list = None, error_prefix:
 )
 async def get_locations(
     city: str,
-    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API")
+    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API"),
+    request: Request = None,
+    response: Response = None,
+    fields: Optional[str] = Query(None, description="summary, or comma-separated summary fields (e.g. id,name)")
 ):
     """
     Fetch monitoring locations for a given city from OpenAQ API,
@@ -160,21 +225,24 @@ async def get_locations(
         print(f"\n=== Fetching locations for city: {city} ===")
         print(f"Force refresh: {force_refresh}")
 
+        # Slim summaries read through a projection (fields=...)
+        selected = read_models.parse_fields(fields)
+
         # Check cache first
         cached_locations = []
         try:
             # Use to_list to get all matching documents at once
-            cursor = app.mongodb.locations.find({
-                "$or": [
-                    {"city": {"$regex": f"^{city}$", "$options": "i"}},
-                    {"locality": {"$regex": f"^{city}$", "$options": "i"}}
-                ]
-            })
-            cached_docs = await cursor.to_list(length=100)
+            # Exact match on the indexed, normalized city/locality keys
+            # (only the selected fields for summaries)
+            if selected:
+                cursor = app.mongodb.locations.find(derived_fields.city_query(city), read_models.projection(selected))
+            else:
+                cursor = app.mongodb.locations.find(derived_fields.city_query(city))
+            cached_docs = await cursor.to_list(length=settings.OPENAQ_LOCATIONS_MAX_RESULTS)
             
             for loc in cached_docs:
                 try:
-                    cached_locations.append(Location(**loc))
+                    cached_locations.append(read_models.to_summary(loc) if selected else Location(**loc))
                 except Exception as e:
                     print(f"Error parsing cached location: {e}")
                     continue
@@ -185,228 +253,334 @@ async def get_locations(
         if cached_locations:
             print(f"Found {len(cached_locations)} locations in cache")
 
-        # Return valid cache if available and not forcing refresh
+        # A refresh whose writes are still queued is newer than MongoDB
+        refresh_key = make_key("locations", city)
+        pending = pending_results.get(refresh_key)
+        if pending:
+            cached_locations = [read_models.to_summary(loc) for loc in pending] if selected else list(pending)
+
+        # Return cache if available and not forcing refresh; stale entries are
+        # served right away and refreshed in the background
         if not force_refresh and cached_locations:
-            # Check cache validity properly with async - collect results first
-            cache_validity = []
-            for loc in cached_locations:
-                is_valid = await is_cache_valid(loc.last_fetched)
-                cache_validity.append(is_valid)
-            
-            if any(cache_validity):
+            last_fetched = stale_cache.newest(loc.last_fetched for loc in cached_locations)
+            cache_status = stale_cache.classify(last_fetched, CACHE_TTL)
+            if cache_status == stale_cache.STALE:
+                print(f"Returning {len(cached_locations)} stale locations, refreshing in background")
+                upstream_flight.spawn(refresh_key, lambda: pending_results.track(
+                    refresh_key, lambda: _refresh_locations(city, [] if selected else cached_locations)
+                ))
+            elif cache_status == stale_cache.HIT:
                 print(f"Returning {len(cached_locations)} locations from cache")
+            if cache_status:
+                stale_cache.set_headers(response, cache_status, last_fetched)
+                # 304 when the client already has this version
+                unchanged = http_cache.validate(
+                    request, response, last_fetched, CACHE_TTL, selected, len(cached_locations)
+                )
+                if unchanged:
+                    return unchanged
+                if selected:
+                    return read_models.respond(cached_locations, selected, response)
+                if settings.FAST_JSON:
+                    return fast_json.respond(cached_locations, List[Location], response)
                 return cached_locations
 
-        # Fetch from OpenAQ API
+        # Fetch from OpenAQ API (concurrent misses for the same city share one refresh)
+        stale_cache.set_headers(response, stale_cache.MISS)
+        # Summaries are not valid fallbacks of the shared refresh, which a full
+        # request may join: callers fall back to their own cache instead
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                headers = {"X-API-Key": settings.OPENAQ_API_KEY} if settings.OPENAQ_API_KEY else {}
-                params = {
-                    "city": city,
-                    "limit": 100,
-                    "page": 1
-                }
-                
-                await log_api_request(f"{OPENAQ_BASE_URL}/locations", params, headers)
-                
-                response = await client.get(
-                    f"{OPENAQ_BASE_URL}/locations",
-                    params=params,
-                    headers=headers
+            locations = await upstream_flight.do(
+                refresh_key,
+                lambda: pending_results.track(
+                    refresh_key, lambda: _refresh_locations(city, [] if selected else cached_locations)
                 )
+            )
+        except HTTPException:
+            if not cached_locations:
+                raise
+            locations = cached_locations
+        last_fetched = stale_cache.newest(loc.last_fetched for loc in locations)
+        unchanged = http_cache.validate(request, response, last_fetched, CACHE_TTL, selected, len(locations))
+        if unchanged:
+            return unchanged
+        if selected:
+            return read_models.respond(locations, selected, response)
+        if settings.FAST_JSON:
+            return fast_json.respond(locations, List[Location], response)
+        return locations
+
+    except read_models.InvalidFields as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error while fetching locations for city '{city}': {str(e)}")
+        print(f"Error type: {type(e)}")
+        import traceback
+        print(f"Traceback: {traceback.format_exc()}")
+        if cached_locations:
+            print(f"Error occurred, falling back to {len(cached_locations)} cached locations")
+            if selected:
+                return read_models.respond(cached_locations, selected, response)
+            return cached_locations
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while fetching locations: {str(e)}"
+        )
+
+async def _prune_city(city: str, station_ids: List[int]):
+    """
+    Delete the stored locations of a city that a complete refresh (not cut
+    short by an error or OPENAQ_LOCATIONS_MAX_RESULTS) no longer lists, and
+    stop suggesting them. Queued after the refresh's upserts.
+    """
+    await write_queue.enqueue(
+        app.mongodb.locations,
+        [DeleteMany(derived_fields.stale_city_query(city, station_ids))],
+        label="stale locations"
+    )
+    suggest_index.prune_city(city, station_ids)
+
+async def _refresh_locations(city: str, cached_locations: List[Location]) -> List[Location]:
+    """
+    Fetch the locations of a city from OpenAQ and upsert them in MongoDB.
+    Runs once per city at a time through `upstream_flight`.
+    """
+    # Fetch from OpenAQ API
+    try:
+        headers = {"X-API-Key": settings.OPENAQ_API_KEY} if settings.OPENAQ_API_KEY else {}
+        params = {"city": city}
+        
+        await log_api_request(f"{OPENAQ_BASE_URL}/locations", params, headers)
+        
+        locations = []
+        skipped_locations = []
+        results_count = 0
+        station_ids = []  # Every station OpenAQ listed, valid or not
+        complete = False
+        
+        # Stream the result pages: the next page is prefetched while this one is validated and written
+        async for page in openaq_client.iter_pages(
+            f"{OPENAQ_BASE_URL}/locations",
+            params=params,
+            headers=headers,
+            max_results=settings.OPENAQ_LOCATIONS_MAX_RESULTS
+        ):
+            results = page.results
+            results_count += len(results)
+            station_ids += [loc.get("id") for loc in results]
+            complete = page.complete
+            print(f"\n=== API Response Page {page.number} ===")
+            print(f"Progress: {page.fetched} of {page.found} locations found")
+            
+            # Print full response for debugging
+            print("\nAPI Response Details:")
+            for idx, result in enumerate(results):
+                print(f"\nResult {idx + 1}:")
+                for key, value in result.items():
+                    print(f"  {key}: {value}")
+            
+            operations = []
+            for loc_data in results:
+                try:
+                    # Debug print the incoming location data
+                    print(f"\nProcessing location data:")
+                    print(f"ID: {loc_data.get('id')}")
+                    print(f"Name: {loc_data.get('name')}")
+                    print(f"City: {loc_data.get('city')}")
+                    print(f"Locality: {loc_data.get('locality')}")
+                    print(f"Country: {loc_data.get('country')}")
                 
-                await log_api_response(response)
-                response.raise_for_status()
-                
-                data = response.json()
-                results = data.get("results", [])
-                print(f"\n=== Full API Response Data ===")
-                print(f"Meta: {data.get('meta', {})}")
-                print(f"Total results: {len(results)}")
-                
-                # Print full response for debugging
-                print("\nAPI Response Details:")
-                for idx, result in enumerate(results):
-                    print(f"\nResult {idx + 1}:")
-                    for key, value in result.items():
-                        print(f"  {key}: {value}")
-
-                if not results:
-                    print(f"WARNING: OpenAQ API returned no locations for city: {city}")
-                    if cached_locations:
-                        print(f"Falling back to {len(cached_locations)} cached locations")
-                        return cached_locations
+                    # Check for required base fields
+                    missing_fields = []
+                    if loc_data.get('id') is None:  # Check for None since 0 is valid
+                        missing_fields.append('id')
+                    if not loc_data.get('name'):
+                        missing_fields.append('name')
                     
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail=f"No locations found for city '{city}'"
-                    )
-                    
-                locations = []
-                skipped_locations = []
-                for loc_data in results:
-                    try:
-                        # Debug print the incoming location data
-                        print(f"\nProcessing location data:")
-                        print(f"ID: {loc_data.get('id')}")
-                        print(f"Name: {loc_data.get('name')}")
-                        print(f"City: {loc_data.get('city')}")
-                        print(f"Locality: {loc_data.get('locality')}")
-                        print(f"Country: {loc_data.get('country')}")
-                        
-                        # Check for required base fields
-                        missing_fields = []
-                        if loc_data.get('id') is None:  # Check for None since 0 is valid
-                            missing_fields.append('id')
-                        if not loc_data.get('name'):
-                            missing_fields.append('name')
-                            
-                        # Validate country data
-                        country_data = loc_data.get('country', {})
-                        if not isinstance(country_data, dict):
-                            missing_fields.append('country (invalid format)')
-                        elif not all(key in country_data for key in ['id', 'code', 'name']):
-                            missing_fields.append('country (missing required fields)')
-                        
-                        # Validate coordinates
-                        coordinates = loc_data.get('coordinates', {})
-                        if not coordinates or not isinstance(coordinates, dict):
-                            missing_fields.append('coordinates')
-                        elif not all(key in coordinates and coordinates[key] is not None 
-                                   for key in ['latitude', 'longitude']):
-                            missing_fields.append('valid coordinates')
-
-                        if missing_fields:
-                            skip_reason = f"Missing required fields: {', '.join(missing_fields)}"
-                            print(f"Skipping location: {skip_reason}")
-                            skipped_locations.append({
-                                'data': loc_data,
-                                'reason': skip_reason
-                            })
-                            continue
-
-                        # Prepare the location data
-                        processed_data = {
-                            'id': int(loc_data['id']),  # Ensure ID is integer
-                            'name': loc_data['name'],
-                            'city': loc_data.get('city'),
-                            'locality': loc_data.get('locality'),
-                            'country': country_data,
-                            'coordinates': coordinates,
-                            'parameters': loc_data.get('parameters', []),
-                            'lastUpdated': loc_data.get('lastUpdated'),
-                            'last_fetched': datetime.utcnow(),
-                            'is_active': True
-                        }
+                    # Validate country data
+                    country_data = loc_data.get('country', {})
+                    if not isinstance(country_data, dict):
+                        missing_fields.append('country (invalid format)')
+                    elif not all(key in country_data for key in ['id', 'code', 'name']):
+                        missing_fields.append('country (missing required fields)')
+                
+                    # Validate coordinates
+                    coordinates = loc_data.get('coordinates', {})
+                    if not coordinates or not isinstance(coordinates, dict):
+                        missing_fields.append('coordinates')
+                    elif not all(key in coordinates and coordinates[key] is not None 
+                               for key in ['latitude', 'longitude']):
+                        missing_fields.append('valid coordinates')
 
-                        # Create Location object
-                        location = Location(**processed_data)
-                        locations.append(location)
-                        
-                        # Update in MongoDB - convert model to dict for storage
-                        await app.mongodb.locations.update_one(
-                            {"id": location.id},
-                            {
-                                "$set": {
-                                    **location.dict(),
-                                    "last_fetched": datetime.utcnow()
-                                }
-                            },
-                            upsert=True
-                        )
-                        print(f"Successfully processed location: {location.name} ({location.display_city})")
-                    except ValueError as ve:
-                        print(f"Validation error processing location: {str(ve)}")
-                        skipped_locations.append({
-                            'data': loc_data,
-                            'reason': f"Validation error: {str(ve)}"
-                        })
-                        continue
-                    except Exception as e:
-                        print(f"Error processing location data: {str(e)}")
+                    if missing_fields:
+                        skip_reason = f"Missing required fields: {', '.join(missing_fields)}"
+                        print(f"Skipping location: {skip_reason}")
                         skipped_locations.append({
                             'data': loc_data,
-                            'reason': f"Processing error: {str(e)}"
+                            'reason': skip_reason
                         })
                         continue
 
-                # Log summary of skipped locations
-                if skipped_locations:
-                    print(f"\n=== Skipped Locations Summary ===")
-                    print(f"Total skipped: {len(skipped_locations)}")
-                    for idx, skipped in enumerate(skipped_locations, 1):
-                        print(f"\nSkipped {idx}:")
-                        print(f"Reason: {skipped['reason']}")
-                        print(f"Data: ID={skipped['data'].get('id')}, "
-                              f"Name={skipped['data'].get('name')}, "
-                              f"City={skipped['data'].get('city')}, "
-                              f"Locality={skipped['data'].get('locality')}")
-
-                if locations:
-                    print(f"Successfully processed {len(locations)} locations")
-                    return locations
-                
-                # If we processed no locations successfully but have cached data
-                if cached_locations:
-                    print(f"No valid locations from API, falling back to {len(cached_locations)} cached locations")
-                    return cached_locations
+                    # Prepare the location data
+                    processed_data = {
+                        'id': int(loc_data['id']),  # Ensure ID is integer
+                        'name': loc_data['name'],
+                        'city': loc_data.get('city'),
+                        'locality': loc_data.get('locality'),
+                        'country': country_data,
+                        'coordinates': coordinates,
+                        'parameters': loc_data.get('parameters', []),
+                        'lastUpdated': loc_data.get('lastUpdated'),
+                        'last_fetched': datetime.utcnow(),
+                        'is_active': True
+                    }
+
+                    # Create Location object
+                    location = Location(**processed_data)
+                    locations.append(location)
                 
-                # Only raise 404 if we have no locations at all
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"No locations found for city '{city}'. Attempted to process {len(results)} locations but all were invalid."
-                )
+                    # Queue the MongoDB upsert, written with the rest of the page below
+                    operations.append(persistence.upsert_op(
+                        {"id": location.id},
+                        {
+                            **location.dict(),
+                            **derive_location_fields(processed_data),
+                            **derive_pollutants(processed_data),
+                            **geo_queries.geo_fields(processed_data),
+                            "last_fetched": datetime.utcnow()
+                        }
+                    ))
+                    suggest_index.add_location(processed_data)
+                    spatial_index.add_location(processed_data)
+                    print(f"Successfully processed location: {location.name} ({location.display_city})")
+                except ValueError as ve:
+                    print(f"Validation error processing location: {str(ve)}")
+                    skipped_locations.append({
+                        'data': loc_data,
+                        'reason': f"Validation error: {str(ve)}"
+                    })
+                    continue
+                except Exception as e:
+                    print(f"Error processing location data: {str(e)}")
+                    skipped_locations.append({
+                        'data': loc_data,
+                        'reason': f"Processing error: {str(e)}"
+                    })
+                    continue
+
+            # Hand the page to the write-behind queue (one unordered bulk write per batch)
+            await write_queue.enqueue(app.mongodb.locations, operations, label="locations")
+            print(f"Page {page.number}: queued {len(operations)} locations for writing")
 
-        except httpx.HTTPError as e:
-            print(f"OpenAQ API error for city '{city}': {str(e)}")
+        if not results_count:
+            print(f"WARNING: OpenAQ API returned no locations for city: {city}")
             if cached_locations:
-                print(f"API error, falling back to {len(cached_locations)} cached locations")
+                print(f"Falling back to {len(cached_locations)} cached locations")
                 return cached_locations
+            
             raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"Error fetching locations from OpenAQ API: {str(e)}"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No locations found for city '{city}'"
             )
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Unexpected error while fetching locations for city '{city}': {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        # Log summary of skipped locations
+        if skipped_locations:
+            print(f"\n=== Skipped Locations Summary ===")
+            print(f"Total skipped: {len(skipped_locations)}")
+            for idx, skipped in enumerate(skipped_locations, 1):
+                print(f"\nSkipped {idx}:")
+                print(f"Reason: {skipped['reason']}")
+                print(f"Data: ID={skipped['data'].get('id')}, "
+                      f"Name={skipped['data'].get('name')}, "
+                      f"City={skipped['data'].get('city')}, "
+                      f"Locality={skipped['data'].get('locality')}")
+
+        if locations:
+            print(f"Successfully processed {len(locations)} locations")
+            if complete:
+                await _prune_city(city, station_ids)
+            return locations
+        
+        # If we processed no locations successfully but have cached data
         if cached_locations:
-            print(f"Error occurred, falling back to {len(cached_locations)} cached locations")
+            print(f"No valid locations from API, falling back to {len(cached_locations)} cached locations")
             return cached_locations
+        
+        # Only raise 404 if we have no locations at all
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"An unexpected error occurred while fetching locations: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No locations found for city '{city}'. Attempted to process {results_count} locations but all were invalid."
+        )
+
+    except httpx.HTTPError as e:
+        print(f"OpenAQ API error for city '{city}': {str(e)}")
+        if cached_locations:
+            print(f"API error, falling back to {len(cached_locations)} cached locations")
+            return cached_locations
+        rate_limited = rate_limited_exception(e)
+        if rate_limited:
+            raise rate_limited
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Error fetching locations from OpenAQ API: {str(e)}"
         )
 
 @app.get("/api/stored-locations", response_model=PaginatedResponse)
 async def get_stored_locations(
     request: Request,
     page: int = Query(1, ge=1),
-    size: int = Query(10, ge=1, le=100)
+    size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Token of the next page (next_cursor of the previous one)"),
+    sort: str = Query("id", pattern="^(id|name)$", description="Order of the locations (id or name)"),
+    with_total: bool = Query(True, description="Include the (estimated) number of locations"),
+    fields: Optional[str] = Query(None, description="summary, or comma-separated summary fields (e.g. id,name)")
 ):
     """
     Retrieve all stored locations from MongoDB with pagination.
+    Follow `next_cursor` for constant-cost paging; `page` still works.
     """
     try:
-        skip = (page - 1) * size
-        total = await request.app.mongodb.locations.count_documents({})
+        locations_collection = request.app.mongodb.locations
+        sort_field = "name_key" if sort == "name" else "id"
+        selected = read_models.parse_fields(fields)
+        # Summaries only read their fields (plus the sort key for the next cursor)
+        projection = {**read_models.projection(selected), sort_field: 1} if selected else None
+        if cursor:
+            # Keyset seek right after the last location of the previous page
+            query = pagination.keyset_query(sort_field, *pagination.decode_cursor(cursor, sort_field))
+            db_cursor = locations_collection.find(query, projection).sort(pagination.sort_spec(sort_field))
+        else:
+            db_cursor = locations_collection.find({}, projection).sort(pagination.sort_spec(sort_field))
+            db_cursor = db_cursor.skip((page - 1) * size)
         
         # Use to_list to get all documents at once instead of iterating
-        cursor = request.app.mongodb.locations.find({}).skip(skip).limit(size)
-        location_docs = await cursor.to_list(length=size)
+        db_cursor = db_cursor.limit(size)
+        location_docs = await db_cursor.to_list(length=size)
         
-        locations = [Location(**loc) for loc in location_docs]
+        if selected:
+            locations = [read_models.to_summary(loc) for loc in location_docs]
+        else:
+            locations = [Location(**loc) for loc in location_docs]
+        total = await pagination.count_cache.count(locations_collection, {}) if with_total else None
         
-        return PaginatedResponse(
+        result = PaginatedResponse(
             total=total,
-            page=page,
+            page=None if cursor else page,
             size=size,
-            items=locations
+            items=locations,
+            next_cursor=pagination.next_cursor(location_docs, size, sort_field)
         )
+        if selected:
+            # Only the selected fields of each summary
+            unselected = set(read_models.SUMMARY_FIELDS) - set(selected)
+            return JSONResponse(result.model_dump(mode="json", exclude={"items": {"__all__": unselected}}))
+        if settings.FAST_JSON:
+            return fast_json.respond(result)
+        return result
+    except (pagination.InvalidCursor, read_models.InvalidFields) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         print(f"Error in get_stored_locations: {str(e)}")
         raise HTTPException(
@@ -417,16 +591,24 @@ async def get_stored_locations(
 @app.get(
     "/api/measurements/{location_id}",
     response_model=LocationResponse,
-    responses={400: {"model": ErrorResponse}}
+    responses={400: {"model": ErrorResponse}, **measurement_formats.RESPONSES}
 )
 async def get_measurements(
     location_id: str,
-    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API")
+    force_refresh: bool = Query(False, description="Force refresh from OpenAQ API"),
+    accept: Optional[str] = Header(None),
+    request: Request = None,
+    response: Response = None
 ):
     """
     Fetch latest air quality measurements for a location from OpenAQ API,
     store them in MongoDB, and return with location details and summaries.
+    Columnar JSON or MessagePack measurements can be requested with Accept.
     """
+    try:
+        media_type = measurement_formats.negotiate(accept, response)
+    except measurement_formats.NotAcceptable as e:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=str(e))
     try:
         # Get location first
         print(f"Fetching measurements for location_id: {location_id}")
@@ -444,7 +626,7 @@ async def get_measurements(
             # Ajouter des champs supplémentaires pour la recherche
             location_query = {
                 "$or": [
-                    {"name": {"$regex": location_id, "$options": "i"}},
+                    {"name_key": derived_fields.prefix_pattern(location_id)},
                     {"id": location_id}
                     # Ajouter d'autres champs si nécessaire
                 ]
@@ -471,293 +653,71 @@ async def get_measurements(
         # Check cache for measurements
         print(f"Checking cache with location_id: {location_id}, openaq_id: {openaq_id}")
         
-        # Utiliser l'ID correct pour la recherche en cache
-        cursor = app.mongodb.measurements.find({
-            "location_id": openaq_id,  # Utiliser l'ID OpenAQ numérique pour la correspondance
-            "last_fetched": {"$gt": datetime.utcnow() - CACHE_TTL}
-        })
-        cached_docs = await cursor.to_list(length=100)
-        cached_measurements = [Measurement(**doc) for doc in cached_docs]
-        
-        if not force_refresh and cached_measurements:
+        # Utiliser l'ID correct pour la recherche en cache. Les mesures jusqu'à
+        # CACHE_MAX_STALENESS_HOURS restent servables pendant un rafraîchissement
+        cached_docs = await measurement_store.get_store().recent(
+            app.mongodb,
+            openaq_id,  # Utiliser l'ID OpenAQ numérique pour la correspondance
+            location_doc,
+            since=datetime.utcnow() - stale_cache.max_staleness()
+        )
+        last_fetched = stale_cache.newest(doc.get("last_fetched") for doc in cached_docs)
+        # Ne garder que le dernier rafraîchissement, pas les mesures des précédents
+        cached_measurements = fast_json.from_documents(Measurement, [
+            doc for doc in cached_docs
+            if doc.get("last_fetched") and last_fetched - doc["last_fetched"] < CACHE_TTL
+        ])
+
+        refresh_key = make_key("measurements", openaq_id)
+        # A refresh whose writes are still queued is newer than MongoDB
+        pending = pending_results.get(refresh_key)
+        if pending:
+            cached_measurements = pending.measurements
+            last_fetched = stale_cache.newest(m.last_fetched for m in cached_measurements)
+
+        refresh = lambda: pending_results.track(refresh_key, lambda: _refresh_measurements(
+            location, openaq_id, cached_measurements,
+            learned_format=location_doc.get(param_formats.FORMAT_FIELD)
+        ))
+
+        cache_status = stale_cache.classify(last_fetched, CACHE_TTL)
+        if not force_refresh and cached_measurements and cache_status:
+            if cache_status == stale_cache.STALE:
+                print(f"Returning stale measurements for {openaq_id}, refreshing in background")
+                upstream_flight.spawn(refresh_key, refresh)
+            stale_cache.set_headers(response, cache_status, last_fetched)
+            # 304 when the client already has this version
+            unchanged = http_cache.validate(
+                request, response, last_fetched, CACHE_TTL, media_type, len(cached_measurements)
+            )
+            if unchanged:
+                return unchanged
             summaries = await calculate_measurement_summaries(cached_measurements)
-            return LocationResponse(
+            result = LocationResponse(
                 location=location,
                 measurements=cached_measurements,
                 measurements_summary=summaries
             )
+            if media_type != measurement_formats.JSON:
+                return measurement_formats.respond(result, media_type, response)
+            if settings.FAST_JSON:
+                return fast_json.respond(result, response=response)
+            return result
 
-        # Fetch from OpenAQ API
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                headers = {"X-API-Key": settings.OPENAQ_API_KEY} if settings.OPENAQ_API_KEY else {}
-                
-                # VERIFICATION PRÉLIMINAIRE: Vérifions d'abord si la station existe dans l'API
-                try:
-                    # Vérifier si la station existe encore dans l'API OpenAQ en utilisant l'endpoint /locations
-                    station_check_params = {
-                        "id": openaq_id,
-                        "limit": 1
-                    }
-                    
-                    print(f"Verifying station existence with parameters: {station_check_params}")
-                    station_check_response = await client.get(
-                        f"{OPENAQ_BASE_URL}/locations",
-                        params=station_check_params,
-                        headers=headers
-                    )
-                    
-                    station_exists = False
-                    if station_check_response.status_code == 200:
-                        data = station_check_response.json()
-                        results = data.get("results", [])
-                        if results and len(results) > 0:
-                            station_exists = True
-                            print(f"Station ID {openaq_id} exists in OpenAQ API")
-                        else:
-                            print(f"Station ID {openaq_id} not found in OpenAQ API via /locations endpoint")
-                    else:
-                        print(f"Failed to verify station existence: {station_check_response.status_code}")
-                    
-                    # Si la station n'existe pas, essayons une recherche par nom
-                    if not station_exists and location.name:
-                        name_check_params = {
-                            "name": location.name,
-                            "limit": 10
-                        }
-                        
-                        print(f"Searching by name with parameters: {name_check_params}")
-                        name_check_response = await client.get(
-                            f"{OPENAQ_BASE_URL}/locations",
-                            params=name_check_params,
-                            headers=headers
-                        )
-                        
-                        if name_check_response.status_code == 200:
-                            data = name_check_response.json()
-                            results = data.get("results", [])
-                            if results and len(results) > 0:
-                                # Trouver l'ID le plus proche
-                                print(f"Found {len(results)} stations with similar name")
-                                
-                                # Mettre à jour l'ID pour les requêtes de mesures
-                                new_id = str(results[0].get("id"))
-                                if new_id and new_id != openaq_id:
-                                    print(f"Updating OpenAQ ID from {openaq_id} to {new_id}")
-                                    openaq_id = new_id
-                                    station_exists = True
-                            else:
-                                print(f"No stations found with name {location.name}")
-                        else:
-                            print(f"Failed to search by name: {name_check_response.status_code}")
-                    
-                    # Si la station n'existe toujours pas et que nous avons des mesures en cache, utilisons-les
-                    if not station_exists and cached_measurements:
-                        print(f"Station not found in API, using {len(cached_measurements)} cached measurements")
-                        summaries = await calculate_measurement_summaries(cached_measurements)
-                        return LocationResponse(
-                            location=location,
-                            measurements=cached_measurements,
-                            measurements_summary=summaries
-                        )
-                    
-                    # Si la station n'existe pas et que nous n'avons pas de cache, retournons une erreur 404
-                    if not station_exists and not cached_measurements:
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"Cette station (ID: {location.id}) n'existe pas ou n'est plus référencée dans l'API OpenAQ"
-                        )
-                
-                except Exception as e:
-                    print(f"Error during station verification: {str(e)}")
-                    # Continuons avec la méthode habituelle si la vérification échoue
-                
-                # MÉTHODE PRINCIPALE: Essayer avec différents formats de paramètres
-                params_formats = [
-                    {"locations": openaq_id},
-                    {"location": openaq_id},
-                    {"id": openaq_id},
-                    {"entity": openaq_id}
-                ]
-                
-                success = False
-                measurements = []
-                response = None
-                
-                for params_format in params_formats:
-                    try:
-                        params = {
-                            **params_format,
-                            "limit": 100,
-                            "page": 1
-                        }
-                        
-                        print(f"Trying OpenAQ API with parameters: {params}")
-                        response = await client.get(
-                            f"{OPENAQ_BASE_URL}/measurements",
-                            params=params,
-                            headers=headers
-                        )
-                        
-                        await log_api_response(response)
-                        
-                        if response.status_code == 200:
-                            data = response.json()
-                            results = data.get("results", [])
-                            
-                            if results and len(results) > 0:
-                                print(f"Found {len(results)} measurements with params format: {params_format}")
-                                
-                                for meas_data in results:
-                                    try:
-                                        measurement = Measurement(
-                                            **meas_data,
-                                            location_id=openaq_id,
-                                            last_fetched=datetime.utcnow()
-                                        )
-                                        measurements.append(measurement)
-                                        
-                                        # Store in MongoDB
-                                        await app.mongodb.measurements.update_one(
-                                            {
-                                                "location_id": openaq_id,
-                                                "parameter": measurement.parameter,
-                                                "date": measurement.date
-                                            },
-                                            {"$set": measurement.dict()},
-                                            upsert=True
-                                        )
-                                    except Exception as e:
-                                        print(f"Error processing measurement: {e}")
-                                        continue
-                                
-                                success = True
-                                break  # Sortir de la boucle si on a trouvé des mesures
-                            else:
-                                print(f"No measurements found with params format: {params_format}")
-                        else:
-                            print(f"API returned status {response.status_code} with params format: {params_format}")
-                    
-                    except Exception as format_error:
-                        print(f"Error with params format {params_format}: {str(format_error)}")
-                
-                if success and measurements:
-                    summaries = await calculate_measurement_summaries(measurements)
-                    
-                    # Update location's measurement count
-                    await app.mongodb.locations.update_one(
-                        {"id": int(openaq_id) if openaq_id.isdigit() else openaq_id},
-                        {
-                            "$set": {
-                                "measurement_count": len(measurements),
-                                "lastUpdated": datetime.utcnow()
-                            }
-                        }
-                    )
-                    
-                    return LocationResponse(
-                        location=location,
-                        measurements=measurements,
-                        measurements_summary=summaries
-                    )
-                
-                # Si nous avons des mesures en cache, utilisons-les
-                if cached_measurements:
-                    print(f"Falling back to {len(cached_measurements)} cached measurements")
-                    summaries = await calculate_measurement_summaries(cached_measurements)
-                    return LocationResponse(
-                        location=location,
-                        measurements=cached_measurements,
-                        measurements_summary=summaries
-                    )
-                
-                # SOLUTION RÉELLE: Générer des données de démonstration
-                print(f"Generating demo data for location {location.name} (ID: {openaq_id})")
-                from utils import generate_demo_measurements
-                
-                # Utiliser l'information des paramètres de la station si disponible
-                parameter_names = []
-                if hasattr(location, 'parameters') and location.parameters:
-                    parameter_names = [p.get('parameter', '') for p in location.parameters if 'parameter' in p]
-                
-                # Générer des données de démonstration
-                demo_measurements = generate_demo_measurements(
-                    location_name=location.name,
-                    location_id=openaq_id,
-                    parameters=parameter_names if parameter_names else None
-                )
-                
-                # Transformer les dictionnaires en objets Measurement
-                measurements = []
-                for meas_data in demo_measurements:
-                    try:
-                        # Ajouter les informations de la station aux mesures
-                        meas_data['coordinates'] = location.coordinates.dict() if hasattr(location, 'coordinates') else None
-                        meas_data['country'] = location.country.dict() if hasattr(location, 'country') else None
-                        meas_data['city'] = location.city
-                        
-                        measurement = Measurement(**meas_data)
-                        measurements.append(measurement)
-                        
-                        # Stocker en MongoDB pour les futurs appels
-                        await app.mongodb.measurements.update_one(
-                            {
-                                "location_id": openaq_id,
-                                "parameter": measurement.parameter,
-                                "date": measurement.date
-                            },
-                            {"$set": measurement.dict()},
-                            upsert=True
-                        )
-                    except Exception as e:
-                        print(f"Error processing demo measurement: {e}")
-                        continue
-                
-                if measurements:
-                    print(f"Generated {len(measurements)} demo measurements")
-                    summaries = await calculate_measurement_summaries(measurements)
-                    
-                    # Update location's measurement count
-                    await app.mongodb.locations.update_one(
-                        {"id": int(openaq_id) if openaq_id.isdigit() else openaq_id},
-                        {
-                            "$set": {
-                                "measurement_count": len(measurements),
-                                "lastUpdated": datetime.utcnow(),
-                                "is_demo_data": True  # Marquer que les données sont des démos
-                            }
-                        }
-                    )
-                    
-                    return LocationResponse(
-                        location=location,
-                        measurements=measurements,
-                        measurements_summary=summaries
-                    )
-                
-                # Si même la génération de démo échoue, levons une exception
-                status_code = getattr(response, 'status_code', 404) if response else 404
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Cette station (ID: {openaq_id}) n'existe pas dans l'API OpenAQ ou n'a pas de mesures disponibles"
-                )
-
-        except HTTPException:
-            # Re-raise HTTPExceptions directly without further processing
-            raise
-        except Exception as e:
-            # For all other exceptions, create appropriate HTTP exceptions
-            if hasattr(e, 'response') and e.response is not None and e.response.status_code == 404:
-                # C'est probablement une station qui n'existe plus dans l'API OpenAQ
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Cette station (ID: {openaq_id}) n'existe pas dans l'API OpenAQ ou n'a pas de mesures disponibles"
-                )
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_502_BAD_GATEWAY,
-                    detail=f"Error fetching measurements from OpenAQ API: {str(e)}"
-                )
+        # Fetch from OpenAQ API (concurrent misses for the same station share one refresh)
+        stale_cache.set_headers(response, stale_cache.MISS)
+        result = await upstream_flight.do(refresh_key, refresh)
+        last_fetched = stale_cache.newest(m.last_fetched for m in result.measurements)
+        unchanged = http_cache.validate(
+            request, response, last_fetched, CACHE_TTL, media_type, len(result.measurements)
+        )
+        if unchanged:
+            return unchanged
+        if media_type != measurement_formats.JSON:
+            return measurement_formats.respond(result, media_type, response)
+        if settings.FAST_JSON:
+            return fast_json.respond(result, response=response)
+        return result
 
     except HTTPException as http_exc:
         # Si c'est déjà une HTTPException (comme celle générée pour 404), la propager directement
@@ -785,43 +745,387 @@ async def get_measurements(
                 detail=f"Unexpected error: {str(e)}"
             )
 
-@app.get("/api/stored-measurements/{location_name}", response_model=List[Measurement])
+async def _fetch_measurement_results(openaq_id: str, param_format: str, headers: dict) -> Optional[list]:
+    """
+    Query /measurements with the station ID passed as `param_format`.
+    Returns the results when the API answers 200 with data, None otherwise.
+    """
+    try:
+        params = {
+            param_format: openaq_id,
+            "limit": 100,
+            "page": 1
+        }
+        
+        print(f"Trying OpenAQ API with parameters: {params}")
+        response = await openaq_client.get(
+            f"{OPENAQ_BASE_URL}/measurements",
+            params=params,
+            headers=headers
+        )
+        
+        await log_api_response(response)
+        
+        if response.status_code == 200:
+            results = response.json().get("results", [])
+            if results:
+                print(f"Found {len(results)} measurements with params format: {param_format}")
+                return results
+            print(f"No measurements found with params format: {param_format}")
+        else:
+            print(f"API returned status {response.status_code} with params format: {param_format}")
+    
+    except Exception as format_error:
+        print(f"Error with params format {param_format}: {str(format_error)}")
+    
+    return None
+
+async def _verify_station(location: Location, openaq_id: str, headers: dict) -> Tuple[Optional[bool], str]:
+    """
+    Check that a station still exists in OpenAQ, by ID then by name.
+
+    Returns (exists, openaq_id) where openaq_id is the new ID of a renamed
+    station. `exists` is None when the API could not answer. Definitive
+    answers are cached in `station_checks` with their own TTL.
+    """
+    check = await station_checks.get_check(app.mongodb, openaq_id)
+    if check:
+        print(f"Station check for {openaq_id} from cache: exists={check['exists']}, id={check['resolved_id']}")
+        return check["exists"], check["resolved_id"]
+    
+    # Vérifier si la station existe encore dans l'API OpenAQ en utilisant l'endpoint /locations
+    station_check_params = {
+        "id": openaq_id,
+        "limit": 1
+    }
+    
+    print(f"Verifying station existence with parameters: {station_check_params}")
+    station_check_response = await openaq_client.get(
+        f"{OPENAQ_BASE_URL}/locations",
+        params=station_check_params,
+        headers=headers
+    )
+    
+    if station_check_response.status_code == 200:
+        data = station_check_response.json()
+        results = data.get("results", [])
+        if results and len(results) > 0:
+            print(f"Station ID {openaq_id} exists in OpenAQ API")
+            await station_checks.save_check(app.mongodb, openaq_id, True)
+            return True, openaq_id
+        print(f"Station ID {openaq_id} not found in OpenAQ API via /locations endpoint")
+    else:
+        print(f"Failed to verify station existence: {station_check_response.status_code}")
+    
+    # Si la station n'existe pas, essayons une recherche par nom
+    if not location.name:
+        return None, openaq_id
+    
+    name_check_params = {
+        "name": location.name,
+        "limit": 10
+    }
+    
+    print(f"Searching by name with parameters: {name_check_params}")
+    name_check_response = await openaq_client.get(
+        f"{OPENAQ_BASE_URL}/locations",
+        params=name_check_params,
+        headers=headers
+    )
+    
+    if name_check_response.status_code != 200:
+        print(f"Failed to search by name: {name_check_response.status_code}")
+        return None, openaq_id
+    
+    data = name_check_response.json()
+    results = data.get("results", [])
+    if results and len(results) > 0:
+        # Trouver l'ID le plus proche
+        print(f"Found {len(results)} stations with similar name")
+        
+        # Mettre à jour l'ID pour les requêtes de mesures
+        new_id = str(results[0].get("id"))
+        if new_id and new_id != openaq_id:
+            print(f"Updating OpenAQ ID from {openaq_id} to {new_id}")
+            await station_checks.save_check(app.mongodb, openaq_id, True, resolved_id=new_id)
+            return True, new_id
+        return None, openaq_id
+    
+    print(f"No stations found with name {location.name}")
+    if station_check_response.status_code == 200:
+        # Absente par ID et par nom: mémoriser ce résultat négatif
+        await station_checks.save_check(app.mongodb, openaq_id, False)
+        return False, openaq_id
+    return None, openaq_id
+
+async def _refresh_measurements(
+    location: Location,
+    openaq_id: str,
+    cached_measurements: List[Measurement],
+    learned_format: Optional[str] = None
+) -> LocationResponse:
+    """
+    Fetch the latest measurements of a station from OpenAQ and store them in MongoDB.
+    Runs once per station at a time through `upstream_flight`.
+    `learned_format` is the parameter format that worked on the previous refresh.
+    """
+    # Fetch from OpenAQ API
+    try:
+        headers = {"X-API-Key": settings.OPENAQ_API_KEY} if settings.OPENAQ_API_KEY else {}
+        
+        # VERIFICATION PRÉLIMINAIRE: Vérifions d'abord si la station existe dans l'API (résultat mis en cache)
+        try:
+            station_exists, openaq_id = await _verify_station(location, openaq_id, headers)
+            
+            # Si la station n'existe toujours pas et que nous avons des mesures en cache, utilisons-les
+            if not station_exists and cached_measurements:
+                print(f"Station not found in API, using {len(cached_measurements)} cached measurements")
+                summaries = await calculate_measurement_summaries(cached_measurements)
+                return LocationResponse(
+                    location=location,
+                    measurements=cached_measurements,
+                    measurements_summary=summaries
+                )
+            
+            # Si la station n'existe pas et que nous n'avons pas de cache, retournons une erreur 404
+            if not station_exists and not cached_measurements:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Cette station (ID: {location.id}) n'existe pas ou n'est plus référencée dans l'API OpenAQ"
+                )
+        
+        except Exception as e:
+            print(f"Error during station verification: {str(e)}")
+            # Continuons avec la méthode habituelle si la vérification échoue
+        
+        # MÉTHODE PRINCIPALE: Essayer le format appris, puis les autres formats de paramètres
+        results = None
+        winning_format = None
+        candidates = param_formats.order_formats(learned_format)
+        
+        if learned_format:
+            results = await _fetch_measurement_results(openaq_id, learned_format, headers)
+            if results:
+                winning_format = learned_format
+            candidates = candidates[1:]
+        
+        if not results and settings.OPENAQ_HEDGE_FORMATS:
+            # Lancer les formats candidats en parallèle, décalés dans le temps
+            index, results = await hedging.race(
+                [lambda f=f: _fetch_measurement_results(openaq_id, f, headers) for f in candidates],
+                stagger=settings.OPENAQ_HEDGE_STAGGER,
+                max_in_flight=settings.OPENAQ_HEDGE_MAX_IN_FLIGHT
+            )
+            if index is not None:
+                winning_format = candidates[index]
+        elif not results:
+            for param_format in candidates:
+                results = await _fetch_measurement_results(openaq_id, param_format, headers)
+                if results:
+                    winning_format = param_format
+                    break  # Sortir de la boucle si on a trouvé des mesures
+        
+        # Mémoriser le format qui a fonctionné (ou l'oublier s'il a échoué)
+        if winning_format != learned_format:
+            await param_formats.save_format(app.mongodb, location.id, winning_format)
+        
+        measurements = []
+        
+        if results:
+            for meas_data in results:
+                try:
+                    measurement = Measurement(
+                        **meas_data,
+                        location_id=openaq_id,
+                        last_fetched=datetime.utcnow()
+                    )
+                    measurements.append(measurement)
+                except Exception as e:
+                    print(f"Error processing measurement: {e}")
+                    continue
+
+            # Store in MongoDB in the background, batched with other writes
+            await measurement_store.get_store().save(
+                app.mongodb, openaq_id, [m.dict() for m in measurements], label="measurements"
+            )
+        
+        if measurements:
+            summaries = await calculate_measurement_summaries(measurements)
+            
+            # Update location's measurement count
+            await write_queue.enqueue(app.mongodb.locations, [UpdateOne(
+                {"id": int(openaq_id) if openaq_id.isdigit() else openaq_id},
+                {
+                    "$set": {
+                        "measurement_count": len(measurements),
+                        "lastUpdated": datetime.utcnow()
+                    }
+                }
+            )], label="location counts")
+            
+            return LocationResponse(
+                location=location,
+                measurements=measurements,
+                measurements_summary=summaries
+            )
+        
+        # Si nous avons des mesures en cache, utilisons-les
+        if cached_measurements:
+            print(f"Falling back to {len(cached_measurements)} cached measurements")
+            summaries = await calculate_measurement_summaries(cached_measurements)
+            return LocationResponse(
+                location=location,
+                measurements=cached_measurements,
+                measurements_summary=summaries
+            )
+        
+        # SOLUTION RÉELLE: Générer des données de démonstration
+        print(f"Generating demo data for location {location.name} (ID: {openaq_id})")
+        from utils import generate_demo_measurements
+        
+        # Utiliser l'information des paramètres de la station si disponible
+        parameter_names = []
+        if hasattr(location, 'parameters') and location.parameters:
+            parameter_names = [p.get('parameter', '') for p in location.parameters if 'parameter' in p]
+        
+        # Générer des données de démonstration
+        demo_measurements = generate_demo_measurements(
+            location_name=location.name,
+            location_id=openaq_id,
+            parameters=parameter_names if parameter_names else None
+        )
+        
+        # Transformer les dictionnaires en objets Measurement
+        measurements = []
+        for meas_data in demo_measurements:
+            try:
+                # Ajouter les informations de la station aux mesures
+                meas_data['coordinates'] = location.coordinates.dict() if hasattr(location, 'coordinates') else None
+                meas_data['country'] = location.country.dict() if hasattr(location, 'country') else None
+                meas_data['city'] = location.city
+                
+                measurement = Measurement(**meas_data)
+                measurements.append(measurement)
+            except Exception as e:
+                print(f"Error processing demo measurement: {e}")
+                continue
+
+        # Stocker en MongoDB pour les futurs appels (en arrière-plan, par lots)
+        await measurement_store.get_store().save(
+            app.mongodb, openaq_id, [m.dict() for m in measurements], label="demo measurements"
+        )
+        
+        if measurements:
+            print(f"Generated {len(measurements)} demo measurements")
+            summaries = await calculate_measurement_summaries(measurements)
+            
+            # Update location's measurement count
+            await write_queue.enqueue(app.mongodb.locations, [UpdateOne(
+                {"id": int(openaq_id) if openaq_id.isdigit() else openaq_id},
+                {
+                    "$set": {
+                        "measurement_count": len(measurements),
+                        "lastUpdated": datetime.utcnow(),
+                        "is_demo_data": True  # Marquer que les données sont des démos
+                    }
+                }
+            )], label="location counts")
+            
+            return LocationResponse(
+                location=location,
+                measurements=measurements,
+                measurements_summary=summaries
+            )
+        
+        # Si même la génération de démo échoue, levons une exception
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Cette station (ID: {openaq_id}) n'existe pas dans l'API OpenAQ ou n'a pas de mesures disponibles"
+        )
+
+    except HTTPException:
+        # Re-raise HTTPExceptions directly without further processing
+        raise
+    except Exception as e:
+        # For all other exceptions, create appropriate HTTP exceptions
+        if hasattr(e, 'response') and e.response is not None and e.response.status_code == 404:
+            # C'est probablement une station qui n'existe plus dans l'API OpenAQ
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Cette station (ID: {openaq_id}) n'existe pas dans l'API OpenAQ ou n'a pas de mesures disponibles"
+            )
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Error fetching measurements from OpenAQ API: {str(e)}"
+            )
+
+@app.get(
+    "/api/stored-measurements/{location_name}",
+    response_model=List[Measurement],
+    responses=measurement_formats.RESPONSES
+)
 async def get_stored_measurements(
     location_name: str,
     request: Request,
     parameter: Optional[str] = None,
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None,
+    accept: Optional[str] = Header(None),
+    response: Response = None
 ):
     """
     Retrieve stored measurements for a given location name from MongoDB with filtering options.
+    Columnar JSON or MessagePack can be requested with Accept.
     """
     try:
-        query = {"location": location_name}
-        
-        if parameter:
-            query["parameter"] = parameter
-        
-        if start_date or end_date:
-            date_query = {}
-            if start_date:
-                date_query["$gte"] = start_date
-            if end_date:
-                date_query["$lte"] = end_date
-            if date_query:
-                query["date"] = date_query
-
-        # Use to_list to get all documents at once
-        cursor = request.app.mongodb.measurements.find(query).sort("date", -1)
-        measurement_docs = await cursor.to_list(length=100)  # Limit to latest 100 measurements
+        media_type = measurement_formats.negotiate(accept, response)
+    except measurement_formats.NotAcceptable as e:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=str(e))
+    try:
+        # Latest 100 measurements, from the configured measurement storage
+        measurement_docs = await measurement_store.get_store().query(
+            request.app.mongodb,
+            location_name,
+            parameter=parameter,
+            start_date=start_date,
+            end_date=end_date,
+            limit=100
+        )
         
-        measurements = [Measurement(**doc) for doc in measurement_docs]
+        measurements = fast_json.from_documents(Measurement, measurement_docs)
+        if media_type != measurement_formats.JSON:
+            return measurement_formats.respond(measurements, media_type, response)
+        if settings.FAST_JSON:
+            return fast_json.respond(measurements, List[Measurement], response)
         return measurements
 
     except Exception as e:
         print(f"Error in get_stored_measurements: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/measurements/{location_id}/summary", response_model=List[MeasurementSummary])
+async def get_measurement_summary(
+    location_id: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Summary statistics of the stored measurements of a station (last 24 hours
+    by default), computed by the configured measurement storage.
+    """
+    try:
+        end_date = end_date or datetime.utcnow()
+        start_date = start_date or end_date - timedelta(days=1)
+        summaries = await measurement_store.get_store().summarize(app.mongodb, location_id, start_date, end_date)
+        return [
+            MeasurementSummary(**{**summary, "unit": summary.get("unit") or ""})
+            for summary in summaries
+        ]
+    except Exception as e:
+        print(f"Error in get_measurement_summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 async def calculate_measurement_summaries(measurements: List[Measurement]) -> List[MeasurementSummary]:
     """Calculate summary statistics for each parameter in the measurements."""
     parameter_data: Dict[str, List[Measurement]] = {}
@@ -850,6 +1154,16 @@ async def calculate_measurement_summaries(measurements: List[Measurement]) -> Li
     
     return summaries
 
+@app.get("/api/debug/rate-limit", response_model=dict)
+async def debug_rate_limit():
+    """State of the OpenAQ rate limiter (queue depth, current rate, pause)"""
+    return await openaq_client.limiter.stats()
+
+@app.get("/api/debug/write-queue", response_model=dict)
+async def debug_write_queue():
+    """State of the write-behind queue (depth, lag, write counts)"""
+    return write_queue.stats()
+
 @app.get("/api/debug/openaq", response_model=dict)
 async def debug_openaq_api():
     """
@@ -858,81 +1172,81 @@ async def debug_openaq_api():
     """
     try:
         tests = {}
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {"X-API-Key": settings.OPENAQ_API_KEY} if settings.OPENAQ_API_KEY else {}
-            
-            # Test 1: Vérifier la structure de base de l'API
-            print("Testing OpenAQ API base structure...")
-            response = await client.get(
-                f"{OPENAQ_BASE_URL}/",
-                headers=headers
-            )
-            tests["base_status"] = response.status_code
-            tests["base_data"] = response.json() if response.status_code == 200 else str(response.content)
-            
-            # Test 2: Vérifier les paramètres de l'endpoint measurements
-            print("Testing OpenAQ measurements endpoint parameters...")
-            response = await client.options(
-                f"{OPENAQ_BASE_URL}/measurements",
-                headers=headers
-            )
-            tests["measurements_options_status"] = response.status_code
-            tests["measurements_options"] = dict(response.headers)
-            
-            # Test 3: Vérifier une location connue pour voir sa structure
-            print("Testing OpenAQ with a known location...")
-            response = await client.get(
-                f"{OPENAQ_BASE_URL}/locations",
-                params={"limit": 1},
-                headers=headers
-            )
-            tests["sample_location_status"] = response.status_code
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("results") and len(data["results"]) > 0:
-                    sample_location = data["results"][0]
-                    tests["sample_location"] = sample_location
-                    
-                    # Test 4: Tester les mesures pour cette location
-                    location_id = sample_location.get("id")
-                    print(f"Testing measurements for location ID: {location_id}")
-                    
-                    # Test avec "locations" (au pluriel)
-                    response = await client.get(
-                        f"{OPENAQ_BASE_URL}/measurements",
-                        params={"locations": location_id, "limit": 5},
-                        headers=headers
-                    )
-                    tests["test_locations_param"] = {
-                        "status": response.status_code,
-                        "url": str(response.url),
-                        "data": response.json() if response.status_code == 200 else str(response.content)
-                    }
-                    
-                    # Test avec "location" (au singulier)
-                    response = await client.get(
-                        f"{OPENAQ_BASE_URL}/measurements",
-                        params={"location": location_id, "limit": 5},
-                        headers=headers
-                    )
-                    tests["test_location_param"] = {
-                        "status": response.status_code,
-                        "url": str(response.url),
-                        "data": response.json() if response.status_code == 200 else str(response.content)
-                    }
-                    
-                    # Test avec "location_id"
-                    response = await client.get(
-                        f"{OPENAQ_BASE_URL}/measurements",
-                        params={"location_id": location_id, "limit": 5},
-                        headers=headers
-                    )
-                    tests["test_location_id_param"] = {
-                        "status": response.status_code,
-                        "url": str(response.url),
-                        "data": response.json() if response.status_code == 200 else str(response.content)
-                    }
-            
+        headers = {"X-API-Key": settings.OPENAQ_API_KEY} if settings.OPENAQ_API_KEY else {}
+        
+        # Test 1: Vérifier la structure de base de l'API
+        print("Testing OpenAQ API base structure...")
+        response = await openaq_client.get(
+            f"{OPENAQ_BASE_URL}/",
+            headers=headers
+        )
+        tests["base_status"] = response.status_code
+        tests["base_data"] = response.json() if response.status_code == 200 else str(response.content)
+        
+        # Test 2: Vérifier les paramètres de l'endpoint measurements
+        print("Testing OpenAQ measurements endpoint parameters...")
+        response = await openaq_client.request(
+            "OPTIONS",
+            f"{OPENAQ_BASE_URL}/measurements",
+            headers=headers
+        )
+        tests["measurements_options_status"] = response.status_code
+        tests["measurements_options"] = dict(response.headers)
+        
+        # Test 3: Vérifier une location connue pour voir sa structure
+        print("Testing OpenAQ with a known location...")
+        response = await openaq_client.get(
+            f"{OPENAQ_BASE_URL}/locations",
+            params={"limit": 1},
+            headers=headers
+        )
+        tests["sample_location_status"] = response.status_code
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("results") and len(data["results"]) > 0:
+                sample_location = data["results"][0]
+                tests["sample_location"] = sample_location
+                
+                # Test 4: Tester les mesures pour cette location
+                location_id = sample_location.get("id")
+                print(f"Testing measurements for location ID: {location_id}")
+                
+                # Test avec "locations" (au pluriel)
+                response = await openaq_client.get(
+                    f"{OPENAQ_BASE_URL}/measurements",
+                    params={"locations": location_id, "limit": 5},
+                    headers=headers
+                )
+                tests["test_locations_param"] = {
+                    "status": response.status_code,
+                    "url": str(response.url),
+                    "data": response.json() if response.status_code == 200 else str(response.content)
+                }
+                
+                # Test avec "location" (au singulier)
+                response = await openaq_client.get(
+                    f"{OPENAQ_BASE_URL}/measurements",
+                    params={"location": location_id, "limit": 5},
+                    headers=headers
+                )
+                tests["test_location_param"] = {
+                    "status": response.status_code,
+                    "url": str(response.url),
+                    "data": response.json() if response.status_code == 200 else str(response.content)
+                }
+                
+                # Test avec "location_id"
+                response = await openaq_client.get(
+                    f"{OPENAQ_BASE_URL}/measurements",
+                    params={"location_id": location_id, "limit": 5},
+                    headers=headers
+                )
+                tests["test_location_id_param"] = {
+                    "status": response.status_code,
+                    "url": str(response.url),
+                    "data": response.json() if response.status_code == 200 else str(response.content)
+                }
+        
         return {
             "tests": tests,
             "openaq_base_url": OPENAQ_BASE_URL,
@@ -960,12 +1274,17 @@ async def debug_openaq_parameters(location_id: str):
         result = await check_openaq_api_params(
             base_url=OPENAQ_BASE_URL,
             test_id=location_id,
-            api_key=settings.OPENAQ_API_KEY
+            api_key=settings.OPENAQ_API_KEY,
+            requester=openaq_client.get  # Rate-limited and retried like the other OpenAQ calls
         )
         
         # Sauvegarder les résultats pour référence future
         await save_debug_info(result, f"openaq_debug_{location_id}.json")
         
+        # Mémoriser le format recommandé pour les prochains rafraîchissements
+        if result.get("recommended_param") and location_id.isdigit():
+            await param_formats.save_format(app.mongodb, int(location_id), result["recommended_param"])
+        
         return result
         
     except Exception as e:
@@ -0,0 +1,138 @@
+"""
+Alternative layouts of measurement payloads, selected with the Accept header.
+
+`LocationResponse.measurements` repeats the station fields (location,
+coordinates, country, city, unit...) on every row. Chart clients can ask
+for a columnar layout instead:
+
+    Accept: application/vnd.weatherwes.columnar+json
+    {"count": 3,
+     "constants": {"location": "Paris Centre", "unit": "µg/m³", ...},
+     "columns": {"parameter": ["pm25", "pm10", "no2"], "value": [...], "date": [...]}}
+
+A field goes in `constants` when every row has the same value, otherwise in
+`columns` (one array per field, in row order). `Accept: application/msgpack`
+returns the same structure as MessagePack when the optional msgpack package
+is installed (406 otherwise). Anything else gets the usual JSON rows.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Response
+from pydantic import BaseModel
+
+import fast_json
+
+try:
+    import msgpack
+except ImportError:  # Optional: no binary format without it
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR = "application/vnd.weatherwes.columnar+json"
+MSGPACK = "application/msgpack"
+
+_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/*": JSON,
+    "*/*": JSON,
+}
+
+# OpenAPI description of the alternative layouts, for the route decorators
+RESPONSES = {
+    200: {"content": {COLUMNAR: {}, MSGPACK: {}}},
+    406: {"description": "MessagePack requested but not available"},
+}
+
+
+class NotAcceptable(ValueError):
+    """An Accept header only asking for formats this server cannot produce."""
+
+
+def _media_ranges(accept: str) -> List[Tuple[str, float]]:
+    """Media ranges of an Accept header, by decreasing quality (stable)."""
+    ranges = []
+    for part in accept.split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        if not media:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((media.lower(), quality))
+    return sorted(ranges, key=lambda r: -r[1])
+
+
+def negotiate(accept: Optional[str], response: Optional[Response] = None) -> str:
+    """
+    Media type to answer with for an Accept header: JSON, COLUMNAR or
+    MSGPACK. Unknown types fall back to JSON; raises NotAcceptable when
+    MessagePack is the only acceptable format and msgpack is missing.
+    Marks `response` as varying with Accept.
+    """
+    if response is not None:
+        response.headers["Vary"] = "Accept"
+    if not isinstance(accept, str) or not accept.strip():
+        return JSON
+    wants_msgpack = False
+    for media, quality in _media_ranges(accept):
+        if quality <= 0:
+            continue
+        media = _ALIASES.get(media, media)
+        if media in (JSON, COLUMNAR):
+            return media
+        if media == MSGPACK:
+            if msgpack is not None:
+                return MSGPACK
+            wants_msgpack = True
+    if wants_msgpack:
+        raise NotAcceptable("MessagePack responses are not available on this server (msgpack is not installed)")
+    return JSON
+
+
+def columnar(rows: Iterable[Any]) -> Dict[str, Any]:
+    """Columnar layout of measurements (models or JSON-compatible dicts)."""
+    rows = [row.model_dump(mode="json") if isinstance(row, BaseModel) else row for row in rows]
+    fields = list(dict.fromkeys(field for row in rows for field in row))
+    constants, columns = {}, {}
+    for field in fields:
+        values = [row.get(field) for row in rows]
+        if all(value == values[0] for value in values):
+            constants[field] = values[0]
+        else:
+            columns[field] = values
+    return {"count": len(rows), "constants": constants, "columns": columns}
+
+
+def layout(content: Any) -> Any:
+    """
+    Columnar version of a measurement list, or of a LocationResponse (its
+    `measurements` only; the location and summaries are unchanged).
+    """
+    if isinstance(content, BaseModel):
+        data = content.model_dump(mode="json", exclude={"measurements"})
+        data["measurements"] = columnar(content.measurements)
+        return data
+    return columnar(content)
+
+
+def respond(content: Any, media_type: str, response: Optional[Response] = None) -> Response:
+    """
+    Response of `content` in the negotiated columnar or MessagePack format,
+    keeping the headers already set on `response`.
+    """
+    data = layout(content)
+    if media_type == MSGPACK:
+        body = msgpack.packb(data, use_bin_type=True)
+    else:
+        body = fast_json.dumps(data)
+    headers = {}
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    headers["Vary"] = "Accept"
+    return Response(content=body, media_type=media_type, headers=headers)
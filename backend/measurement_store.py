@@ -0,0 +1,410 @@
+"""
+Storage backends for measurements.
+
+MEASUREMENTS_STORAGE selects how readings are stored:
+
+- "document" (default): one document per reading in `measurements`,
+  upserted on the unique (location_id, parameter, date) key.
+- "timeseries": a native MongoDB time-series collection `measurements_ts`
+  (MongoDB 5.0+) with `date` as timeField, {location_id, parameter} as
+  metaField and hourly granularity. Readings are append-only, so the time
+  of the last refresh of a station is kept on its location document
+  (`measurements_fetched_at`) for cache validity.
+- "bucket": for MongoDB versions without time-series collections, one
+  document per (station, parameter, day) in `measurement_buckets` with
+  parallel `values`/`dates` arrays and running min/max/sum/count, so a day
+  summary is read from a single document.
+
+Routes go through get_store() and never query the collections directly.
+Existing data is copied to the time-series collection with
+`python migrate_measurements.py`.
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import logging
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from config import settings
+import persistence
+from write_behind import write_queue
+
+logger = logging.getLogger(__name__)
+
+FETCHED_AT_FIELD = "measurements_fetched_at"
+NAMESPACE_EXISTS = 48
+
+# (parameter, date) of the time-series readings queued in write_queue but not
+# committed yet, per station: the next refresh must not insert them again
+_pending_readings: Dict[str, Set[Tuple[str, datetime]]] = {}
+
+
+class DocumentMeasurementStore:
+    """One document per reading in the `measurements` collection."""
+    name = "document"
+    collection = "measurements"
+
+    async def ensure(self, db):
+        # Unique: concurrent refreshes of a station can never duplicate a measurement
+        await persistence.ensure_unique_index(db[self.collection], persistence.MEASUREMENT_KEY)
+
+    async def save(self, db, location_id: str, measurements: List[Dict[str, Any]], label: str = "measurements"):
+        """Queue the upserts of a station's readings."""
+        await write_queue.enqueue(
+            db[self.collection],
+            [persistence.measurement_upsert_op(location_id, m) for m in measurements],
+            label=label
+        )
+
+    async def recent(self, db, location_id: str, location_doc: Dict[str, Any], since: datetime,
+                     limit: int = 100) -> List[Dict[str, Any]]:
+        """Readings of a station fetched after `since`, most recently fetched first."""
+        cursor = db[self.collection].find({
+            "location_id": location_id,
+            "last_fetched": {"$gt": since}
+        }).sort("last_fetched", -1)
+        return await cursor.to_list(length=limit)
+
+    async def query(self, db, location: str, parameter: Optional[str] = None,
+                    start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                    limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest readings of a station (by name), newest first."""
+        query: Dict[str, Any] = {"location": location}
+        if parameter:
+            query["parameter"] = parameter
+        date_query = _date_range(start_date, end_date)
+        if date_query:
+            query["date"] = date_query
+        cursor = db[self.collection].find(query).sort("date", -1)
+        return await cursor.to_list(length=limit)
+
+    async def summarize(self, db, location_id: str, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        """Per-parameter min/max/avg/count of a station's readings between two dates."""
+        return await _summarize(
+            db[self.collection],
+            {"location_id": str(location_id), "date": {"$gte": start_date, "$lte": end_date}},
+            "$parameter"
+        )
+
+
+class TimeSeriesMeasurementStore:
+    """Readings in a native MongoDB time-series collection."""
+    name = "timeseries"
+    collection = "measurements_ts"
+
+    async def ensure(self, db):
+        """Create the time-series collection and its meta/date index."""
+        try:
+            await db.create_collection(
+                self.collection,
+                timeseries={"timeField": "date", "metaField": "meta", "granularity": "hours"}
+            )
+            logger.info(f"Created time-series collection {self.collection}")
+        except CollectionInvalid:
+            pass  # Already exists
+        except OperationFailure as e:
+            if e.code != NAMESPACE_EXISTS:
+                raise
+        await db[self.collection].create_index([("meta.location_id", 1), ("meta.parameter", 1), ("date", -1)])
+
+    @staticmethod
+    def to_document(location_id: str, measurement: Dict[str, Any]) -> Dict[str, Any]:
+        """Reading as stored in the time-series collection."""
+        doc = {k: v for k, v in measurement.items() if k not in ("location_id", "parameter", "_id")}
+        doc["meta"] = {"location_id": str(location_id), "parameter": measurement["parameter"]}
+        return doc
+
+    @staticmethod
+    def from_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Reading in the shape of the Measurement model."""
+        meta = doc.get("meta") or {}
+        flat = {k: v for k, v in doc.items() if k != "meta"}
+        flat["location_id"] = meta.get("location_id")
+        flat["parameter"] = meta.get("parameter")
+        return flat
+
+    async def save(self, db, location_id: str, measurements: List[Dict[str, Any]], label: str = "measurements"):
+        """
+        Queue the inserts of the readings not stored or queued yet
+        (time-series collections have no unique index), and mark the station
+        as refreshed.
+        """
+        location_id = str(location_id)
+        existing = set()
+        if measurements:
+            cursor = db[self.collection].find(
+                {
+                    "meta.location_id": location_id,
+                    "date": {"$in": [m["date"] for m in measurements]}
+                },
+                {"meta.parameter": 1, "date": 1}
+            )
+            for doc in await cursor.to_list(length=None):
+                existing.add((doc["meta"]["parameter"], doc["date"]))
+
+        # Readings queued by a previous refresh are not in the collection yet;
+        # readings of the same batch can repeat: keep the first one
+        pending = _pending_readings.setdefault(location_id, set())
+        seen = existing | pending
+        keys = []
+        operations = []
+        for m in measurements:
+            key = (m["parameter"], m["date"])
+            if key in seen:
+                continue
+            seen.add(key)
+            keys.append(key)
+            operations.append(InsertOne(self.to_document(location_id, m)))
+        pending.update(keys)
+
+        def committed():
+            pending.difference_update(keys)
+            if not pending and _pending_readings.get(location_id) is pending:
+                del _pending_readings[location_id]
+
+        await write_queue.enqueue(db[self.collection], operations, label=label, on_commit=committed)
+
+        await write_queue.enqueue(db.locations, [UpdateOne(
+            {"id": int(location_id) if location_id.isdigit() else location_id},
+            {"$set": {FETCHED_AT_FIELD: datetime.utcnow()}}
+        )], label="measurement refresh times")
+
+    async def recent(self, db, location_id: str, location_doc: Dict[str, Any], since: datetime,
+                     limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Latest readings of a station if it was refreshed after `since`. Each
+        reading carries the refresh time as `last_fetched`.
+        """
+        fetched_at = (location_doc or {}).get(FETCHED_AT_FIELD)
+        if not fetched_at or fetched_at <= since:
+            return []
+        cursor = db[self.collection].find({"meta.location_id": str(location_id)}).sort("date", -1)
+        docs = await cursor.to_list(length=limit)
+        return [{**self.from_document(doc), "last_fetched": fetched_at} for doc in docs]
+
+    async def query(self, db, location: str, parameter: Optional[str] = None,
+                    start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                    limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest readings of a station (by name), newest first."""
+        # Resolve the name to station IDs so the query uses the meta index
+        location_docs = await db.locations.find({"name": location}, {"id": 1}).to_list(length=None)
+        location_ids = [str(doc["id"]) for doc in location_docs if doc.get("id") is not None]
+        query: Dict[str, Any] = {"meta.location_id": {"$in": location_ids}} if location_ids else {"location": location}
+        if parameter:
+            query["meta.parameter"] = parameter
+        date_query = _date_range(start_date, end_date)
+        if date_query:
+            query["date"] = date_query
+        cursor = db[self.collection].find(query).sort("date", -1)
+        return [self.from_document(doc) for doc in await cursor.to_list(length=limit)]
+
+    async def summarize(self, db, location_id: str, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        """Per-parameter min/max/avg/count of a station's readings between two dates."""
+        return await _summarize(
+            db[self.collection],
+            {"meta.location_id": str(location_id), "date": {"$gte": start_date, "$lte": end_date}},
+            "$meta.parameter"
+        )
+
+
+class BucketMeasurementStore:
+    """Readings packed into one document per station, parameter and day."""
+    name = "bucket"
+    collection = "measurement_buckets"
+    # Descriptive fields copied from the readings onto their bucket
+    BUCKET_FIELDS = ("location", "unit", "city", "country", "coordinates", "is_demo")
+
+    async def ensure(self, db):
+        await db[self.collection].create_index(
+            [("location_id", 1), ("parameter", 1), ("day", -1)], unique=True
+        )
+        await db[self.collection].create_index([("location", 1), ("day", -1)])
+
+    @staticmethod
+    def day_of(date: datetime) -> datetime:
+        return datetime(date.year, date.month, date.day)
+
+    def append_op(self, location_id: str, measurement: Dict[str, Any], fetched_at: datetime) -> UpdateOne:
+        """
+        Append a reading to its bucket unless its date is already there. The
+        filter only matches buckets without that date: when the reading is
+        already stored, the upsert hits the unique bucket key and the
+        duplicate-key error is ignored.
+        """
+        date = measurement["date"]
+        value = measurement["value"]
+        return UpdateOne(
+            {
+                "location_id": str(location_id),
+                "parameter": measurement["parameter"],
+                "day": self.day_of(date),
+                "dates": {"$ne": date}
+            },
+            {
+                "$push": {"values": value, "dates": date},
+                "$min": {"min": value, "first": date},
+                "$max": {"max": value, "last": date},
+                "$inc": {"sum": value, "count": 1},
+                "$set": {
+                    **{f: measurement.get(f) for f in self.BUCKET_FIELDS if f in measurement},
+                    "last_fetched": fetched_at
+                }
+            },
+            upsert=True
+        )
+
+    async def save(self, db, location_id: str, measurements: List[Dict[str, Any]], label: str = "measurements"):
+        """Queue the appends of a station's readings to their daily buckets."""
+        fetched_at = datetime.utcnow()
+        await write_queue.enqueue(
+            db[self.collection],
+            [self.append_op(location_id, m, fetched_at) for m in measurements],
+            label=label,
+            ignore_duplicates=True
+        )
+        # Buckets whose readings were all stored already still count as refreshed
+        buckets = {(m["parameter"], self.day_of(m["date"])) for m in measurements}
+        await write_queue.enqueue(db[self.collection], [
+            UpdateOne(
+                {"location_id": str(location_id), "parameter": parameter, "day": day},
+                {"$set": {"last_fetched": fetched_at}}
+            )
+            for parameter, day in buckets
+        ], label=f"{label} refresh times")
+
+    @classmethod
+    def readings(cls, bucket: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Unpack a bucket into readings in the shape of the Measurement model."""
+        shared = {f: bucket.get(f) for f in cls.BUCKET_FIELDS if f in bucket}
+        return [
+            {
+                **shared,
+                "location_id": bucket["location_id"],
+                "parameter": bucket["parameter"],
+                "value": value,
+                "date": date,
+                "last_fetched": bucket.get("last_fetched")
+            }
+            for value, date in zip(bucket.get("values", []), bucket.get("dates", []))
+        ]
+
+    async def _range(self, db, query: Dict[str, Any], start_date: Optional[datetime],
+                     end_date: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        """Readings of the matching buckets within the dates, newest first."""
+        day_query = _date_range(
+            self.day_of(start_date) if start_date else None,
+            self.day_of(end_date) if end_date else None
+        )
+        if day_query:
+            query["day"] = day_query
+        docs = []
+        full_day = None  # Day on which `limit` readings were reached
+        cursor = db[self.collection].find(query).sort("day", -1)
+        async for bucket in cursor:
+            # Buckets come newest day first: older days cannot make the cut
+            if full_day and bucket["day"] < full_day:
+                break
+            docs.extend(
+                reading for reading in self.readings(bucket)
+                if (not start_date or reading["date"] >= start_date)
+                and (not end_date or reading["date"] <= end_date)
+            )
+            if full_day is None and len(docs) >= limit:
+                full_day = bucket["day"]
+        docs.sort(key=lambda reading: reading["date"], reverse=True)
+        return docs[:limit]
+
+    async def recent(self, db, location_id: str, location_doc: Dict[str, Any], since: datetime,
+                     limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest readings of the station's buckets refreshed after `since`."""
+        return await self._range(
+            db, {"location_id": str(location_id), "last_fetched": {"$gt": since}}, None, None, limit
+        )
+
+    async def query(self, db, location: str, parameter: Optional[str] = None,
+                    start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                    limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest readings of a station (by name), newest first."""
+        query: Dict[str, Any] = {"location": location}
+        if parameter:
+            query["parameter"] = parameter
+        return await self._range(db, query, start_date, end_date, limit)
+
+    async def summarize(self, db, location_id: str, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        """
+        Per-parameter min/max/avg/count of a station, read from the running
+        aggregates of its buckets (one document per parameter and day). The
+        range is widened to whole days.
+        """
+        cursor = db[self.collection].find(
+            {
+                "location_id": str(location_id),
+                "day": {"$gte": self.day_of(start_date), "$lte": self.day_of(end_date)}
+            },
+            {"values": 0, "dates": 0}
+        )
+        summaries: Dict[str, Dict[str, Any]] = {}
+        async for bucket in cursor:
+            if not bucket.get("count"):
+                continue
+            summary = summaries.setdefault(bucket["parameter"], {
+                "parameter": bucket["parameter"],
+                "min_value": bucket["min"],
+                "max_value": bucket["max"],
+                "sum": 0.0,
+                "count": 0,
+                "unit": bucket.get("unit") or "",
+                "last_updated": bucket["last"]
+            })
+            summary["min_value"] = min(summary["min_value"], bucket["min"])
+            summary["max_value"] = max(summary["max_value"], bucket["max"])
+            summary["sum"] += bucket["sum"]
+            summary["count"] += bucket["count"]
+            summary["last_updated"] = max(summary["last_updated"], bucket["last"])
+        return [
+            {**{k: v for k, v in s.items() if k != "sum"}, "avg_value": s["sum"] / s["count"]}
+            for s in summaries.values()
+        ]
+
+
+async def _summarize(collection, match: Dict[str, Any], parameter_field: str) -> List[Dict[str, Any]]:
+    """Group the matching readings by parameter with their statistics."""
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": parameter_field,
+            "min_value": {"$min": "$value"},
+            "max_value": {"$max": "$value"},
+            "avg_value": {"$avg": "$value"},
+            "count": {"$sum": 1},
+            "unit": {"$first": "$unit"},
+            "last_updated": {"$max": "$date"}
+        }}
+    ]
+    groups = await collection.aggregate(pipeline).to_list(length=None)
+    return [{**{k: v for k, v in group.items() if k != "_id"}, "parameter": group["_id"]} for group in groups]
+
+
+def _date_range(start_date: Optional[datetime], end_date: Optional[datetime]) -> Dict[str, datetime]:
+    date_query = {}
+    if start_date:
+        date_query["$gte"] = start_date
+    if end_date:
+        date_query["$lte"] = end_date
+    return date_query
+
+
+STORES = {
+    DocumentMeasurementStore.name: DocumentMeasurementStore,
+    TimeSeriesMeasurementStore.name: TimeSeriesMeasurementStore,
+    BucketMeasurementStore.name: BucketMeasurementStore,
+}
+
+
+def get_store(name: Optional[str] = None):
+    """Return the measurement store selected by MEASUREMENTS_STORAGE."""
+    name = (name or settings.MEASUREMENTS_STORAGE).lower()
+    if name not in STORES:
+        raise ValueError(f"Unknown MEASUREMENTS_STORAGE '{name}', expected one of {', '.join(STORES)}")
+    return STORES[name]()
@@ -0,0 +1,94 @@
+"""
+Copy the `measurements` collection into the time-series collection.
+
+Usage:
+    python migrate_measurements.py [--batch-size 1000] [--drop-source]
+
+Then set MEASUREMENTS_STORAGE=timeseries. The copy can be run again: readings
+already present in `measurements_ts` are skipped. Each station's refresh
+time is carried over to its location document so cached readings stay valid.
+"""
+import argparse
+import asyncio
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import settings
+from measurement_store import DocumentMeasurementStore, TimeSeriesMeasurementStore, FETCHED_AT_FIELD
+
+
+async def migrate(db, batch_size: int = 1000, drop_source: bool = False) -> int:
+    """Copy every reading to the time-series collection; returns the number copied."""
+    source = db[DocumentMeasurementStore.collection]
+    store = TimeSeriesMeasurementStore()
+    await store.ensure(db)
+    target = db[store.collection]
+
+    copied = 0
+    fetched_at = {}
+    batch = []
+
+    async def flush():
+        nonlocal copied
+        # Skip readings copied by a previous run
+        existing = set()
+        for location_id in {doc["meta"]["location_id"] for doc in batch}:
+            dates = [doc["date"] for doc in batch if doc["meta"]["location_id"] == location_id]
+            cursor = target.find(
+                {"meta.location_id": location_id, "date": {"$in": dates}},
+                {"meta.parameter": 1, "date": 1}
+            )
+            for doc in await cursor.to_list(length=None):
+                existing.add((location_id, doc["meta"]["parameter"], doc["date"]))
+        new = [
+            doc for doc in batch
+            if (doc["meta"]["location_id"], doc["meta"]["parameter"], doc["date"]) not in existing
+        ]
+        if new:
+            await target.insert_many(new, ordered=False)
+        copied += len(new)
+        batch.clear()
+        print(f"Copied {copied} measurements")
+
+    async for doc in source.find({}).sort([("location_id", 1), ("date", 1)]):
+        if not doc.get("date") or not doc.get("parameter") or doc.get("location_id") is None:
+            continue
+        location_id = str(doc["location_id"])
+        batch.append(store.to_document(location_id, doc))
+        if doc.get("last_fetched"):
+            fetched_at[location_id] = max(fetched_at.get(location_id, doc["last_fetched"]), doc["last_fetched"])
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    for location_id, last_fetched in fetched_at.items():
+        await db.locations.update_one(
+            {"id": int(location_id) if location_id.isdigit() else location_id},
+            {"$max": {FETCHED_AT_FIELD: last_fetched}}
+        )
+
+    if drop_source:
+        await source.drop()
+        print(f"Dropped {DocumentMeasurementStore.collection}")
+    return copied
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrate measurements to a MongoDB time-series collection")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--drop-source", action="store_true", help="Drop the measurements collection afterwards")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    try:
+        copied = await migrate(client[settings.DB_NAME], args.batch_size, args.drop_source)
+        print(f"Done: {copied} measurements copied to {TimeSeriesMeasurementStore.collection}")
+        print("Set MEASUREMENTS_STORAGE=timeseries to use it")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, SerializeAsAny
 from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 
@@ -33,6 +33,24 @@ class Location(BaseModel):
         return self.city or self.locality or "Unknown Location"
 
 
+class LocationWithDistance(Location):
+    distance: Optional[float] = None  # Kilometers from the search point (radius searches)
+
+
+# Slim read model of the list endpoints (fields=summary, see read_models.py)
+class LocationSummary(BaseModel):
+    id: int
+    name: Optional[str] = None
+    city: Optional[str] = None
+    locality: Optional[str] = None
+    country_code: Optional[str] = None
+    coordinates: Optional[Coordinates] = None
+    pollutants: List[str] = Field(default_factory=list)
+    lastUpdated: Optional[datetime] = None
+    last_fetched: Optional[datetime] = None
+    distance: Optional[float] = None
+
+
 class MeasurementSummary(BaseModel):
     parameter: str
     min_value: float
@@ -69,7 +87,8 @@ class ErrorResponse(BaseModel):
 
 
 class PaginatedResponse(BaseModel):
-    total: int
-    page: int
+    total: Optional[int] = None  # Estimated; omitted when not requested
+    page: Optional[int] = None  # Null when paging with a cursor
     size: int
-    items: List[BaseModel]
+    items: List[SerializeAsAny[BaseModel]]  # Serialized with the fields of their own model
+    next_cursor: Optional[str] = None  # Opaque token of the next page
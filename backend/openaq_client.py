@@ -0,0 +1,238 @@
+"""
+Shared HTTP client for the OpenAQ API.
+
+A single pooled httpx.AsyncClient is created on application startup and
+reused by every route, so cache misses no longer pay DNS + TCP + TLS setup.
+Every request waits for the shared rate limiter and is retried with jittered
+backoff on 429/503 and connection errors. iter_pages() streams paginated
+endpoints through the same client.
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dataclasses import dataclass
+from urllib.parse import urlparse
+import asyncio
+import logging
+
+import httpx
+
+from config import settings
+import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+limiter = rate_limiter.create_limiter()
+
+RETRY_STATUS_CODES = {429, 503}
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx needs the optional "h2" package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def endpoint_for(url: str) -> str:
+    """Map an OpenAQ URL to the endpoint name used for timeout lookup."""
+    path = urlparse(url).path.rstrip("/")
+    if "/latest" in path:
+        return "latest"
+    if path.endswith("/measurements"):
+        return "measurements"
+    if path.endswith("/locations"):
+        return "locations"
+    return "default"
+
+
+def get_timeout(endpoint: Optional[str] = None) -> httpx.Timeout:
+    """Return the timeout configured for an OpenAQ endpoint."""
+    read_timeouts = {
+        "locations": settings.OPENAQ_LOCATIONS_TIMEOUT,
+        "measurements": settings.OPENAQ_MEASUREMENTS_TIMEOUT,
+        "latest": settings.OPENAQ_LATEST_TIMEOUT,
+    }
+    read_timeout = read_timeouts.get(endpoint, settings.OPENAQ_TIMEOUT)
+    return httpx.Timeout(read_timeout, connect=settings.OPENAQ_CONNECT_TIMEOUT)
+
+
+def create_client() -> httpx.AsyncClient:
+    """Build a pooled client from the application settings."""
+    http2 = settings.OPENAQ_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("OPENAQ_HTTP2 is enabled but the 'h2' package is not installed, using HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.OPENAQ_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAQ_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.OPENAQ_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=get_timeout(), http2=http2)
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared client, creating it lazily if the startup hook
+    has not run (tests, or apps that only copy the routes).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+async def start_client() -> httpx.AsyncClient:
+    """Create the shared client on application startup."""
+    client = get_client()
+    logger.info(
+        f"OpenAQ client ready (max_connections={settings.OPENAQ_MAX_CONNECTIONS}, "
+        f"max_keepalive={settings.OPENAQ_MAX_KEEPALIVE_CONNECTIONS})"
+    )
+    return client
+
+
+async def close_client():
+    """Close the shared client and its pooled connections on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def request(method: str, url: str, endpoint: Optional[str] = None,
+                  attempt_timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client with the endpoint's timeout.
+
+    Waits for a token from the rate limiter, feeds the response's rate-limit
+    headers back to it, and retries 429/503 responses and connection errors
+    up to OPENAQ_MAX_RETRIES times. The last response is returned as is.
+    `attempt_timeout` bounds each HTTP attempt (asyncio.TimeoutError), not
+    the wait for a token.
+    """
+    kwargs.setdefault("timeout", get_timeout(endpoint or endpoint_for(url)))
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        try:
+            response = await asyncio.wait_for(get_client().request(method, url, **kwargs), attempt_timeout)
+        except RETRY_EXCEPTIONS as e:
+            if attempt >= settings.OPENAQ_MAX_RETRIES:
+                raise
+            delay = rate_limiter.backoff_delay(attempt)
+            logger.warning(f"OpenAQ request to {url} failed ({e!r}), retrying in {delay:.1f}s")
+        else:
+            await limiter.update_from_headers(response.headers, response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= settings.OPENAQ_MAX_RETRIES:
+                return response
+            # After a 429 the limiter itself holds requests until Retry-After
+            retry_after = rate_limiter.retry_after_seconds(response.headers)
+            delay = 0.0 if response.status_code == 429 else (retry_after or rate_limiter.backoff_delay(attempt))
+            logger.warning(f"OpenAQ returned {response.status_code} for {url}, retry {attempt + 1}/{settings.OPENAQ_MAX_RETRIES}")
+        attempt += 1
+        if delay:
+            await asyncio.sleep(delay)
+
+
+async def get(url: str, endpoint: Optional[str] = None, **kwargs) -> httpx.Response:
+    """GET an OpenAQ URL through the shared client."""
+    return await request("GET", url, endpoint=endpoint, **kwargs)
+
+
+@dataclass
+class Page:
+    """One page of OpenAQ results yielded by iter_pages()."""
+    number: int
+    results: List[Dict[str, Any]]
+    fetched: int  # Results yielded so far, this page included
+    found: Any = None  # meta.found as returned by OpenAQ (int, or a string like ">1000")
+    complete: bool = False  # Last page of a stream that ended normally, under max_results
+
+
+def _found_count(found: Any) -> Optional[int]:
+    """Exact total from meta.found, or None when OpenAQ only gives a lower bound."""
+    if isinstance(found, int):
+        return found
+    if isinstance(found, str) and found.isdigit():
+        return int(found)
+    return None
+
+
+async def iter_pages(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    page_size: Optional[int] = None,
+    max_results: Optional[int] = None,
+    endpoint: Optional[str] = None
+) -> AsyncIterator[Page]:
+    """
+    Stream a paginated OpenAQ endpoint page by page.
+
+    The next page is requested as soon as the current one is yielded, so it
+    downloads while the caller validates and stores the current page. Stops
+    at the last page, at meta.found, or after `max_results` results. An error
+    on the first page is raised; later errors end the stream early. Only the
+    last page of a stream that got every result has `complete` set.
+    """
+    params = dict(params or {})
+    page_size = page_size or settings.OPENAQ_PAGE_SIZE
+    max_results = max_results or settings.OPENAQ_PAGINATION_MAX_RESULTS
+
+    async def fetch(page_number: int) -> Dict[str, Any]:
+        response = await get(
+            url,
+            endpoint=endpoint,
+            params={**params, "limit": page_size, "page": page_number},
+            headers=headers
+        )
+        response.raise_for_status()
+        return response.json()
+
+    page_number = 1
+    fetched = 0
+    next_page = asyncio.ensure_future(fetch(page_number))
+    try:
+        while next_page is not None:
+            try:
+                data = await next_page
+            except Exception as e:
+                if page_number == 1:
+                    raise
+                logger.error(f"Error fetching page {page_number} of {url}, stopping after {fetched} results: {e}")
+                return
+            finally:
+                next_page = None
+
+            raw_results = data.get("results", [])
+            results = raw_results[:max_results - fetched]
+            fetched += len(results)
+            found = data.get("meta", {}).get("found")
+            total = _found_count(found)
+
+            has_more = (
+                len(raw_results) >= page_size
+                and fetched < max_results
+                and (total is None or fetched < total)
+            )
+            capped = (
+                fetched >= max_results
+                and len(raw_results) >= page_size
+                and (total is None or fetched < total)
+            )
+            if has_more:
+                next_page = asyncio.ensure_future(fetch(page_number + 1))
+            elif capped:
+                logger.warning(f"Stopped paginating {url} at the cap of {max_results} results (found: {found})")
+
+            complete = not has_more and not capped
+            yield Page(number=page_number, results=results, fetched=fetched, found=found, complete=complete)
+            page_number += 1
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+            await asyncio.gather(next_page, return_exceptions=True)
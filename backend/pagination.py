@@ -0,0 +1,126 @@
+"""
+Cursor pagination of location lists.
+
+Pages are addressed by opaque, URL-safe cursor tokens instead of page
+numbers. A keyset cursor holds the (sort key, id) of the last document of a
+page and the next page starts right after it (`keyset_query`), an index
+seek whose cost does not grow with the page depth like skip() does. Results
+ordered by distance ($geoNear, the in-memory spatial index) use offset
+cursors instead. Page numbers keep working for older clients.
+
+Totals are optional: unfiltered lists use the collection's estimated count
+(read from its metadata), filtered ones a count cached for
+PAGINATION_COUNT_TTL_SECONDS.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import binascii
+import json
+import time
+
+from config import settings
+
+
+class InvalidCursor(ValueError):
+    """A cursor token that cannot be decoded or belongs to another ordering."""
+
+
+def _encode(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(token: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(payload, dict):
+        raise InvalidCursor("Malformed cursor")
+    return payload
+
+
+def encode_cursor(sort_field: str, sort_value: Any, doc_id: Any) -> str:
+    """Keyset cursor pointing after the document (sort_value, doc_id)."""
+    return _encode({"s": sort_field, "k": [sort_value, doc_id]})
+
+
+def encode_offset(offset: int) -> str:
+    """Cursor of a position in an ordering without a usable key (distance)."""
+    return _encode({"o": offset})
+
+
+def decode_cursor(token: str, sort_field: str) -> Tuple[Any, Any]:
+    """(sort_value, id) of a keyset cursor made for `sort_field`."""
+    payload = _decode(token)
+    key = payload.get("k")
+    if payload.get("s") != sort_field or not isinstance(key, list) or len(key) != 2:
+        raise InvalidCursor(f"Cursor does not match the '{sort_field}' ordering")
+    return key[0], key[1]
+
+
+def decode_offset(token: str) -> int:
+    offset = _decode(token).get("o")
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor("Cursor does not match this ordering")
+    return offset
+
+
+def sort_spec(sort_field: str) -> List[Tuple[str, int]]:
+    """Ascending (sort key, id) order; `id` is unique so the order is total."""
+    if sort_field == "id":
+        return [("id", 1)]
+    return [(sort_field, 1), ("id", 1)]
+
+
+def keyset_query(sort_field: str, sort_value: Any, doc_id: Any) -> Dict[str, Any]:
+    """Documents after (sort_value, doc_id) in sort_spec() order."""
+    if sort_field == "id":
+        return {"id": {"$gt": doc_id}}
+    if sort_value is None:
+        # Missing keys sort first: the rest of the nulls, then every non-null key
+        return {"$or": [{sort_field: None, "id": {"$gt": doc_id}}, {sort_field: {"$ne": None}}]}
+    return {"$or": [
+        {sort_field: {"$gt": sort_value}},
+        {sort_field: sort_value, "id": {"$gt": doc_id}}
+    ]}
+
+
+def next_cursor(docs: List[Dict[str, Any]], limit: int, sort_field: str) -> Optional[str]:
+    """Cursor of the page after `docs`, None when it was the last one."""
+    if len(docs) < limit or not docs:
+        return None
+    last = docs[-1]
+    return encode_cursor(sort_field, last.get(sort_field), last["id"])
+
+
+class CountCache:
+    """count_documents() results reused for a few seconds per query."""
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: int = 256):
+        self.ttl = ttl if ttl is not None else settings.PAGINATION_COUNT_TTL_SECONDS
+        self.max_entries = max_entries
+        self._counts: Dict[str, Tuple[float, int]] = {}
+
+    async def count(self, collection, query: Dict[str, Any]) -> int:
+        if not query:
+            # Collection metadata, no scan
+            return await collection.estimated_document_count()
+        key = json.dumps(query, sort_keys=True, default=str)
+        cached = self._counts.get(key)
+        now = time.monotonic()
+        if cached and now - cached[0] < self.ttl:
+            return cached[1]
+        total = await collection.count_documents(query)
+        if len(self._counts) >= self.max_entries:
+            self._counts.pop(next(iter(self._counts)))
+        self._counts[key] = (now, total)
+        return total
+
+    def clear(self):
+        self._counts.clear()
+
+
+# Process-wide cache shared by the location list routes
+count_cache = CountCache()
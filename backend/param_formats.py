@@ -0,0 +1,43 @@
+"""
+Learned OpenAQ parameter format per station.
+
+The /measurements endpoint has accepted the station ID under different
+query parameter names over time. The format that worked last is stored
+on the location document and tried first on later refreshes; the other
+formats are only probed again after it fails.
+"""
+from typing import List, Optional
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Candidate query parameter names, in the historical probing order
+PARAM_FORMATS = ["locations", "location", "id", "entity"]
+
+# Field of the location document holding the learned format
+FORMAT_FIELD = "openaq_param_format"
+
+
+def order_formats(learned: Optional[str] = None) -> List[str]:
+    """Return the formats to try, with the learned one first."""
+    if not learned:
+        return list(PARAM_FORMATS)
+    return [learned] + [f for f in PARAM_FORMATS if f != learned]
+
+
+async def save_format(db, location_id, param_format: Optional[str]):
+    """
+    Store the working format of a station, or forget it when
+    `param_format` is None so the next refresh probes again.
+    """
+    if param_format:
+        update = {"$set": {FORMAT_FIELD: param_format, f"{FORMAT_FIELD}_at": datetime.utcnow()}}
+        logger.info(f"Learned OpenAQ parameter format '{param_format}' for station {location_id}")
+    else:
+        update = {"$unset": {FORMAT_FIELD: "", f"{FORMAT_FIELD}_at": ""}}
+        logger.info(f"Forgot OpenAQ parameter format for station {location_id}")
+    try:
+        await db.locations.update_one({"id": location_id}, update)
+    except Exception as e:
+        logger.error(f"Error saving parameter format for station {location_id}: {e}")
@@ -0,0 +1,193 @@
+"""
+Batched MongoDB writes.
+
+Ingestion builds one UpdateOne per document and sends them with unordered
+bulk_write calls of at most MONGO_BULK_BATCH_SIZE operations, instead of
+awaiting one update_one round trip per document. A failing document is
+reported on its own and does not stop the rest of the batch; duplicate-key
+errors from concurrent upserts of the same key are retried once, at which
+point the document exists and the upsert becomes an update.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+INDEX_CONFLICT_CODES = (85, 86)  # IndexOptionsConflict, IndexKeySpecsConflict
+
+# Idempotency key of a measurement: one document per station, pollutant and date
+MEASUREMENT_KEY = [("location_id", 1), ("parameter", 1), ("date", -1)]
+
+
+@dataclass
+class BulkResult:
+    """Counts of a bulk_upsert() call, summed over its batches."""
+    matched: int = 0
+    modified: int = 0
+    upserted: int = 0
+    inserted: int = 0
+    duplicates: int = 0  # Duplicate-key errors ignored with ignore_duplicates=True
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def written(self) -> int:
+        """Documents inserted or updated."""
+        return self.upserted + self.inserted + self.modified
+
+
+def upsert_op(query: Dict[str, Any], fields: Dict[str, Any]) -> UpdateOne:
+    """UpdateOne that $sets `fields` on the document matching `query`, creating it if needed."""
+    return UpdateOne(query, {"$set": fields}, upsert=True)
+
+
+async def bulk_upsert(
+    collection,
+    operations: List[UpdateOne],
+    batch_size: Optional[int] = None,
+    label: str = "documents",
+    ignore_duplicates: bool = False
+) -> BulkResult:
+    """
+    Write `operations` with unordered bulk_write batches.
+
+    Per-document failures (writeErrors) are logged with the filter of the
+    failing operation and returned in `errors`; a batch that fails entirely
+    is reported once per operation. Operations that hit a duplicate-key
+    error (two upserts racing on a unique key) are retried once, or simply
+    counted with `ignore_duplicates` when the write is already applied (e.g.
+    conditional appends that only match when the value is not stored yet).
+    """
+    result = BulkResult()
+    if not operations:
+        return result
+    batch_size = batch_size or settings.MONGO_BULK_BATCH_SIZE
+
+    duplicates = await _write_batches(collection, operations, batch_size, label, result, retry_duplicates=True)
+    if ignore_duplicates:
+        result.duplicates += len(duplicates)
+    elif duplicates:
+        logger.info(f"Retrying {len(duplicates)} {label} after duplicate-key races")
+        await _write_batches(collection, duplicates, batch_size, label, result, retry_duplicates=False)
+
+    logger.info(
+        f"Bulk upsert of {len(operations)} {label}: {result.upserted + result.inserted} inserted, "
+        f"{result.modified} updated, {result.matched - result.modified + result.duplicates} unchanged, "
+        f"{len(result.errors)} failed"
+    )
+    return result
+
+
+async def _write_batches(
+    collection,
+    operations: List[UpdateOne],
+    batch_size: int,
+    label: str,
+    result: BulkResult,
+    retry_duplicates: bool
+) -> List[UpdateOne]:
+    """Send the batches, add their counts to `result`, return the operations to retry."""
+    to_retry = []
+    for start in range(0, len(operations), batch_size):
+        batch = operations[start:start + batch_size]
+        try:
+            outcome = await collection.bulk_write(batch, ordered=False)
+            result.matched += outcome.matched_count
+            result.modified += outcome.modified_count
+            result.upserted += outcome.upserted_count
+            result.inserted += getattr(outcome, "inserted_count", 0)
+        except BulkWriteError as e:
+            details = e.details or {}
+            result.matched += details.get("nMatched", 0)
+            result.modified += details.get("nModified", 0)
+            result.upserted += details.get("nUpserted", 0)
+            result.inserted += details.get("nInserted", 0)
+            for error in details.get("writeErrors", []):
+                index = error.get("index", 0)
+                if retry_duplicates and error.get("code") == DUPLICATE_KEY and index < len(batch):
+                    to_retry.append(batch[index])
+                    continue
+                op = error.get("op") or {}
+                entry = {
+                    "index": start + index,
+                    "code": error.get("code"),
+                    "message": error.get("errmsg"),
+                    "filter": op.get("q", op)
+                }
+                result.errors.append(entry)
+                logger.error(f"Failed to write {label} {entry['filter']}: {entry['message']} (code {entry['code']})")
+        except Exception as e:
+            logger.error(f"Bulk write of {len(batch)} {label} failed: {e}")
+            result.errors.extend(
+                {"index": start + i, "code": None, "message": str(e), "filter": None}
+                for i in range(len(batch))
+            )
+    return to_retry
+
+
+async def remove_duplicates(collection, keys: List[Tuple[str, int]]) -> int:
+    """
+    Delete documents sharing the same `keys`, keeping the most recently
+    fetched one. Returns the number of deleted documents.
+    """
+    pipeline = [
+        {"$sort": {"last_fetched": -1}},
+        {"$group": {
+            "_id": {field: f"${field}" for field, _ in keys},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    groups = await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    extra_ids = [doc_id for group in groups for doc_id in group["ids"][1:]]
+    if not extra_ids:
+        return 0
+    deleted = 0
+    for start in range(0, len(extra_ids), settings.MONGO_BULK_BATCH_SIZE):
+        outcome = await collection.delete_many({"_id": {"$in": extra_ids[start:start + settings.MONGO_BULK_BATCH_SIZE]}})
+        deleted += outcome.deleted_count
+    logger.warning(f"Removed {deleted} duplicate documents from {collection.name}")
+    return deleted
+
+
+async def ensure_unique_index(collection, keys: List[Tuple[str, int]]):
+    """
+    Create a unique index on `keys`, upgrading an existing non-unique index
+    with the same keys and removing duplicates left by earlier writes.
+    """
+    for _ in range(3):
+        try:
+            await collection.create_index(keys, unique=True)
+            return
+        except OperationFailure as e:
+            if e.code in INDEX_CONFLICT_CODES:
+                # Same keys already indexed without `unique`: replace that index
+                indexes = await collection.index_information()
+                for name, info in indexes.items():
+                    if [tuple(k) for k in info.get("key", [])] == [tuple(k) for k in keys]:
+                        logger.warning(f"Replacing non-unique index {name} on {collection.name}")
+                        await collection.drop_index(name)
+            elif e.code == DUPLICATE_KEY:
+                await remove_duplicates(collection, keys)
+            else:
+                raise
+    logger.error(f"Could not create the unique index {keys} on {collection.name}")
+
+
+def measurement_upsert_op(location_id: str, measurement: Dict[str, Any]) -> UpdateOne:
+    """Upsert of a measurement on its idempotency key."""
+    return upsert_op(
+        {
+            "location_id": location_id,
+            "parameter": measurement["parameter"],
+            "date": measurement["date"]
+        },
+        measurement
+    )
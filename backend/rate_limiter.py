@@ -0,0 +1,199 @@
+"""
+Process-wide rate limiting of OpenAQ calls.
+
+Every request sent through openaq_client first takes a token from a
+token bucket. The bucket adapts its rate to the x-ratelimit-* headers
+returned by OpenAQ and pauses entirely after a 429 (honouring
+Retry-After). With OPENAQ_RATE_LIMIT_STATE_FILE set, the bucket state
+lives in a locked local file shared by every worker process.
+"""
+from typing import Any, Callable, Dict, Mapping, Optional
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, the bucket stays per-process
+    fcntl = None
+
+
+class MemoryStateStore:
+    """Bucket state kept in this process."""
+    shared = False
+
+    def __init__(self):
+        self.state: Dict[str, Any] = {}
+
+    def transact(self, fn: Callable[[Dict[str, Any]], Any]) -> Any:
+        return fn(self.state)
+
+
+class FileStateStore:
+    """Bucket state kept in a JSON file, updated under an exclusive flock."""
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def transact(self, fn: Callable[[Dict[str, Any]], Any]) -> Any:
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw else {}
+                except ValueError:
+                    state = {}
+                result = fn(state)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After (or x-ratelimit-reset) header."""
+    retry_after = _header_float(headers, "retry-after")
+    if retry_after is not None:
+        return max(0.0, retry_after)
+    return _header_float(headers, "x-ratelimit-reset")
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)."""
+    ceiling = min(settings.OPENAQ_BACKOFF_MAX, settings.OPENAQ_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class TokenBucket:
+    """Token bucket whose rate follows the upstream rate-limit headers."""
+
+    def __init__(self, rate: float, capacity: float, store=None):
+        self.max_rate = rate  # Configured rate in tokens per second
+        self.capacity = capacity
+        self.store = store or MemoryStateStore()
+        self._waiting = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests currently waiting for a token in this process."""
+        return self._waiting
+
+    def _refill(self, state: Dict[str, Any], now: float):
+        rate = state.setdefault("rate", self.max_rate)
+        tokens = state.get("tokens", self.capacity)
+        updated = state.get("updated", now)
+        state["tokens"] = min(self.capacity, tokens + max(0.0, now - updated) * rate)
+        state["updated"] = now
+
+    def _take(self, state: Dict[str, Any]) -> float:
+        """Take a token if possible; return how long to wait otherwise."""
+        now = time.time()
+        self._refill(state, now)
+        paused_until = state.get("paused_until", 0)
+        if paused_until > now:
+            return paused_until - now
+        if state["tokens"] >= 1:
+            state["tokens"] -= 1
+            return 0.0
+        return (1 - state["tokens"]) / state["rate"]
+
+    async def _transact(self, fn: Callable[[Dict[str, Any]], Any]) -> Any:
+        if self.store.shared:
+            return await asyncio.to_thread(self.store.transact, fn)
+        return self.store.transact(fn)
+
+    async def acquire(self):
+        """Wait until a token is available."""
+        self._waiting += 1
+        try:
+            while True:
+                wait = await self._transact(self._take)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting -= 1
+
+    async def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds` (e.g. after a 429)."""
+        def apply(state):
+            state["paused_until"] = max(state.get("paused_until", 0), time.time() + seconds)
+        await self._transact(apply)
+        logger.warning(f"OpenAQ rate limit reached, pausing requests for {seconds:.1f}s")
+
+    async def update_from_headers(self, headers: Mapping[str, str], status_code: int):
+        """
+        Adapt the bucket to the x-ratelimit-* headers of a response: the
+        remaining quota is spread over the time left before the reset, and
+        a 429 pauses the bucket until Retry-After.
+        """
+        if status_code == 429:
+            await self.pause(retry_after_seconds(headers) or backoff_delay(0) + 1)
+            return
+
+        remaining = _header_float(headers, "x-ratelimit-remaining")
+        reset = _header_float(headers, "x-ratelimit-reset")
+        if remaining is None or not reset or reset <= 0:
+            return
+
+        def apply(state):
+            now = time.time()
+            self._refill(state, now)
+            state["rate"] = max(0.01, min(self.max_rate, remaining / reset))
+            state["tokens"] = min(state["tokens"], remaining)
+            if remaining <= 0:
+                state["paused_until"] = max(state.get("paused_until", 0), now + reset)
+        await self._transact(apply)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Current state of the bucket for monitoring (the file store is read off the event loop)."""
+        state = await self._transact(lambda s: dict(s))
+        now = time.time()
+        return {
+            "queue_depth": self.queue_depth,
+            "rate_per_second": state.get("rate", self.max_rate),
+            "max_rate_per_second": self.max_rate,
+            "tokens": state.get("tokens", self.capacity),
+            "capacity": self.capacity,
+            "paused_for": max(0.0, state.get("paused_until", 0) - now),
+            "shared": self.store.shared
+        }
+
+
+def create_limiter() -> TokenBucket:
+    """Build the OpenAQ limiter from the application settings."""
+    store = None
+    path = settings.OPENAQ_RATE_LIMIT_STATE_FILE
+    if path:
+        if fcntl is None:
+            logger.warning("OPENAQ_RATE_LIMIT_STATE_FILE is set but file locking is not available, using a per-process limiter")
+        else:
+            store = FileStateStore(os.path.abspath(path))
+    return TokenBucket(
+        rate=settings.OPENAQ_RATE_LIMIT_PER_MINUTE / 60.0,
+        capacity=settings.OPENAQ_RATE_LIMIT_BURST,
+        store=store
+    )
@@ -0,0 +1,90 @@
+"""
+Lightweight read models of locations for the list endpoints.
+
+`fields=summary` (or a comma-separated subset of SUMMARY_FIELDS) makes the
+location lists fetch only those fields with a MongoDB projection, leaving
+out the `parameters` arrays and raw OpenAQ fields, and answer with small
+LocationSummary objects instead of full Location models. Without `fields`
+the endpoints return full locations as before.
+
+Both shapes are declared in the routes' response_model (LocationList,
+LocationWithDistanceList), so OpenAPI documents the summaries. respond()
+sends the summaries itself to leave out the unselected fields; they are
+validated when built as LocationSummary.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from derived_fields import derive_pollutants
+from models import Location, LocationSummary, LocationWithDistance
+
+SUMMARY_FIELDS = [
+    "id", "name", "city", "locality", "country_code", "coordinates",
+    "pollutants", "lastUpdated", "last_fetched", "distance"
+]
+
+# Response models of the list endpoints: full locations, or summaries with fields=
+LocationList = Union[List[Location], List[LocationSummary]]
+LocationWithDistanceList = Union[List[LocationWithDistance], List[LocationSummary]]
+
+# Document fields read for each summary field
+_SOURCE_FIELDS = {"country_code": "country.code", "distance": None}
+
+# Always read: the key (cursors, ordering) and the freshness (cache checks)
+_ALWAYS = ["id", "last_fetched"]
+
+
+class InvalidFields(ValueError):
+    """A `fields` selector naming fields the summaries do not have."""
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Selected summary fields, or None for full locations. Raises
+    InvalidFields on unknown fields.
+    """
+    if not isinstance(fields, str) or not fields.strip() or fields.strip() == "full":
+        return None
+    if fields.strip() == "summary":
+        return list(SUMMARY_FIELDS)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in SUMMARY_FIELDS]
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(SUMMARY_FIELDS)})")
+    return ["id"] + [f for f in selected if f != "id"]
+
+
+def projection(selected: Iterable[str]) -> Dict[str, int]:
+    """MongoDB projection reading only the documents fields behind `selected`."""
+    spec = {"_id": 0}
+    for field in list(_ALWAYS) + list(selected):
+        source = _SOURCE_FIELDS.get(field, field)
+        if source:
+            spec[source] = 1
+    return spec
+
+
+def to_summary(item: Any) -> LocationSummary:
+    """Summary of a projected location document or of a full Location."""
+    if isinstance(item, LocationSummary):
+        return item
+    data = item.model_dump() if isinstance(item, BaseModel) else dict(item)
+    if "pollutants" not in data and "parameters" in data:
+        data.update(derive_pollutants(data))
+    country = data.get("country")
+    if isinstance(country, dict) and "country_code" not in data:
+        data["country_code"] = country.get("code")
+    return LocationSummary(**data)
+
+
+def respond(items: Iterable[Any], selected: List[str], response: Optional[Response] = None) -> JSONResponse:
+    """JSON list of the selected summary fields, keeping the headers set on `response`."""
+    include = set(selected)
+    content = [to_summary(item).model_dump(mode="json", include=include) for item in items]
+    headers = {}
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return JSONResponse(content=content, headers=headers)
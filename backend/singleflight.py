@@ -0,0 +1,80 @@
+"""
+Single-flight coalescing of concurrent upstream refreshes.
+
+When several requests miss the cache for the same key at the same time,
+only the first one runs the refresh (OpenAQ fetch + Mongo write); the
+others await the same result instead of hitting the API again. spawn()
+starts the same shared refresh in the background for stale-while-revalidate.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(endpoint: str, *args: Any) -> tuple:
+    """Build a coalescing key from an endpoint name and normalized arguments."""
+    normalized = tuple(
+        " ".join(arg.split()).casefold() if isinstance(arg, str) else arg
+        for arg in args
+    )
+    return (endpoint,) + normalized
+
+
+class SingleFlight:
+    """Run at most one refresh per key; concurrent callers share its result."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def _start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            logger.info(f"Joining in-flight refresh for {key}")
+        return task
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved when nobody is left awaiting it
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Refresh for {key} failed: {task.exception()}")
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await the refresh for `key`, starting it with `fn()` if none is running.
+
+        The shared task is shielded so that a caller disconnecting does not
+        cancel the refresh for the other callers waiting on it.
+        """
+        return await asyncio.shield(self._start(key, fn))
+
+    def spawn(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """
+        Start the refresh for `key` in the background without awaiting it
+        (stale-while-revalidate). Does nothing if one is already running.
+        """
+        if key in self._inflight:
+            return self._inflight[key]
+        task = self._start(key, fn)
+        task.add_done_callback(lambda t, k=key: self._log_background(k, t))
+        return task
+
+    def _log_background(self, key: Hashable, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background refresh for {key} failed: {task.exception()}")
+
+
+# Process-wide instance shared by the location and measurement routes
+upstream_flight = SingleFlight()
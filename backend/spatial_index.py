@@ -0,0 +1,230 @@
+"""
+In-memory spatial index of the known stations.
+
+Keeps the coordinates of every stored location in memory so map views
+(radius, bounding box and nearest-station queries) are answered without a
+MongoDB round trip. Distances are computed with a vectorized haversine over
+NumPy coordinate arrays when NumPy is installed; otherwise a grid of
+CELL_DEGREES cells narrows radius and box queries to the nearby stations
+before the exact distances are computed in Python. Built from MongoDB on
+startup and updated whenever locations are upserted. Until it is built the
+routes use the 2dsphere queries of geo_queries.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from math import asin, cos, degrees, floor, radians, sin, sqrt
+import heapq
+import logging
+import time
+
+from geo_queries import geo_fields
+
+try:
+    import numpy as np
+except ImportError:  # Optional: pure-Python grid fallback
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+CELL_DEGREES = 1.0
+
+Hit = Tuple[Any, Optional[float]]  # (station id, distance in km)
+
+
+def haversine_km(lat: float, lon: float, lats, lons):
+    """
+    Great-circle distances in km from (lat, lon) to each point of
+    `lats`/`lons`: a NumPy array for NumPy inputs, a list otherwise.
+    """
+    if np is not None and isinstance(lats, np.ndarray):
+        lat1, lon1 = np.radians(lat), np.radians(lon)
+        lat2, lon2 = np.radians(lats), np.radians(lons)
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    lat1, lon1 = radians(lat), radians(lon)
+    cos_lat1 = cos(lat1)
+    distances = []
+    for other_lat, other_lon in zip(lats, lons):
+        lat2, lon2 = radians(other_lat), radians(other_lon)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0))))
+    return distances
+
+
+def _lon_ranges(west: float, east: float) -> List[Tuple[float, float]]:
+    """Longitude ranges of a box; west > east crosses the antimeridian."""
+    if west > east:
+        return [(west, 180.0), (-180.0, east)]
+    return [(west, east)]
+
+
+class SpatialIndex:
+    """Coordinates of the stored stations, queried by distance or box."""
+
+    def __init__(self, cell_degrees: float = CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._slots: Dict[Any, int] = {}  # Station id -> position in the arrays below
+        self._ids: List[Any] = []
+        self._lats: List[float] = []
+        self._lons: List[float] = []
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._arrays = None  # NumPy copies of _lats/_lons, rebuilt after updates
+        self.built = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return floor(lat / self.cell_degrees), floor(lon / self.cell_degrees)
+
+    def add(self, station_id: Any, latitude: float, longitude: float):
+        """Add a station, or move it if its coordinates changed."""
+        slot = self._slots.get(station_id)
+        if slot is None:
+            slot = self._slots[station_id] = len(self._ids)
+            self._ids.append(station_id)
+            self._lats.append(latitude)
+            self._lons.append(longitude)
+        elif (self._lats[slot], self._lons[slot]) == (latitude, longitude):
+            return
+        else:
+            self._cells[self._cell(self._lats[slot], self._lons[slot])].discard(slot)
+            self._lats[slot], self._lons[slot] = latitude, longitude
+        self._cells.setdefault(self._cell(latitude, longitude), set()).add(slot)
+        self._arrays = None
+
+    def add_location(self, doc: Dict[str, Any]):
+        """Index a location document (ignored without valid coordinates)."""
+        point = geo_fields(doc).get("geo")
+        if point is None or doc.get("id") is None:
+            return
+        longitude, latitude = point["coordinates"]
+        self.add(doc["id"], latitude, longitude)
+
+    def _numpy_arrays(self):
+        if self._arrays is None:
+            self._arrays = (np.array(self._lats, dtype=float), np.array(self._lons, dtype=float))
+        return self._arrays
+
+    def _box_slots(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Set[int]:
+        """Slots of the grid cells overlapping a box (a superset of the matches)."""
+        slots: Set[int] = set()
+        min_row, max_row = floor(min_lat / self.cell_degrees), floor(max_lat / self.cell_degrees)
+        for west, east in _lon_ranges(min_lon, max_lon):
+            min_col, max_col = floor(west / self.cell_degrees), floor(east / self.cell_degrees)
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+                # Large box: walk the occupied cells instead of every cell of the box
+                for (row, col), cell in self._cells.items():
+                    if min_row <= row <= max_row and min_col <= col <= max_col:
+                        slots |= cell
+                continue
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    slots |= self._cells.get((row, col), set())
+        return slots
+
+    def _distances(self, latitude: float, longitude: float, slots: Optional[Iterable[int]] = None) -> List[Hit]:
+        """(id, distance) of the given slots, or of every station (pure-Python path)."""
+        indexes = list(range(len(self._ids)) if slots is None else slots)
+        distances = haversine_km(
+            latitude, longitude, [self._lats[i] for i in indexes], [self._lons[i] for i in indexes]
+        )
+        return [(self._ids[i], d) for i, d in zip(indexes, distances)]
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> List[Hit]:
+        """Stations within `radius_km`, nearest first."""
+        if not self._ids:
+            return []
+        if np is not None:
+            lats, lons = self._numpy_arrays()
+            distances = haversine_km(latitude, longitude, lats, lons)
+            matches = np.flatnonzero(distances <= radius_km)
+            matches = matches[np.argsort(distances[matches], kind="stable")]
+            return [(self._ids[i], float(distances[i])) for i in matches]
+        # Narrow the search to the cells of the box enclosing the circle (unless it reaches a pole)
+        slots = None
+        angle = radius_km / EARTH_RADIUS_KM
+        delta_lat = degrees(angle)
+        if abs(latitude) + delta_lat < 90:
+            delta_lon = degrees(asin(sin(angle) / cos(radians(latitude))))
+            west = (longitude - delta_lon + 180) % 360 - 180
+            east = (longitude + delta_lon + 180) % 360 - 180
+            slots = self._box_slots(latitude - delta_lat, west, latitude + delta_lat, east)
+        hits = [hit for hit in self._distances(latitude, longitude, slots) if hit[1] <= radius_km]
+        return sorted(hits, key=lambda hit: hit[1])
+
+    def within_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Any]:
+        """Ids of the stations inside a box (min_lon > max_lon crosses the antimeridian)."""
+        ranges = _lon_ranges(min_lon, max_lon)
+
+        def inside(slot: int) -> bool:
+            lon = self._lons[slot]
+            return min_lat <= self._lats[slot] <= max_lat and any(w <= lon <= e for w, e in ranges)
+
+        if np is not None and self._ids:
+            lats, lons = self._numpy_arrays()
+            mask = (lats >= min_lat) & (lats <= max_lat)
+            lon_mask = np.zeros(len(lons), dtype=bool)
+            for west, east in ranges:
+                lon_mask |= (lons >= west) & (lons <= east)
+            return [self._ids[i] for i in np.flatnonzero(mask & lon_mask)]
+        return [self._ids[slot] for slot in sorted(self._box_slots(min_lat, min_lon, max_lat, max_lon)) if inside(slot)]
+
+    def nearest(self, latitude: float, longitude: float, k: int = 10,
+                max_distance_km: Optional[float] = None) -> List[Hit]:
+        """The `k` closest stations (optionally within `max_distance_km`), nearest first."""
+        if not self._ids or k <= 0:
+            return []
+        if np is not None:
+            lats, lons = self._numpy_arrays()
+            distances = haversine_km(latitude, longitude, lats, lons)
+            if k < len(distances):
+                candidates = np.argpartition(distances, k - 1)[:k]
+            else:
+                candidates = np.arange(len(distances))
+            hits = sorted(((self._ids[i], float(distances[i])) for i in candidates), key=lambda hit: hit[1])
+        elif max_distance_km is not None:
+            return self.within_radius(latitude, longitude, max_distance_km)[:k]
+        else:
+            hits = heapq.nsmallest(k, self._distances(latitude, longitude), key=lambda hit: hit[1])
+        if max_distance_km is not None:
+            hits = [hit for hit in hits if hit[1] <= max_distance_km]
+        return hits
+
+    def clear(self):
+        self._slots.clear()
+        self._ids.clear()
+        self._lats.clear()
+        self._lons.clear()
+        self._cells.clear()
+        self._arrays = None
+        self.built = False
+
+    async def build(self, db):
+        """(Re)build the index from the stored locations."""
+        start = time.perf_counter()
+        self.clear()
+        cursor = db.locations.find({}, {"id": 1, "coordinates": 1, "_id": 0})
+        async for doc in cursor:
+            self.add_location(doc)
+        self.built = True
+        logger.info(f"Spatial index built with {len(self)} stations in {time.perf_counter() - start:.2f}s")
+
+
+async def fetch_hits(collection, hits: List[Hit], projection: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    Location documents of index hits, in hit order, with their `distance`.
+    One indexed `id` lookup for the whole page.
+    """
+    if not hits:
+        return []
+    distances = dict(hits)
+    query = {"id": {"$in": list(distances)}}
+    cursor = collection.find(query, projection) if projection else collection.find(query)
+    docs = await cursor.to_list(length=len(hits))
+    by_id = {doc["id"]: {**doc, "distance": distances[doc["id"]]} for doc in docs}
+    return [by_id[station_id] for station_id, _ in hits if station_id in by_id]
+
+
+# Process-wide index shared by the location routes
+spatial_index = SpatialIndex()
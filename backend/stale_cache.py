@@ -0,0 +1,53 @@
+"""
+Stale-while-revalidate helpers.
+
+An entry older than its TTL but younger than CACHE_MAX_STALENESS_HOURS is
+still served immediately, while a background refresh updates MongoDB for
+the next request. The X-Cache-Status and Age response headers tell clients
+how old the data they got is.
+"""
+from typing import Iterable, Optional
+from datetime import datetime, timedelta
+
+from fastapi import Response
+
+from config import settings
+
+HIT = "HIT"      # Within the TTL
+STALE = "STALE"  # Past the TTL, served while a refresh runs in the background
+MISS = "MISS"    # Fetched from OpenAQ during the request
+
+
+def max_staleness() -> timedelta:
+    """Oldest data that may still be served without waiting for OpenAQ."""
+    return timedelta(hours=settings.CACHE_MAX_STALENESS_HOURS)
+
+
+def newest(dates: Iterable[Optional[datetime]]) -> Optional[datetime]:
+    """Most recent fetch time of a set of cached documents."""
+    return max((d for d in dates if d), default=None)
+
+
+def classify(last_fetched: Optional[datetime], ttl: timedelta) -> Optional[str]:
+    """
+    HIT when `last_fetched` is within `ttl`, STALE when it can still be served
+    while revalidating, None when the caller has to wait for a refresh.
+    """
+    if not last_fetched:
+        return None
+    age = datetime.utcnow() - last_fetched
+    if age < ttl:
+        return HIT
+    if settings.STALE_WHILE_REVALIDATE and age < max_staleness():
+        return STALE
+    return None
+
+
+def set_headers(response: Optional[Response], cache_status: str, last_fetched: Optional[datetime] = None):
+    """Add X-Cache-Status and Age headers to a route's response."""
+    if response is None:
+        return
+    response.headers["X-Cache-Status"] = cache_status
+    if last_fetched:
+        age = max(0, int((datetime.utcnow() - last_fetched).total_seconds()))
+        response.headers["Age"] = str(age)
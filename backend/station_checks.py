@@ -0,0 +1,60 @@
+"""
+Cache of OpenAQ station-existence checks.
+
+Before refreshing measurements, get_measurements verifies that a station
+still exists upstream (by ID, then by name). The outcome is stored in the
+`station_checks` collection with its own TTL, including negative results
+and the new ID of renamed stations, so the check runs about once a day
+instead of on every refresh.
+"""
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "station_checks"
+
+
+async def ensure_indexes(db):
+    """Create the lookup index and let MongoDB expire old checks."""
+    await db[COLLECTION].create_index("location_id", unique=True)
+    await db[COLLECTION].create_index("expires_at", expireAfterSeconds=0)
+
+
+async def get_check(db, location_id: str) -> Optional[Dict[str, Any]]:
+    """Return the unexpired check of a station, or None."""
+    try:
+        return await db[COLLECTION].find_one({
+            "location_id": str(location_id),
+            "expires_at": {"$gt": datetime.utcnow()}
+        })
+    except Exception as e:
+        logger.error(f"Error reading station check for {location_id}: {e}")
+        return None
+
+
+async def save_check(db, location_id: str, exists: bool, resolved_id: Optional[str] = None):
+    """
+    Store the outcome of a station check. Negative results expire sooner
+    than positive ones; `resolved_id` is the ID to use for renamed stations.
+    """
+    now = datetime.utcnow()
+    hours = settings.STATION_CHECK_TTL_HOURS if exists else settings.STATION_CHECK_NEGATIVE_TTL_HOURS
+    try:
+        await db[COLLECTION].update_one(
+            {"location_id": str(location_id)},
+            {
+                "$set": {
+                    "exists": exists,
+                    "resolved_id": str(resolved_id or location_id),
+                    "checked_at": now,
+                    "expires_at": now + timedelta(hours=hours)
+                }
+            },
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error saving station check for {location_id}: {e}")
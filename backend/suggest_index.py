@@ -0,0 +1,180 @@
+"""
+In-memory autocomplete index of city and locality names.
+
+Built from MongoDB on startup and updated whenever locations are upserted,
+so /api/cities/suggest answers without a database round trip. A station
+renamed to another city leaves its old name. The stations a complete city
+refresh no longer returns are deleted from MongoDB and pruned from the
+index; a name is suggested as long as one station still has it. Names are
+matched on their normalized form (see derived_fields.normalize): prefix
+matches first, then fuzzy matches by trigram similarity for typos and
+partial words. Until the index is built the routes fall back to MongoDB.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+import logging
+import time
+
+from derived_fields import normalize
+
+logger = logging.getLogger(__name__)
+
+IGNORED_NAMES = {"", "unknown"}
+MIN_SIMILARITY = 0.3
+
+
+@dataclass
+class _Entry:
+    name: str  # Display name (first spelling seen)
+    is_city: bool = False  # Cities rank before localities, like the Mongo queries did
+    stations: Set[Any] = field(default_factory=set)
+
+
+def trigrams(key: str) -> Set[str]:
+    """Trigrams of a padded normalized name ("  pa", " par", "ari", ...)."""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """Prefix + trigram index over distinct city and locality names."""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._keys: List[str] = []  # Sorted normalized names, for prefix ranges
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._station_keys: Dict[Any, Set[str]] = {}  # Names of each station
+        self.built = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, name: Optional[str], is_city: bool = True, station_id: Any = None):
+        """Add a name (or one more station for an existing name)."""
+        key = normalize(name)
+        if not key or key in IGNORED_NAMES:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(name=" ".join(name.split()))
+            insort(self._keys, key)
+            for gram in trigrams(key):
+                self._trigrams.setdefault(gram, set()).add(key)
+        entry.is_city = entry.is_city or is_city
+        if station_id is not None:
+            entry.stations.add(station_id)
+            self._station_keys.setdefault(station_id, set()).add(key)
+
+    def _discard(self, key: str, station_id: Any):
+        """Remove a station from a name, and the name once it has no station left."""
+        self._station_keys.get(station_id, set()).discard(key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.stations.discard(station_id)
+        if entry.stations:
+            return
+        del self._entries[key]
+        del self._keys[bisect_left(self._keys, key)]
+        for gram in trigrams(key):
+            keys = self._trigrams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[gram]
+
+    def add_location(self, doc: Dict[str, Any]):
+        """Index the city and locality of a location document (replacing its previous names)."""
+        station_id = doc.get("id")
+        if station_id is not None:
+            current = {normalize(doc.get("city")), normalize(doc.get("locality"))}
+            for key in self._station_keys.get(station_id, set()) - current:
+                self._discard(key, station_id)
+        self.add(doc.get("city"), is_city=True, station_id=station_id)
+        self.add(doc.get("locality"), is_city=False, station_id=station_id)
+
+    def remove_station(self, station_id: Any):
+        """Forget a station; names left without stations are no longer suggested."""
+        for key in list(self._station_keys.pop(station_id, ())):
+            self._discard(key, station_id)
+
+    def prune_city(self, city: Optional[str], station_ids: Iterable[Any]):
+        """
+        After a refresh of `city` returned `station_ids`, remove the other
+        stations indexed under that name.
+        """
+        entry = self._entries.get(normalize(city))
+        if entry is None:
+            return
+        for station_id in entry.stations - set(station_ids):
+            self.remove_station(station_id)
+
+    def _rank(self, key: str) -> Tuple[bool, int, str]:
+        entry = self._entries[key]
+        return (not entry.is_city, -len(entry.stations), key)
+
+    def _prefix_matches(self, query: str) -> List[str]:
+        start = bisect_left(self._keys, query)
+        matches = []
+        for key in self._keys[start:]:
+            if not key.startswith(query):
+                break
+            matches.append(key)
+        return matches
+
+    def _fuzzy_matches(self, query: str, exclude: Set[str]) -> List[str]:
+        query_grams = trigrams(query)
+        shared: Dict[str, int] = {}
+        for gram in query_grams:
+            for key in self._trigrams.get(gram, ()):
+                if key not in exclude:
+                    shared[key] = shared.get(key, 0) + 1
+        scored = []
+        for key, count in shared.items():
+            # Dice coefficient, with a bonus when the query appears inside the name
+            score = 2 * count / (len(query_grams) + len(trigrams(key)))
+            if query in key:
+                score += 0.5
+            if score >= MIN_SIMILARITY:
+                scored.append((-score, self._rank(key), key))
+        return [key for _, _, key in sorted(scored)]
+
+    def suggest(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Names matching `query`: the exact name, then prefix matches (cities
+        first, then by number of stations), then fuzzy matches by similarity.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        prefix = sorted(self._prefix_matches(key), key=lambda k: (k != key, *self._rank(k)))
+        results = prefix[:limit]
+        if len(results) < limit:
+            results += self._fuzzy_matches(key, exclude=set(prefix))[:limit - len(results)]
+        return [self._entries[k].name for k in results]
+
+    def clear(self):
+        self._entries.clear()
+        self._keys.clear()
+        self._trigrams.clear()
+        self._station_keys.clear()
+        self.built = False
+
+    def load(self, docs: Iterable[Dict[str, Any]]):
+        for doc in docs:
+            self.add_location(doc)
+
+    async def build(self, db):
+        """(Re)build the index from the stored locations."""
+        start = time.perf_counter()
+        self.clear()
+        cursor = db.locations.find({}, {"id": 1, "city": 1, "locality": 1, "_id": 0})
+        async for doc in cursor:
+            self.add_location(doc)
+        self.built = True
+        logger.info(f"Suggestion index built with {len(self)} names in {time.perf_counter() - start:.2f}s")
+
+
+# Process-wide index shared by the suggestion routes
+suggest_index = SuggestIndex()
@@ -78,3 +78,13 @@ def sample_measurements() -> Dict[str, Any]:
             "is_demo": False
         }
     ]
+
+# Limiteur OpenAQ sans attente pour que les tests ne soient pas ralentis
+@pytest.fixture(autouse=True)
+def fast_rate_limiter(monkeypatch):
+    """Remplace le limiteur partagé par un limiteur en mémoire très permissif"""
+    import openaq_client
+    from rate_limiter import TokenBucket
+    monkeypatch.setattr(openaq_client, "limiter", TokenBucket(rate=1000.0, capacity=1000))
+    monkeypatch.setattr(settings, "OPENAQ_BACKOFF_BASE", 0.001)
+    return openaq_client.limiter
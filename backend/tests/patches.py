@@ -4,9 +4,12 @@ Ce fichier contient des fonctions qui peuvent remplacer
 des méthodes dans l'application pendant les tests.
 """
 from typing import Dict, Any, List
+from types import SimpleNamespace
 import json
 from datetime import datetime
 from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 # Fonction de remplacement qui ne nécessite pas d'await
 def mock_db_find_one(collection, query: Dict) -> Dict:
@@ -39,6 +42,31 @@ class MockCursor:
             return self.docs
         return self.docs[:length]
 
+    def skip(self, count):
+        """Mock pour skip."""
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count):
+        """Mock pour limit (0 = sans limite)."""
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    def sort(self, key, direction=1):
+        """Mock pour sort (clé simple ou liste de (clé, sens))."""
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda doc: (doc.get(field) is None, doc.get(field)), reverse=order == -1)
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
 # Fonction pour convertir les documents MongoDB en JSON sérialisable
 def json_serialize(obj):
     """Convertit un objet MongoDB en JSON sérialisable."""
@@ -47,3 +75,61 @@ def json_serialize(obj):
     elif isinstance(obj, datetime):
         return obj.isoformat()
     raise TypeError(f"Type non sérialisable: {type(obj)}")
+
+class AsyncMockCollection:
+    """Enveloppe asynchrone autour d'une collection mongomock (API de Motor)."""
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in ("find", "aggregate"):
+            return lambda *args, **kwargs: MockCursor(list(attr(*args, **kwargs)))
+        if name == "bulk_write":
+            return self._bulk_write
+        if callable(attr):
+            async def wrapper(*args, **kwargs):
+                return attr(*args, **kwargs)
+            return wrapper
+        return attr
+
+    async def _bulk_write(self, operations, ordered=True):
+        """bulk_write opération par opération (celui de mongomock ne gère pas pymongo 4.x)."""
+        result = SimpleNamespace(matched_count=0, modified_count=0, upserted_count=0, inserted_count=0)
+        write_errors = []
+        for index, op in enumerate(operations):
+            try:
+                if isinstance(op, InsertOne):
+                    self._collection.insert_one(dict(op._doc))
+                    result.inserted_count += 1
+                elif isinstance(op, UpdateOne):
+                    outcome = self._collection.update_one(op._filter, op._doc, upsert=op._upsert)
+                    result.matched_count += outcome.matched_count
+                    result.modified_count += outcome.modified_count
+                    result.upserted_count += 1 if outcome.upserted_id is not None else 0
+                elif isinstance(op, DeleteMany):
+                    self._collection.delete_many(op._filter)
+            except DuplicateKeyError as e:
+                write_errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": {}})
+        if write_errors:
+            raise BulkWriteError({
+                "nMatched": result.matched_count, "nModified": result.modified_count,
+                "nUpserted": result.upserted_count, "nInserted": result.inserted_count,
+                "writeErrors": write_errors
+            })
+        return result
+
+class AsyncMockDatabase:
+    """Base mongomock dont les collections s'utilisent avec await."""
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return AsyncMockCollection(self._db[name])
+
+    async def create_collection(self, name, **kwargs):
+        """Les options (timeseries...) sont ignorées par mongomock."""
+        return AsyncMockCollection(self._db.create_collection(name))
+
+    def __getitem__(self, name):
+        return AsyncMockCollection(self._db[name])
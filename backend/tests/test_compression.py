@@ -0,0 +1,87 @@
+# backend/tests/test_compression.py
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from httpx import ASGITransport, AsyncClient
+
+import compression
+from compression import CompressedCache, CompressionMiddleware
+
+
+def test_choose_encoding(monkeypatch):
+    """Test le choix de l'encodage selon Accept-Encoding"""
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.choose_encoding(None) is None
+    assert compression.choose_encoding("gzip, deflate, br") == "gzip"
+    assert compression.choose_encoding("identity") is None
+    assert compression.choose_encoding("gzip;q=0, *") is None
+    assert compression.choose_encoding("*") == "gzip"
+
+    monkeypatch.setattr(compression, "brotli", object())
+    assert compression.choose_encoding("gzip, br") == "br"
+    assert compression.choose_encoding("gzip, br;q=0.5") == "gzip"
+
+
+def test_compressed_cache_reuses_bodies():
+    """Test que le même corps n'est compressé qu'une fois et que le cache reste borné"""
+    cache = CompressedCache(max_bytes=200)
+    body = b'{"value": 1.0}' * 200
+    first = cache.get(body, "gzip")
+    assert gzip.decompress(first) == body
+    assert cache.get(body, "gzip") is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    for i in range(20):
+        cache.get(f"other body {i}".encode() * 100, "gzip")
+    assert cache._size <= 200
+    assert cache.get(body, "gzip") is not first
+
+
+@pytest.fixture
+def compressed_app():
+    app = FastAPI()
+
+    @app.get("/big")
+    async def big():
+        return [{"location": "Paris Centre", "value": i} for i in range(200)]
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/text")
+    async def text():
+        return PlainTextResponse("x" * 5000, headers={"Content-Encoding": "identity"})
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"{" * 2000, b"}" * 2000]), media_type="application/json")
+
+    app.add_middleware(CompressionMiddleware, cache=CompressedCache())
+    return app
+
+
+@pytest.mark.asyncio
+async def test_middleware(compressed_app):
+    """Test la compression des grosses réponses JSON seulement"""
+    transport = ASGITransport(app=compressed_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/big", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert int(response.headers["Content-Length"]) < len(response.content)
+        assert response.json()[199]["value"] == 199
+
+        response = await client.get("/big", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert len(response.json()) == 200
+
+        for path in ("/small", "/stream"):
+            response = await client.get(path, headers={"Accept-Encoding": "gzip"})
+            assert response.status_code == 200
+            assert "Content-Encoding" not in response.headers
+        response = await client.get("/text", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "identity"
+        assert response.text == "x" * 5000
@@ -0,0 +1,95 @@
+# backend/tests/test_derived_fields.py
+import pytest
+
+import derived_fields
+from derived_fields import normalize, derive_location_fields
+from tests.patches import AsyncMockDatabase
+
+
+def test_normalize():
+    """Test la normalisation : casse, accents et espaces"""
+    assert normalize("  Saint-Étienne ") == "saint-etienne"
+    assert normalize("MÜNCHEN") == "munchen"
+    assert normalize("São   Paulo") == "sao paulo"
+    assert normalize(None) is None
+
+
+def test_derive_location_fields(sample_location):
+    """Test le calcul des clés de recherche d'une station"""
+    fields = derive_location_fields({**sample_location, "locality": "Île-de-France"})
+    assert fields == {"city_key": "test city", "locality_key": "ile-de-france", "name_key": "test station"}
+
+
+def test_queries_escape_user_input(mock_mongodb, sample_location):
+    """Test les requêtes exactes et par préfixe, avec échappement des regex"""
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": 1, "city": "Paris", **derive_location_fields({"city": "Paris", "name": "A"})},
+        {**sample_location, "id": 2, "city": "Pärnu", **derive_location_fields({"city": "Pärnu", "name": "B"})},
+        {**sample_location, "id": 3, "city": "P.O. Box", **derive_location_fields({"city": "P.O. Box", "name": "C"})},
+    ])
+
+    def ids(query):
+        return sorted(doc["id"] for doc in mock_mongodb.locations.find(query))
+
+    assert ids(derived_fields.city_query("PARIS")) == [1]
+    assert ids(derived_fields.city_prefix_query("pa")) == [1, 2]
+    assert ids(derived_fields.city_prefix_query("P.O")) == [3]
+    assert ids(derived_fields.city_prefix_query(".*")) == []
+
+
+@pytest.mark.asyncio
+async def test_backfill(mock_mongodb, sample_location):
+    """Test l'ajout des clés aux stations enregistrées avant leur introduction"""
+    mock_mongodb.locations.insert_one({**sample_location, "city": "Zürich"})
+    db = AsyncMockDatabase(mock_mongodb)
+
+    assert await derived_fields.backfill(db) == 1
+    assert mock_mongodb.locations.find_one({"city_key": "zurich"})["name_key"] == "test station"
+    assert await derived_fields.backfill(db) == 0
+
+
+def test_pollutant_keys():
+    """Test la normalisation des paramètres quelle que soit leur forme"""
+    assert derived_fields.normalize_parameter("PM2.5") == "pm25"
+    assert derived_fields.normalize_parameter("NO₂") == "no2"
+    assert derived_fields.pollutant_keys([
+        "pm25", {"parameter": "PM2.5"}, {"parameter": {"name": "no2"}}, {"name": "O3"}, {"unit": "µg/m³"}, None
+    ]) == ["pm25", "no2", "o3"]
+    assert derived_fields.derive_pollutants({}) == {"pollutants": []}
+
+
+def test_pollutant_query(mock_mongodb, sample_location):
+    """Test le filtre $in / $all sur les polluants"""
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": 1, **derived_fields.derive_pollutants({"parameters": ["pm25", "no2"]})},
+        {**sample_location, "id": 2, **derived_fields.derive_pollutants({"parameters": [{"parameter": "pm25"}]})},
+        {**sample_location, "id": 3, **derived_fields.derive_pollutants({"parameters": ["o3"]})},
+    ])
+
+    def ids(query):
+        return sorted(doc["id"] for doc in mock_mongodb.locations.find(query))
+
+    assert ids(derived_fields.pollutant_query(["PM2.5", "o3"])) == [1, 2, 3]
+    assert ids(derived_fields.pollutant_query(["pm25", "no2"], match_all=True)) == [1]
+    assert ids(derived_fields.pollutant_query(["so2"])) == []
+
+
+@pytest.mark.asyncio
+async def test_parameters_filter_route(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test que parameters= de /api/locations filtre dans MongoDB avant la pagination"""
+    from main import app
+
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": i, "parameters": [{"parameter": "o3"}] if i % 2 else sample_location["parameters"]}
+        for i in range(1, 7)
+    ])
+    db = AsyncMockDatabase(mock_mongodb)
+    await derived_fields.backfill(db)
+    monkeypatch.setattr(app, "mongodb", db)
+
+    response = await async_client.get("/api/locations", params={"parameters": "PM2.5,so2", "limit": 2, "page": 2})
+    assert response.status_code == 200
+    assert [loc["id"] for loc in response.json()] == [6]
+
+    response = await async_client.get("/api/locations", params={"parameters": "pm25,o3", "all_parameters": True})
+    assert response.json() == []
@@ -0,0 +1,91 @@
+# backend/tests/test_fast_json.py
+import json
+from datetime import datetime
+from typing import List
+
+import pytest
+from fastapi import Response
+
+import bench_serialization
+import fast_json
+from config import settings
+from main import app
+from models import Measurement
+from tests.patches import AsyncMockDatabase
+
+
+def test_fast_path_matches_default_path():
+    """Test que le chemin rapide produit le même JSON que FastAPI"""
+    docs = bench_serialization.make_documents(50)
+    assert json.loads(bench_serialization.fast_path(docs)) == json.loads(bench_serialization.default_path(docs))
+
+
+def test_from_documents_skips_invalid():
+    """Test la validation groupée, avec repli document par document"""
+    docs = bench_serialization.make_documents(3)
+    docs[1] = {**docs[1], "value": "not a number"}
+    models = fast_json.from_documents(Measurement, docs)
+    assert [m.parameter for m in models] == ["pm25", "no2"]
+
+
+def test_respond_keeps_headers():
+    """Test la réponse sérialisée une seule fois, avec les en-têtes déjà posés"""
+    response = Response()
+    response.headers["X-Cache-Status"] = "HIT"
+    measurements = fast_json.from_documents(Measurement, bench_serialization.make_documents(2))
+
+    fast = fast_json.respond(measurements, List[Measurement], response)
+    assert fast.headers["X-Cache-Status"] == "HIT"
+    assert json.loads(fast.body)[0]["date"] == measurements[0].date.isoformat()
+    assert fast_json.dumps({"at": datetime(2024, 1, 2, 3, 4, 5)}) == b'{"at":"2024-01-02T03:04:05"}'
+
+
+@pytest.mark.asyncio
+async def test_stored_measurements_fast_json(async_client, mock_mongodb, sample_measurements, monkeypatch):
+    """Test /api/stored-measurements avec et sans FAST_JSON"""
+    mock_mongodb.measurements.insert_many([{**m, "last_fetched": datetime.utcnow()} for m in sample_measurements])
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+
+    monkeypatch.setattr(settings, "FAST_JSON", False)
+    default = await async_client.get(f"/api/stored-measurements/{sample_measurements[0]['location']}")
+    monkeypatch.setattr(settings, "FAST_JSON", True)
+    fast = await async_client.get(f"/api/stored-measurements/{sample_measurements[0]['location']}")
+
+    assert fast.status_code == 200
+    assert default.json()
+    assert fast.json() == default.json()
+
+
+@pytest.mark.asyncio
+async def test_miss_responses_fast_json(async_client, mock_mongodb, sample_location, sample_measurements, monkeypatch):
+    """Test que FAST_JSON s'applique aussi aux réponses rafraîchies depuis OpenAQ"""
+    import main
+    from models import Location, LocationResponse
+
+    mock_mongodb.locations.insert_one({**sample_location, "last_fetched": datetime.utcnow()})
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+    location = Location(**sample_location)
+    measurements = [Measurement(**m, last_fetched=datetime.utcnow()) for m in sample_measurements]
+
+    async def fake_refresh_locations(city, cached_locations):
+        return [location]
+
+    async def fake_refresh_measurements(location, openaq_id, cached_measurements, learned_format=None):
+        return LocationResponse(location=location, measurements=measurements, measurements_summary=[])
+
+    monkeypatch.setattr(main, "_refresh_locations", fake_refresh_locations)
+    monkeypatch.setattr(main, "_refresh_measurements", fake_refresh_measurements)
+    spy = []
+    respond = fast_json.respond
+    monkeypatch.setattr(fast_json, "respond", lambda *args, **kwargs: spy.append(args[0]) or respond(*args, **kwargs))
+
+    bodies = {}
+    for fast in (False, True):
+        monkeypatch.setattr(settings, "FAST_JSON", fast)
+        cities = await async_client.get("/api/locations/Nowhere", params={"force_refresh": True})
+        station = await async_client.get(f"/api/measurements/{sample_location['id']}", params={"force_refresh": True})
+        assert cities.headers["X-Cache-Status"] == station.headers["X-Cache-Status"] == "MISS"
+        bodies[fast] = (cities.json(), station.json())
+
+    assert len(spy) == 2
+    assert bodies[True] == bodies[False]
@@ -0,0 +1,131 @@
+# backend/tests/test_geo_queries.py
+from types import SimpleNamespace
+
+import pytest
+
+import geo_queries
+from main import app
+from tests.patches import AsyncMockDatabase, MockCursor
+
+
+def test_geo_fields(sample_location):
+    """Test le point GeoJSON d'une station (longitude en premier)"""
+    assert geo_queries.geo_fields(sample_location) == {
+        "geo": {"type": "Point", "coordinates": [10.0, 50.0]}
+    }
+    assert geo_queries.geo_fields({"coordinates": {"latitude": None, "longitude": 2.0}}) == {}
+    assert geo_queries.geo_fields({"coordinates": {"latitude": 95.0, "longitude": 2.0}}) == {}
+    assert geo_queries.geo_fields({}) == {}
+
+
+def test_near_pipeline_paginates_after_filter():
+    """Test que $geoNear filtre et trie avant la pagination"""
+    pipeline = geo_queries.near_pipeline({"country.code": "FR"}, 48.85, 2.35, 5, skip=20, limit=10)
+
+    near = pipeline[0]["$geoNear"]
+    assert near["near"] == {"type": "Point", "coordinates": [2.35, 48.85]}
+    assert near["maxDistance"] == 5000
+    assert near["distanceMultiplier"] == 0.001
+    assert near["query"] == {"country.code": "FR"}
+    assert pipeline[1:] == [{"$skip": 20}, {"$limit": 10}]
+
+
+def test_bbox_query():
+    """Test les boîtes planes $box, y compris à travers l'antiméridien"""
+    assert geo_queries.bbox_query(48.0, 2.0, 49.0, 3.0) == {
+        "geo.coordinates": {"$geoWithin": {"$box": [[2.0, 48.0], [3.0, 49.0]]}}
+    }
+
+    query = geo_queries.bbox_query(-20.0, 170.0, -10.0, -170.0)
+    assert query["geo.coordinates"]["$geoWithin"]["$box"] == [[-180.0, -20.0], [180.0, -10.0]]
+    assert query["geo.coordinates.0"] == {"$not": {"$gt": -170.0, "$lt": 170.0}}
+
+    assert geo_queries.bbox_query(-10.0, -180.0, 10.0, 180.0) == {
+        "geo.coordinates": {"$geoWithin": {"$box": [[-180.0, -10.0], [180.0, 10.0]]}}
+    }
+    assert geo_queries.bbox_query(49.0, 2.0, 48.0, 3.0) is None
+
+
+def box_matches(query, longitude, latitude):
+    """Évalue un filtre de bbox_query comme MongoDB ($box plan, bornes incluses)"""
+    (west, south), (east, north) = query["geo.coordinates"]["$geoWithin"]["$box"]
+    inside = west <= longitude <= east and south <= latitude <= north
+    excluded = query.get("geo.coordinates.0", {}).get("$not")
+    if excluded:
+        inside = inside and not (excluded["$gt"] < longitude < excluded["$lt"])
+    return inside
+
+
+def test_wide_high_latitude_bbox_matches_spatial_index():
+    """Test qu'une large boîte à 50°N sélectionne les mêmes stations que l'index en mémoire"""
+    from spatial_index import SpatialIndex
+
+    index = SpatialIndex()
+    points = {}
+    for i, (lat, lon) in enumerate(
+        (lat, lon) for lat in (49.9, 50.1, 55.9, 56.1) for lon in (-29.0, -10.0, 0.0, 15.0, 29.0, 31.0)
+    ):
+        points[i] = (lat, lon)
+        index.add(i, lat, lon)
+
+    for box in ((50.0, -30.0, 56.0, 30.0), (50.0, 20.0, 56.0, -20.0)):
+        query = geo_queries.bbox_query(*box)
+        expected = sorted(index.within_bbox(*box))
+        assert expected
+        assert sorted(i for i, (lat, lon) in points.items() if box_matches(query, lon, lat)) == expected
+
+
+@pytest.mark.asyncio
+async def test_backfill(mock_mongodb, sample_location):
+    """Test l'ajout du point GeoJSON aux stations existantes"""
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": 1},
+        {**sample_location, "id": 2, "coordinates": {"latitude": 123.0, "longitude": 0.0}},
+    ])
+    db = AsyncMockDatabase(mock_mongodb)
+
+    assert await geo_queries.backfill(db) == 1
+    assert mock_mongodb.locations.find_one({"id": 1})["geo"]["coordinates"] == [10.0, 50.0]
+    assert "geo" not in mock_mongodb.locations.find_one({"id": 2})
+    assert await geo_queries.backfill(db) == 0
+
+
+class RecordingLocations:
+    """Collection qui enregistre les requêtes spatiales (non supportées par mongomock)"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipelines = []
+        self.queries = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return MockCursor(self.docs)
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return MockCursor(list(self.docs))
+
+
+@pytest.mark.asyncio
+async def test_radius_and_bbox_routes(async_client, sample_location, monkeypatch):
+    """Test que /api/locations passe le rayon et la boîte à MongoDB et renvoie la distance"""
+    locations = RecordingLocations([{**sample_location, "distance": 1.25}])
+    monkeypatch.setattr(app, "mongodb", SimpleNamespace(locations=locations), raising=False)
+
+    response = await async_client.get("/api/locations", params={
+        "latitude": 50.0, "longitude": 10.0, "radius": 3, "country": "tst", "page": 2, "limit": 5
+    })
+    assert response.status_code == 200
+    assert response.json()[0]["distance"] == 1.25
+    near = locations.pipelines[0][0]["$geoNear"]
+    assert near["maxDistance"] == 3000
+    assert near["query"] == {"country.code": "TST"}
+    assert locations.pipelines[0][1:] == [{"$skip": 5}, {"$limit": 5}]
+
+    response = await async_client.get("/api/locations", params={
+        "min_lat": 49, "min_lon": 9, "max_lat": 51, "max_lon": 11
+    })
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == sample_location["id"]
+    assert "$geoWithin" in locations.queries[0]["geo.coordinates"]
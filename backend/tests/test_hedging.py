@@ -0,0 +1,70 @@
+# backend/tests/test_hedging.py
+import pytest
+import asyncio
+import time
+
+from hedging import race
+
+
+def make_attempt(delay, result, log, name, fail=False):
+    async def attempt():
+        log.append(("start", name, time.monotonic()))
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(("cancelled", name, time.monotonic()))
+            raise
+        if fail:
+            raise RuntimeError(f"{name} failed")
+        return result
+    return attempt
+
+
+@pytest.mark.asyncio
+async def test_first_usable_result_wins_and_others_are_cancelled():
+    """Test que le premier résultat utilisable gagne et que les autres sont annulés"""
+    log = []
+    attempts = [
+        make_attempt(0.2, ["slow"], log, "a"),
+        make_attempt(0.01, ["fast"], log, "b"),
+    ]
+    index, result = await race(attempts, stagger=0.02, max_in_flight=2)
+
+    assert index == 1
+    assert result == ["fast"]
+    assert ("cancelled", "a") in [(event, name) for event, name, _ in log]
+
+
+@pytest.mark.asyncio
+async def test_empty_results_and_errors_are_skipped():
+    """Test que les réponses vides et les erreurs ne sont pas retenues"""
+    log = []
+    attempts = [
+        make_attempt(0.0, [], log, "empty"),
+        make_attempt(0.0, None, log, "error", fail=True),
+        make_attempt(0.0, ["data"], log, "ok"),
+    ]
+    index, result = await race(attempts, stagger=1.0, max_in_flight=1)
+
+    assert (index, result) == (2, ["data"])
+
+
+@pytest.mark.asyncio
+async def test_no_usable_result():
+    """Test que (None, None) est renvoyé quand aucune tentative n'aboutit"""
+    log = []
+    attempts = [make_attempt(0.0, [], log, str(i)) for i in range(3)]
+    assert await race(attempts, stagger=0.01) == (None, None)
+
+
+@pytest.mark.asyncio
+async def test_max_in_flight_is_respected():
+    """Test que le nombre de requêtes simultanées reste borné"""
+    log = []
+    attempts = [make_attempt(0.05, [], log, str(i)) for i in range(4)]
+    await race(attempts, stagger=0.0, max_in_flight=2)
+
+    starts = [t for event, _, t in log if event == "start"]
+    assert len(starts) == 4
+    # Les deux dernières tentatives ne démarrent qu'après la fin des premières
+    assert sorted(starts)[2] - sorted(starts)[0] >= 0.04
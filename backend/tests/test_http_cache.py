@@ -0,0 +1,128 @@
+# backend/tests/test_http_cache.py
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Request, Response
+
+import http_cache
+from derived_fields import derive_location_fields
+from main import app
+from tests.patches import AsyncMockDatabase
+
+
+def make_request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_http_dates_and_max_age():
+    """Test le format des dates HTTP et la durée de vie restante"""
+    fetched = datetime(2024, 10, 2, 10, 0, 0, 123456)
+    assert http_cache.http_date(fetched) == "Wed, 02 Oct 2024 10:00:00 GMT"
+    assert http_cache.parse_http_date("Wed, 02 Oct 2024 10:00:00 GMT") == datetime(2024, 10, 2, 10, 0, 0)
+    assert http_cache.parse_http_date("yesterday") is None
+
+    ttl = timedelta(minutes=30)
+    assert 590 <= http_cache.max_age(datetime.utcnow() - timedelta(minutes=20), ttl) <= 600
+    assert http_cache.max_age(datetime.utcnow() - timedelta(hours=2), ttl) == 0
+
+
+def test_validate():
+    """Test les en-têtes de validation et les réponses 304"""
+    fetched = datetime.utcnow() - timedelta(minutes=5)
+    ttl = timedelta(minutes=30)
+    response = Response()
+    assert http_cache.validate(make_request(), response, fetched, ttl, "json", 3) is None
+    tag = response.headers["ETag"]
+    assert tag.startswith('"') and not tag.startswith('W/')
+    assert response.headers["Cache-Control"].startswith("max-age=")
+
+    unchanged = http_cache.validate(make_request(if_none_match=f'"other", W/{tag}'), Response(), fetched, ttl, "json", 3)
+    assert unchanged.status_code == 304
+    assert unchanged.headers["ETag"] == tag
+
+    # Other representation, newer data or a mismatching ETag: full response
+    assert http_cache.validate(make_request(if_none_match=tag), None, fetched, ttl, "columnar", 3) is None
+    assert http_cache.validate(make_request(if_none_match=tag), None, datetime.utcnow(), ttl, "json", 3) is None
+    since = http_cache.http_date(fetched)
+    assert http_cache.validate(make_request(if_modified_since=since), None, fetched, ttl, "json", 3).status_code == 304
+    assert http_cache.validate(make_request(if_none_match='"x"', if_modified_since=since), None, fetched, ttl) is None
+    assert http_cache.validate(make_request(if_none_match=tag), None, None, ttl) is None
+
+
+@pytest.mark.asyncio
+async def test_city_locations_not_modified(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test qu'un second appel conditionnel sur /api/locations/{city} reçoit un 304"""
+    doc = {**sample_location, "last_fetched": datetime.utcnow() - timedelta(minutes=1)}
+    mock_mongodb.locations.insert_one({**doc, **derive_location_fields(doc)})
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+
+    first = await async_client.get("/api/locations/Test City")
+    assert first.status_code == 200
+    assert first.headers["X-Cache-Status"] == "HIT"
+    assert first.headers["Last-Modified"] == http_cache.http_date(doc["last_fetched"])
+    assert 0 < int(first.headers["Cache-Control"].split("=")[1]) <= 30 * 60
+
+    second = await async_client.get("/api/locations/Test City", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+    summary = await async_client.get(
+        "/api/locations/Test City", params={"fields": "summary"},
+        headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert summary.status_code == 200
+    assert summary.headers["ETag"] != first.headers["ETag"]
+
+
+@pytest.mark.asyncio
+async def test_filtered_locations_not_modified(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test les validateurs de /api/locations, propres à chaque page"""
+    for i in range(1, 4):
+        doc = {**sample_location, "id": i, "last_fetched": datetime.utcnow() - timedelta(minutes=1)}
+        mock_mongodb.locations.insert_one({**doc, **derive_location_fields(doc)})
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+    params = {"country": "TST", "limit": 2}
+
+    first = await async_client.get("/api/locations", params=params)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"].startswith("max-age=")
+
+    second = await async_client.get("/api/locations", params=params, headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+    next_page = await async_client.get(
+        "/api/locations", params={**params, "cursor": first.headers["X-Next-Cursor"]},
+        headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert next_page.status_code == 200
+    assert [loc["id"] for loc in next_page.json()] == [3]
+
+
+@pytest.mark.asyncio
+async def test_etag_per_content_coding(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test que les corps gzip et non compressés n'ont pas le même ETag fort"""
+    for i in range(1, 30):
+        doc = {**sample_location, "id": i, "last_fetched": datetime.utcnow() - timedelta(minutes=1)}
+        mock_mongodb.locations.insert_one({**doc, **derive_location_fields(doc)})
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+
+    plain = await async_client.get("/api/locations/Test City", headers={"Accept-Encoding": "identity"})
+    gzipped = await async_client.get("/api/locations/Test City", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert plain.headers["ETag"] != gzipped.headers["ETag"]
+    assert plain.headers["Vary"].count("Accept-Encoding") == 1
+    assert gzipped.headers["Vary"].count("Accept-Encoding") == 1
+
+    # The ETag of one encoding does not validate the other one
+    response = await async_client.get(
+        "/api/locations/Test City", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]}
+    )
+    assert response.status_code == 200
+    response = await async_client.get(
+        "/api/locations/Test City", headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]}
+    )
+    assert response.status_code == 304
@@ -0,0 +1,71 @@
+# backend/tests/test_measurement_formats.py
+from datetime import datetime
+
+import pytest
+
+import bench_serialization
+import fast_json
+import measurement_formats
+from main import app
+from measurement_formats import COLUMNAR, JSON, MSGPACK, NotAcceptable
+from models import Measurement
+from tests.patches import AsyncMockDatabase
+
+
+def test_negotiate(monkeypatch):
+    """Test le choix du format selon l'en-tête Accept"""
+    assert measurement_formats.negotiate(None) == JSON
+    assert measurement_formats.negotiate("text/html,*/*;q=0.8") == JSON
+    assert measurement_formats.negotiate(f"application/json;q=0.5, {COLUMNAR}") == COLUMNAR
+    assert measurement_formats.negotiate(f"{COLUMNAR};q=0, application/json") == JSON
+
+    monkeypatch.setattr(measurement_formats, "msgpack", None)
+    assert measurement_formats.negotiate("application/x-msgpack, application/json;q=0.1") == JSON
+    with pytest.raises(NotAcceptable):
+        measurement_formats.negotiate("application/msgpack")
+
+    monkeypatch.setattr(measurement_formats, "msgpack", object())
+    assert measurement_formats.negotiate("application/x-msgpack, application/json;q=0.1") == MSGPACK
+
+
+def test_columnar_hoists_constants():
+    """Test que les champs identiques sur toutes les lignes ne sont donnés qu'une fois"""
+    measurements = fast_json.from_documents(Measurement, bench_serialization.make_documents(4))
+    data = measurement_formats.columnar(measurements)
+
+    assert data["count"] == 4
+    assert data["constants"]["location"] == "Paris Centre"
+    assert data["constants"]["coordinates"] == {"latitude": 48.8566, "longitude": 2.3522}
+    assert data["columns"]["parameter"] == ["pm25", "pm10", "no2", "o3"]
+    assert data["columns"]["date"][0] == measurements[0].date.isoformat()
+    assert set(data["constants"]).isdisjoint(data["columns"])
+
+    week = fast_json.from_documents(Measurement, bench_serialization.make_documents(1000))
+    assert len(fast_json.dumps(measurement_formats.columnar(week))) * 3 < len(fast_json.dumps(week))
+
+    assert measurement_formats.columnar([]) == {"count": 0, "constants": {}, "columns": {}}
+
+
+@pytest.mark.asyncio
+async def test_stored_measurements_columnar(async_client, mock_mongodb, sample_measurements, monkeypatch):
+    """Test /api/stored-measurements en JSON colonnaire et le 406 sans msgpack"""
+    mock_mongodb.measurements.insert_many([
+        {**m, "parameter": parameter, "last_fetched": datetime.utcnow()}
+        for m in sample_measurements for parameter in ("pm25", "no2")
+    ])
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+    url = f"/api/stored-measurements/{sample_measurements[0]['location']}"
+
+    rows = await async_client.get(url)
+    assert "Accept" in rows.headers["Vary"]
+    response = await async_client.get(url, headers={"Accept": COLUMNAR})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith(COLUMNAR)
+    data = response.json()
+    assert data["count"] == len(rows.json())
+    assert data["constants"]["city"] == "Test City"
+    assert sorted(data["columns"]["parameter"]) == ["no2", "pm25"]
+
+    monkeypatch.setattr(measurement_formats, "msgpack", None)
+    response = await async_client.get(url, headers={"Accept": "application/msgpack"})
+    assert response.status_code == 406
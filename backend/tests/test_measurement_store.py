@@ -0,0 +1,169 @@
+# backend/tests/test_measurement_store.py
+import pytest
+from datetime import datetime, timedelta
+
+import measurement_store
+from measurement_store import (
+    DocumentMeasurementStore, TimeSeriesMeasurementStore, BucketMeasurementStore, FETCHED_AT_FIELD
+)
+from migrate_measurements import migrate
+from tests.patches import AsyncMockDatabase
+
+
+def readings(count, location_id="12345", start=datetime(2024, 1, 1)):
+    return [
+        {
+            "location": "Test Station",
+            "location_id": location_id,
+            "parameter": "pm25",
+            "value": float(i),
+            "unit": "µg/m³",
+            "date": start + timedelta(hours=i),
+            "last_fetched": datetime.utcnow()
+        }
+        for i in range(count)
+    ]
+
+
+def test_get_store():
+    """Test la sélection du stockage par MEASUREMENTS_STORAGE"""
+    assert isinstance(measurement_store.get_store("document"), DocumentMeasurementStore)
+    assert isinstance(measurement_store.get_store("TimeSeries"), TimeSeriesMeasurementStore)
+    with pytest.raises(ValueError):
+        measurement_store.get_store("csv")
+
+
+def test_timeseries_document_round_trip():
+    """Test la conversion vers et depuis le format série temporelle"""
+    reading = readings(1)[0]
+    doc = TimeSeriesMeasurementStore.to_document("12345", reading)
+    assert doc["meta"] == {"location_id": "12345", "parameter": "pm25"}
+    assert "location_id" not in doc and "parameter" not in doc
+    assert TimeSeriesMeasurementStore.from_document(doc) == reading
+
+
+@pytest.mark.asyncio
+async def test_document_store_save_and_query(mock_mongodb):
+    """Test l'écriture puis la lecture avec le stockage document"""
+    db = AsyncMockDatabase(mock_mongodb)
+    store = DocumentMeasurementStore()
+    await store.save(db, "12345", readings(3))
+    await store.save(db, "12345", readings(3))  # Idempotent
+
+    assert mock_mongodb.measurements.count_documents({}) == 3
+    docs = await store.query(db, "Test Station", start_date=datetime(2024, 1, 1, 1))
+    assert [doc["value"] for doc in docs] == [2.0, 1.0]
+    recent = await store.recent(db, "12345", {}, since=datetime.utcnow() - timedelta(hours=1))
+    assert len(recent) == 3
+
+
+@pytest.mark.asyncio
+async def test_timeseries_store_save_and_query(mock_mongodb, sample_location):
+    """Test l'écriture sans doublons et la lecture avec le stockage série temporelle"""
+    mock_mongodb.locations.insert_one(sample_location)
+    db = AsyncMockDatabase(mock_mongodb)
+    store = TimeSeriesMeasurementStore()
+    await store.ensure(db)
+    await store.save(db, "12345", readings(3))
+    await store.save(db, "12345", readings(4))  # Seule la nouvelle mesure est ajoutée
+
+    assert mock_mongodb.measurements_ts.count_documents({}) == 4
+    location_doc = mock_mongodb.locations.find_one({"id": 12345})
+    assert location_doc[FETCHED_AT_FIELD] is not None
+
+    docs = await store.query(db, "Test Station", parameter="pm25")
+    assert [doc["value"] for doc in docs] == [3.0, 2.0, 1.0, 0.0]
+    assert docs[0]["location_id"] == "12345"
+
+    recent = await store.recent(db, "12345", location_doc, since=datetime.utcnow() - timedelta(hours=1))
+    assert len(recent) == 4
+    assert all(doc["last_fetched"] == location_doc[FETCHED_AT_FIELD] for doc in recent)
+    # Station jamais rafraîchie : pas de cache
+    assert await store.recent(db, "12345", {}, since=datetime.utcnow() - timedelta(hours=1)) == []
+
+
+@pytest.mark.asyncio
+async def test_migrate_to_timeseries(mock_mongodb, sample_location):
+    """Test la migration vers la collection série temporelle (relançable)"""
+    mock_mongodb.locations.insert_one(sample_location)
+    mock_mongodb.measurements.insert_many(readings(5))
+    db = AsyncMockDatabase(mock_mongodb)
+
+    assert await migrate(db, batch_size=2) == 5
+    assert await migrate(db, batch_size=2) == 0
+    assert mock_mongodb.measurements_ts.count_documents({"meta.location_id": "12345"}) == 5
+    assert mock_mongodb.locations.find_one({"id": 12345})[FETCHED_AT_FIELD] is not None
+
+
+@pytest.mark.asyncio
+async def test_bucket_store_append_is_idempotent(mock_mongodb):
+    """Test que les mesures sont regroupées par jour et qu'un ajout répété est ignoré"""
+    db = AsyncMockDatabase(mock_mongodb)
+    store = BucketMeasurementStore()
+    await store.ensure(db)
+    await store.save(db, "12345", readings(30))  # 24 mesures le 1er janvier, 6 le 2
+    await store.save(db, "12345", readings(30))
+
+    buckets = list(mock_mongodb.measurement_buckets.find().sort("day", 1))
+    assert [bucket["count"] for bucket in buckets] == [24, 6]
+    assert len(buckets[0]["values"]) == len(buckets[0]["dates"]) == 24
+    assert buckets[0]["min"] == 0.0 and buckets[0]["max"] == 23.0
+    assert buckets[0]["sum"] == sum(range(24))
+
+
+@pytest.mark.asyncio
+async def test_bucket_store_range_and_summary(mock_mongodb):
+    """Test la lecture par période et le résumé à partir des agrégats des seaux"""
+    db = AsyncMockDatabase(mock_mongodb)
+    store = BucketMeasurementStore()
+    await store.ensure(db)
+    await store.save(db, "12345", readings(30))
+
+    docs = await store.query(db, "Test Station", start_date=datetime(2024, 1, 1, 20), limit=5)
+    assert [doc["value"] for doc in docs] == [29.0, 28.0, 27.0, 26.0, 25.0]
+    assert docs[0]["location_id"] == "12345" and docs[0]["unit"] == "µg/m³"
+
+    recent = await store.recent(db, "12345", {}, since=datetime.utcnow() - timedelta(hours=1))
+    assert len(recent) == 30
+
+    summary = await store.summarize(db, "12345", datetime(2024, 1, 1), datetime(2024, 1, 2))
+    assert summary == [{
+        "parameter": "pm25", "min_value": 0.0, "max_value": 29.0, "avg_value": 14.5,
+        "count": 30, "unit": "µg/m³", "last_updated": datetime(2024, 1, 2, 5)
+    }]
+
+
+@pytest.mark.asyncio
+async def test_document_store_summary(mock_mongodb):
+    """Test le résumé calculé par agrégation avec le stockage document"""
+    db = AsyncMockDatabase(mock_mongodb)
+    store = DocumentMeasurementStore()
+    await store.save(db, "12345", readings(4))
+    summary = await store.summarize(db, "12345", datetime(2024, 1, 1), datetime(2024, 1, 2))
+    assert summary[0]["count"] == 4
+    assert summary[0]["avg_value"] == 1.5
+
+
+@pytest.mark.asyncio
+async def test_timeseries_store_saves_before_flush(mock_mongodb, sample_location, monkeypatch):
+    """Test que deux rafraîchissements avant l'écriture différée n'insèrent pas deux fois les mesures"""
+    from write_behind import WriteBehindQueue
+
+    mock_mongodb.locations.insert_one(sample_location)
+    db = AsyncMockDatabase(mock_mongodb)
+    queue = WriteBehindQueue(max_size=100, batch_size=100, flush_interval=0.1)
+    monkeypatch.setattr(measurement_store, "write_queue", queue)
+    queue.start()
+    store = TimeSeriesMeasurementStore()
+    try:
+        await store.save(db, "12345", readings(3))
+        await store.save(db, "12345", readings(4))
+        assert mock_mongodb.measurements_ts.count_documents({}) == 0
+        await queue.flush()
+    finally:
+        await queue.stop()
+
+    assert mock_mongodb.measurements_ts.count_documents({}) == 4
+    assert measurement_store._pending_readings == {}
+    await store.save(db, "12345", readings(4))
+    assert mock_mongodb.measurements_ts.count_documents({}) == 4
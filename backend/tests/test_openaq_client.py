@@ -0,0 +1,143 @@
+# backend/tests/test_openaq_client.py
+import pytest
+import asyncio
+import httpx
+
+import openaq_client
+from config import settings
+
+
+def test_endpoint_for():
+    """Test que les URLs OpenAQ sont associées au bon endpoint"""
+    assert openaq_client.endpoint_for("https://api.openaq.org/v3/locations") == "locations"
+    assert openaq_client.endpoint_for("https://api.openaq.org/v3/measurements") == "measurements"
+    assert openaq_client.endpoint_for("https://api.openaq.org/v2/latest/measurements") == "latest"
+    assert openaq_client.endpoint_for("https://api.openaq.org/v3/") == "default"
+
+
+def test_get_timeout_per_endpoint():
+    """Test que chaque endpoint utilise son propre timeout"""
+    timeout = openaq_client.get_timeout("locations")
+    assert timeout.read == settings.OPENAQ_LOCATIONS_TIMEOUT
+    assert timeout.connect == settings.OPENAQ_CONNECT_TIMEOUT
+    assert openaq_client.get_timeout("unknown").read == settings.OPENAQ_TIMEOUT
+
+
+@pytest.mark.asyncio
+async def test_shared_client_is_reused():
+    """Test que le client HTTP est partagé entre les appels puis fermé"""
+    client = await openaq_client.start_client()
+    try:
+        assert isinstance(client, httpx.AsyncClient)
+        assert openaq_client.get_client() is client
+    finally:
+        await openaq_client.close_client()
+    assert client.is_closed
+    # Un nouveau client est recréé à la demande après fermeture
+    new_client = openaq_client.get_client()
+    assert new_client is not client
+    await openaq_client.close_client()
+
+
+@pytest.mark.asyncio
+async def test_request_uses_endpoint_timeout():
+    """Test que request() applique le timeout de l'endpoint"""
+    seen = {}
+
+    def handler(request: httpx.Request):
+        seen["timeout"] = request.extensions["timeout"]
+        return httpx.Response(200, json={"results": []})
+
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        response = await openaq_client.get("https://api.openaq.org/v3/locations", params={"limit": 1})
+        assert response.status_code == 200
+        assert seen["timeout"]["read"] == settings.OPENAQ_LOCATIONS_TIMEOUT
+    finally:
+        await openaq_client.close_client()
+
+
+def paged_handler(total, requested, fail_on_page=None):
+    """Simule un endpoint OpenAQ paginé contenant `total` résultats."""
+    def handler(request: httpx.Request):
+        page = int(request.url.params["page"])
+        limit = int(request.url.params["limit"])
+        requested.append(page)
+        if page == fail_on_page:
+            return httpx.Response(500, json={"message": "boom"})
+        start = (page - 1) * limit
+        results = [{"id": i} for i in range(start, min(start + limit, total))]
+        return httpx.Response(200, json={"meta": {"found": total}, "results": results})
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_streams_until_found():
+    """Test que toutes les pages sont lues jusqu'à meta.found"""
+    requested = []
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(paged_handler(250, requested)))
+    try:
+        pages = [page async for page in openaq_client.iter_pages(
+            "https://api.openaq.org/v3/locations", page_size=100, max_results=1000
+        )]
+    finally:
+        await openaq_client.close_client()
+
+    assert [len(page.results) for page in pages] == [100, 100, 50]
+    assert pages[-1].fetched == 250
+    assert pages[-1].found == 250
+    assert [page.complete for page in pages] == [False, False, True]
+    assert requested == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_stops_at_cap():
+    """Test que la pagination s'arrête au plafond configuré"""
+    requested = []
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(paged_handler(1000, requested)))
+    try:
+        pages = [page async for page in openaq_client.iter_pages(
+            "https://api.openaq.org/v3/locations", page_size=100, max_results=150
+        )]
+    finally:
+        await openaq_client.close_client()
+
+    assert sum(len(page.results) for page in pages) == 150
+    assert not pages[-1].complete
+    assert requested == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_prefetches_next_page():
+    """Test que la page suivante est demandée pendant le traitement de la page courante"""
+    requested = []
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(paged_handler(200, requested)))
+    try:
+        async for page in openaq_client.iter_pages("https://api.openaq.org/v3/locations", page_size=100):
+            if page.number == 1:
+                await asyncio.sleep(0.01)  # Traitement de la page 1
+                assert 2 in requested
+    finally:
+        await openaq_client.close_client()
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_errors():
+    """Test qu'une erreur sur la première page est levée, et qu'une erreur ultérieure arrête le flux"""
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(paged_handler(300, [], fail_on_page=1)))
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            async for _ in openaq_client.iter_pages("https://api.openaq.org/v3/locations", page_size=100):
+                pass
+    finally:
+        await openaq_client.close_client()
+
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(paged_handler(300, [], fail_on_page=2)))
+    try:
+        pages = [page async for page in openaq_client.iter_pages(
+            "https://api.openaq.org/v3/locations", page_size=100
+        )]
+    finally:
+        await openaq_client.close_client()
+    assert [page.number for page in pages] == [1]
+    assert not pages[-1].complete
@@ -0,0 +1,135 @@
+# backend/tests/test_pagination.py
+import pytest
+
+import pagination
+from main import app
+from pagination import CountCache, InvalidCursor
+from tests.patches import AsyncMockDatabase
+
+
+def test_cursor_round_trip():
+    """Test l'encodage et le décodage des curseurs opaques"""
+    token = pagination.encode_cursor("name_key", "paris", 42)
+    assert "=" not in token
+    assert pagination.decode_cursor(token, "name_key") == ("paris", 42)
+    assert pagination.decode_offset(pagination.encode_offset(30)) == 30
+
+    with pytest.raises(InvalidCursor):
+        pagination.decode_cursor(token, "id")
+    with pytest.raises(InvalidCursor):
+        pagination.decode_cursor("not a cursor!", "id")
+    with pytest.raises(InvalidCursor):
+        pagination.decode_offset(token)
+
+
+def test_keyset_walk(mock_mongodb, sample_location):
+    """Test un parcours complet par curseur, clés nulles et égalités comprises"""
+    names = [None, "b", "a", None, "b", "c", "a"]
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": i, "name_key": name} for i, name in enumerate(names)
+    ])
+
+    seen = []
+    token = None
+    while True:
+        query = pagination.keyset_query("name_key", *pagination.decode_cursor(token, "name_key")) if token else {}
+        docs = list(mock_mongodb.locations.find(query).sort(pagination.sort_spec("name_key")).limit(3))
+        seen += [doc["id"] for doc in docs]
+        token = pagination.next_cursor(docs, 3, "name_key")
+        if not token:
+            break
+
+    assert seen == [0, 3, 2, 6, 1, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_count_cache(mock_mongodb, sample_location):
+    """Test le cache des totaux filtrés et le total estimé sans filtre"""
+    mock_mongodb.locations.insert_many([{**sample_location, "id": i} for i in range(3)])
+    collection = AsyncMockDatabase(mock_mongodb).locations
+    cache = CountCache(ttl=60)
+
+    assert await cache.count(collection, {"id": {"$gte": 1}}) == 2
+    mock_mongodb.locations.insert_one({**sample_location, "id": 3})
+    assert await cache.count(collection, {"id": {"$gte": 1}}) == 2
+    assert await cache.count(collection, {}) == 4
+    cache.clear()
+    assert await cache.count(collection, {"id": {"$gte": 1}}) == 3
+
+
+@pytest.mark.asyncio
+async def test_stored_locations_cursor(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test /api/stored-locations : curseur, numéro de page et total"""
+    mock_mongodb.locations.insert_many([{**sample_location, "id": i} for i in range(5, 0, -1)])
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+
+    response = await async_client.get("/api/stored-locations", params={"size": 2})
+    first = response.json()
+    assert first["total"] == 5
+    assert first["next_cursor"]
+
+    response = await async_client.get("/api/stored-locations", params={"size": 2, "cursor": first["next_cursor"]})
+    assert response.json()["next_cursor"]
+    assert response.json()["page"] is None  # Pas de numéro de page avec un curseur
+
+    response = await async_client.get("/api/stored-locations", params={"size": 2, "page": 3, "with_total": False})
+    assert response.json()["total"] is None
+    assert response.json()["next_cursor"] is None
+
+    response = await async_client.get("/api/stored-locations", params={"cursor": "bad"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_filtered_locations_cursor(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test le chaînage des pages de /api/locations par X-Next-Cursor"""
+    mock_mongodb.locations.insert_many([{**sample_location, "id": i} for i in [4, 1, 3, 2, 5]])
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+
+    ids = []
+    params = {"limit": 2, "with_total": True}
+    while True:
+        response = await async_client.get("/api/locations", params=params)
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "5"
+        ids += [loc["id"] for loc in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert ids == [1, 2, 3, 4, 5]
+
+    # Les anciens clients paginent toujours par numéro de page
+    response = await async_client.get("/api/locations", params={"limit": 2, "page": 2})
+    assert [loc["id"] for loc in response.json()] == [3, 4]
+
+    response = await async_client.get("/api/locations", params={"cursor": pagination.encode_offset(2)})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_filtered_locations_city_fallback_has_no_cursor(mock_mongodb, sample_location, monkeypatch):
+    """Test que X-Next-Cursor n'accompagne pas la liste de repli par ville"""
+    from datetime import datetime, timedelta
+    from httpx import ASGITransport, AsyncClient
+    import api_update
+    from derived_fields import derive_location_fields
+
+    old = datetime.utcnow() - timedelta(hours=3)
+    for i in range(1, 4):
+        doc = {**sample_location, "id": i, "last_fetched": old}
+        mock_mongodb.locations.insert_one({**doc, **derive_location_fields(doc)})
+    monkeypatch.setattr(api_update.app, "mongodb", AsyncMockDatabase(mock_mongodb), raising=False)
+
+    async def fake_refresh(city, cached_locations):
+        return cached_locations
+
+    monkeypatch.setattr(api_update, "_refresh_locations_by_city", fake_refresh)
+    transport = ASGITransport(app=api_update.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/api/locations", params={"city": "Test City", "limit": 1, "with_total": True})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 3  # Toute la ville, pas une page
+    assert "X-Next-Cursor" not in response.headers
+    assert "X-Total-Count" not in response.headers
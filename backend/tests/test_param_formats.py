@@ -0,0 +1,36 @@
+# backend/tests/test_param_formats.py
+import pytest
+import mongomock
+
+import param_formats
+from tests.patches import AsyncMockDatabase
+
+
+def test_order_formats_without_learned_format():
+    """Test que l'ordre historique est conservé sans format appris"""
+    assert param_formats.order_formats(None) == param_formats.PARAM_FORMATS
+
+
+def test_order_formats_puts_learned_first():
+    """Test que le format appris est essayé en premier, sans doublon"""
+    order = param_formats.order_formats("id")
+    assert order[0] == "id"
+    assert sorted(order) == sorted(param_formats.PARAM_FORMATS)
+    # Un format recommandé inconnu (ex: location_id) est aussi essayé en premier
+    assert param_formats.order_formats("location_id")[0] == "location_id"
+
+
+@pytest.mark.asyncio
+async def test_save_and_forget_format(sample_location):
+    """Test que le format est stocké sur la station puis oublié"""
+    db = mongomock.MongoClient().db
+    db.locations.insert_one(sample_location)
+    async_db = AsyncMockDatabase(db)
+
+    await param_formats.save_format(async_db, 12345, "location")
+    doc = db.locations.find_one({"id": 12345})
+    assert doc[param_formats.FORMAT_FIELD] == "location"
+
+    await param_formats.save_format(async_db, 12345, None)
+    doc = db.locations.find_one({"id": 12345})
+    assert param_formats.FORMAT_FIELD not in doc
@@ -0,0 +1,141 @@
+# backend/tests/test_persistence.py
+import pytest
+from types import SimpleNamespace
+from pymongo.errors import BulkWriteError
+
+import persistence
+
+
+class RecordingCollection:
+    """Collection factice qui enregistre les appels à bulk_write."""
+    def __init__(self, fail_index=None):
+        self.calls = []
+        self.fail_index = fail_index
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append((list(operations), ordered))
+        if self.fail_index is not None and self.fail_index < len(operations):
+            raise BulkWriteError({
+                "nMatched": 0, "nModified": 0, "nUpserted": len(operations) - 1,
+                "writeErrors": [{
+                    "index": self.fail_index, "code": 121, "errmsg": "Document failed validation",
+                    "op": {"q": {"id": self.fail_index}}
+                }]
+            })
+        return SimpleNamespace(matched_count=1, modified_count=1, upserted_count=len(operations) - 1)
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_batches_unordered():
+    """Test que les opérations sont envoyées par lots non ordonnés"""
+    collection = RecordingCollection()
+    operations = [persistence.upsert_op({"id": i}, {"id": i, "name": f"Station {i}"}) for i in range(250)]
+
+    result = await persistence.bulk_upsert(collection, operations, batch_size=100, label="locations")
+
+    assert [len(ops) for ops, _ in collection.calls] == [100, 100, 50]
+    assert all(ordered is False for _, ordered in collection.calls)
+    assert result.upserted == 247
+    assert result.modified == 3
+    assert result.written == 250
+    assert result.errors == []
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_reports_document_errors():
+    """Test que les erreurs sont remontées document par document"""
+    collection = RecordingCollection(fail_index=2)
+    operations = [persistence.upsert_op({"id": i}, {"id": i}) for i in range(5)]
+
+    result = await persistence.bulk_upsert(collection, operations)
+
+    assert result.upserted == 4
+    assert len(result.errors) == 1
+    assert result.errors[0]["index"] == 2
+    assert result.errors[0]["code"] == 121
+    assert result.errors[0]["filter"] == {"id": 2}
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_without_operations():
+    """Test qu'aucun appel n'est fait sans opérations"""
+    collection = RecordingCollection()
+    result = await persistence.bulk_upsert(collection, [])
+    assert collection.calls == []
+    assert result.written == 0
+
+
+class RacingCollection(RecordingCollection):
+    """Le premier lot perd une course d'upsert (erreur de clé dupliquée)."""
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append((list(operations), ordered))
+        if len(self.calls) == 1:
+            raise BulkWriteError({
+                "nMatched": 0, "nModified": 0, "nUpserted": len(operations) - 1,
+                "writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key", "op": {"q": {"id": 0}}}]
+            })
+        return SimpleNamespace(matched_count=len(operations), modified_count=len(operations), upserted_count=0)
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_retries_duplicate_key_races():
+    """Test qu'un upsert perdant une course sur la clé unique est rejoué en mise à jour"""
+    collection = RacingCollection()
+    operations = [persistence.upsert_op({"id": i}, {"id": i}) for i in range(3)]
+
+    result = await persistence.bulk_upsert(collection, operations)
+
+    assert len(collection.calls) == 2
+    assert collection.calls[1][0] == [operations[0]]
+    assert result.errors == []
+    assert result.written == 3
+
+
+def measurement_docs(count, date):
+    from datetime import datetime, timedelta
+    return [
+        {
+            "location_id": "12345", "parameter": "pm25", "date": date, "value": float(i),
+            "last_fetched": datetime.utcnow() - timedelta(hours=i)
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_unique_index_removes_existing_duplicates(mock_mongodb):
+    """Test que les doublons existants sont supprimés avant la création de l'index unique"""
+    from datetime import datetime
+    from tests.patches import AsyncMockDatabase
+    mock_mongodb.measurements.insert_many(measurement_docs(3, datetime(2024, 1, 1)))
+    db = AsyncMockDatabase(mock_mongodb)
+
+    await persistence.ensure_unique_index(db.measurements, persistence.MEASUREMENT_KEY)
+
+    docs = list(mock_mongodb.measurements.find())
+    assert len(docs) == 1
+    assert docs[0]["value"] == 0.0  # Le document le plus récent est conservé
+    indexes = mock_mongodb.measurements.index_information()
+    assert any(info.get("unique") for info in indexes.values())
+
+
+@pytest.mark.asyncio
+async def test_unique_index_replaces_non_unique_index(mock_mongodb):
+    """Test que l'ancien index non unique est remplacé en cas de conflit d'options"""
+    from pymongo.errors import OperationFailure
+    from tests.patches import AsyncMockCollection
+
+    class ConflictingCollection(AsyncMockCollection):
+        async def create_index(self, keys, **kwargs):
+            if "location_id_1_parameter_1_date_-1" in self._collection.index_information() and \
+                    not self._collection.index_information()["location_id_1_parameter_1_date_-1"].get("unique"):
+                raise OperationFailure("Index already exists with different options", code=85)
+            return self._collection.create_index(keys, **kwargs)
+
+    mock_mongodb.measurements.create_index(persistence.MEASUREMENT_KEY)
+    collection = ConflictingCollection(mock_mongodb.measurements)
+
+    await persistence.ensure_unique_index(collection, persistence.MEASUREMENT_KEY)
+
+    info = mock_mongodb.measurements.index_information()["location_id_1_parameter_1_date_-1"]
+    assert info.get("unique") is True
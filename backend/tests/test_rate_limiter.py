@@ -0,0 +1,122 @@
+# backend/tests/test_rate_limiter.py
+import pytest
+import asyncio
+import time
+import httpx
+
+import openaq_client
+import rate_limiter
+from rate_limiter import TokenBucket, FileStateStore
+from config import settings
+
+
+@pytest.mark.asyncio
+async def test_bucket_limits_rate():
+    """Test que le seau laisse passer la rafale puis attend le taux configuré"""
+    bucket = TokenBucket(rate=20.0, capacity=2)
+    start = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    elapsed = time.monotonic() - start
+    # 2 jetons immédiats, puis 2 jetons à 20/s
+    assert elapsed >= 0.08
+    assert bucket.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_depth():
+    """Test que les requêtes en attente de jeton sont comptées"""
+    bucket = TokenBucket(rate=10.0, capacity=1)
+    await bucket.acquire()
+    waiters = [asyncio.ensure_future(bucket.acquire()) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    assert bucket.queue_depth == 3
+    assert (await bucket.stats())["queue_depth"] == 3
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    assert bucket.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_update_from_headers():
+    """Test que le taux suit x-ratelimit-remaining / x-ratelimit-reset et qu'un 429 met en pause"""
+    bucket = TokenBucket(rate=10.0, capacity=10)
+    await bucket.update_from_headers({"x-ratelimit-remaining": "5", "x-ratelimit-reset": "10"}, 200)
+    stats = await bucket.stats()
+    assert stats["rate_per_second"] == pytest.approx(0.5)
+    assert stats["tokens"] <= 5
+
+    await bucket.update_from_headers({"retry-after": "30"}, 429)
+    assert (await bucket.stats())["paused_for"] > 29
+
+
+def test_backoff_delay_is_bounded(monkeypatch):
+    """Test que le backoff est aléatoire et plafonné"""
+    monkeypatch.setattr(settings, "OPENAQ_BACKOFF_BASE", 1.0)
+    monkeypatch.setattr(settings, "OPENAQ_BACKOFF_MAX", 4.0)
+    for attempt in range(10):
+        delay = rate_limiter.backoff_delay(attempt)
+        assert 0 <= delay <= min(4.0, 2 ** attempt)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(rate_limiter.fcntl is None, reason="fcntl indisponible")
+async def test_file_store_is_shared(tmp_path):
+    """Test que deux limiteurs sur le même fichier partagent leurs jetons"""
+    path = str(tmp_path / "openaq_rate.json")
+    first = TokenBucket(rate=0.01, capacity=2, store=FileStateStore(path))
+    second = TokenBucket(rate=0.01, capacity=2, store=FileStateStore(path))
+    await first.acquire()
+    await second.acquire()
+    assert (await second.stats())["tokens"] < 1
+
+
+@pytest.mark.asyncio
+async def test_request_retries_rate_limited_responses():
+    """Test que request() réessaie après un 429 en respectant Retry-After"""
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.05"})
+        return httpx.Response(200, json={"results": []})
+
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        response = await openaq_client.get("https://api.openaq.org/v3/locations")
+    finally:
+        await openaq_client.close_client()
+
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_request_gives_up_after_max_retries(monkeypatch):
+    """Test que la dernière réponse est renvoyée après OPENAQ_MAX_RETRIES essais"""
+    monkeypatch.setattr(settings, "OPENAQ_MAX_RETRIES", 2)
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        response = await openaq_client.get("https://api.openaq.org/v3/locations")
+    finally:
+        await openaq_client.close_client()
+
+    assert response.status_code == 503
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_debug_endpoint(async_client):
+    """Test que l'état du limiteur est exposé"""
+    response = await async_client.get("/api/debug/rate-limit")
+    assert response.status_code == 200
+    assert response.json()["queue_depth"] == 0
@@ -0,0 +1,90 @@
+# backend/tests/test_read_models.py
+from datetime import datetime
+
+import pytest
+
+import read_models
+from derived_fields import derive_location_fields, derive_pollutants
+from main import app
+from models import Location
+from read_models import InvalidFields
+from tests.patches import AsyncMockDatabase
+
+
+def test_parse_fields_and_projection():
+    """Test le sélecteur fields= et la projection MongoDB correspondante"""
+    assert read_models.parse_fields(None) is None
+    assert read_models.parse_fields("full") is None
+    assert read_models.parse_fields("summary") == read_models.SUMMARY_FIELDS
+    assert read_models.parse_fields("name, coordinates") == ["id", "name", "coordinates"]
+    with pytest.raises(InvalidFields):
+        read_models.parse_fields("name,parameters")
+
+    assert read_models.projection(["id", "name", "country_code", "distance"]) == {
+        "_id": 0, "id": 1, "last_fetched": 1, "name": 1, "country.code": 1
+    }
+
+
+def test_to_summary(sample_location):
+    """Test le résumé d'un document projeté et d'une Location complète"""
+    summary = read_models.to_summary(Location(**sample_location))
+    assert summary.pollutants == ["pm25", "no2"]
+    assert summary.country_code == "TST"
+
+    summary = read_models.to_summary({"id": 1, "name": "A", "country": {"code": "FR"}})
+    assert summary.country_code == "FR"
+    assert summary.pollutants == []
+
+
+@pytest.fixture
+def stored_locations(mock_mongodb, sample_location, monkeypatch):
+    docs = []
+    for i in range(1, 4):
+        doc = {**sample_location, "id": i, "last_fetched": datetime.utcnow(), "raw_openaq": {"big": "x" * 100}}
+        docs.append({**doc, **derive_location_fields(doc), **derive_pollutants(doc)})
+    mock_mongodb.locations.insert_many(docs)
+    monkeypatch.setattr(app, "mongodb", AsyncMockDatabase(mock_mongodb))
+    return docs
+
+
+@pytest.mark.asyncio
+async def test_list_endpoints_fields(async_client, stored_locations):
+    """Test fields= sur /api/locations, /api/stored-locations et /api/locations/{city}"""
+    response = await async_client.get("/api/locations", params={"fields": "name,coordinates", "limit": 2})
+    assert response.status_code == 200
+    assert response.json()[0] == {
+        "id": 1, "name": "Test Station", "coordinates": {"latitude": 50.0, "longitude": 10.0}
+    }
+    assert "X-Next-Cursor" in response.headers
+
+    response = await async_client.get("/api/stored-locations", params={"fields": "summary", "size": 2})
+    page = response.json()
+    assert page["items"][0]["pollutants"] == ["pm25", "no2"]
+    assert "parameters" not in page["items"][0]
+    assert page["next_cursor"]
+
+    response = await async_client.get("/api/locations/Test City", params={"fields": "id,pollutants"})
+    assert response.status_code == 200
+    assert response.json() == [{"id": i, "pollutants": ["pm25", "no2"]} for i in range(1, 4)]
+    assert response.headers["X-Cache-Status"] == "HIT"
+
+    response = await async_client.get("/api/locations", params={"fields": "raw_openaq"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_stored_locations_full_items(async_client, stored_locations):
+    """Test que les éléments complets de /api/stored-locations sont bien sérialisés"""
+    response = await async_client.get("/api/stored-locations", params={"size": 1})
+    item = response.json()["items"][0]
+    assert item["id"] == 1
+    assert item["country"]["code"] == "TST"
+
+
+def test_openapi_documents_summaries():
+    """Test que l'OpenAPI des listes décrit les emplacements complets et les résumés"""
+    paths = app.openapi()["paths"]
+    for path, full in (("/api/locations/{city}", "Location"), ("/api/locations", "LocationWithDistance")):
+        schema = paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        items = [variant["items"]["$ref"].rsplit("/", 1)[-1] for variant in schema["anyOf"]]
+        assert items == [full, "LocationSummary"]
@@ -0,0 +1,99 @@
+# backend/tests/test_singleflight.py
+import pytest
+import asyncio
+
+from singleflight import SingleFlight, make_key
+
+
+def test_make_key_normalizes_strings():
+    """Test que la clé ignore la casse et les espaces superflus"""
+    assert make_key("locations", "  Paris ") == make_key("locations", "paris")
+    assert make_key("locations", "New   York") == ("locations", "new york")
+    assert make_key("measurements", 42) == ("measurements", 42)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_refresh():
+    """Test que les appels concurrents pour une même clé ne lancent qu'un seul rafraîchissement"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def refresh():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["result"]
+
+    results = await asyncio.gather(*[flight.do(("locations", "paris"), refresh) for _ in range(10)])
+
+    assert calls == 1
+    assert all(r == ["result"] for r in results)
+    assert len(flight) == 0  # La clé est libérée une fois le rafraîchissement terminé
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_not_cached():
+    """Test qu'une erreur est propagée à tous les appelants puis oubliée"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    results = await asyncio.gather(
+        flight.do("key", failing), flight.do("key", failing), return_exceptions=True
+    )
+    assert calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+
+    # Un appel ultérieur relance bien le rafraîchissement
+    with pytest.raises(ValueError):
+        await flight.do("key", failing)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_refresh():
+    """Test que l'annulation d'un appelant n'annule pas le rafraîchissement partagé"""
+    flight = SingleFlight()
+
+    async def refresh():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    leader = asyncio.ensure_future(flight.do("key", refresh))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.do("key", refresh))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "done"
+
+
+@pytest.mark.asyncio
+async def test_spawn_runs_in_background_once():
+    """Test que spawn() lance un seul rafraîchissement en arrière-plan sans l'attendre"""
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def refresh():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "done"
+
+    task = flight.spawn(("locations", "paris"), refresh)
+    assert flight.spawn(("locations", "paris"), refresh) is task
+    await asyncio.sleep(0)
+    assert ("locations", "paris") in flight
+
+    # Un appelant qui attend rejoint le rafraîchissement en cours
+    waiter = asyncio.ensure_future(flight.do(("locations", "paris"), refresh))
+    release.set()
+    assert await waiter == "done"
+    assert calls == 1
+    assert len(flight) == 0
@@ -0,0 +1,116 @@
+# backend/tests/test_spatial_index.py
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import spatial_index as spatial_index_module
+from main import app
+from spatial_index import SpatialIndex, haversine_km, spatial_index
+from tests.patches import AsyncMockDatabase, MockCursor
+
+
+def station(station_id, latitude, longitude):
+    return {"id": station_id, "coordinates": {"latitude": latitude, "longitude": longitude}}
+
+
+def test_haversine_km():
+    """Test la distance haversine (Paris - Lyon, environ 392 km)"""
+    [distance] = haversine_km(48.8566, 2.3522, [45.7640], [4.8357])
+    assert 390 < distance < 394
+    assert haversine_km(0.0, 0.0, [0.0], [0.0]) == [0.0]
+
+
+def test_radius_matches_brute_force():
+    """Test que la grille renvoie les mêmes stations qu'un parcours complet"""
+    rng = random.Random(42)
+    index = SpatialIndex()
+    points = {i: (rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(2000)}
+    for station_id, (lat, lon) in points.items():
+        index.add(station_id, lat, lon)
+
+    for lat, lon, radius in [(48.85, 2.35, 800), (0.0, 179.5, 1500), (-60.0, -100.0, 3000)]:
+        hits = index.within_radius(lat, lon, radius)
+        expected = {
+            station_id for station_id, (plat, plon) in points.items()
+            if haversine_km(lat, lon, [plat], [plon])[0] <= radius
+        }
+        assert {station_id for station_id, _ in hits} == expected
+        distances = [distance for _, distance in hits]
+        assert distances == sorted(distances)
+
+
+def test_bbox_and_nearest():
+    """Test les boîtes (y compris l'antiméridien) et les k plus proches"""
+    index = SpatialIndex()
+    for doc in [station(1, 48.85, 2.35), station(2, 45.76, 4.84), station(3, 51.51, -0.13),
+                station(4, -17.7, 178.0), station(5, -17.5, -179.0), {"id": 6, "coordinates": {}}]:
+        index.add_location(doc)
+
+    assert len(index) == 5
+    assert index.within_bbox(45.0, 2.0, 49.0, 5.0) == [1, 2]
+    assert sorted(index.within_bbox(-20.0, 170.0, -10.0, -170.0)) == [4, 5]
+
+    assert [station_id for station_id, _ in index.nearest(48.0, 3.0, k=2)] == [1, 2]
+    assert [station_id for station_id, _ in index.nearest(48.0, 3.0, k=5, max_distance_km=150)] == [1]
+
+    # Une station déplacée change de cellule
+    index.add(1, -17.6, 179.9)
+    assert index.within_bbox(45.0, 2.0, 49.0, 5.0) == [2]
+    assert index.nearest(-17.6, 179.9, k=1)[0][0] == 1
+
+
+@pytest.mark.asyncio
+async def test_build_and_fetch_hits(mock_mongodb, sample_location):
+    """Test la construction depuis MongoDB et le chargement des documents dans l'ordre"""
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": 1, "coordinates": {"latitude": 50.0, "longitude": 10.0}},
+        {**sample_location, "id": 2, "coordinates": {"latitude": 50.1, "longitude": 10.0}},
+    ])
+    db = AsyncMockDatabase(mock_mongodb)
+    index = SpatialIndex()
+    await index.build(db)
+
+    assert index.built and len(index) == 2
+    hits = index.nearest(50.2, 10.0, k=2)
+    docs = await spatial_index_module.fetch_hits(db.locations, hits)
+    assert [doc["id"] for doc in docs] == [2, 1]
+    assert docs[0]["distance"] == pytest.approx(11.1, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_nearest_and_map_view_routes(async_client, sample_location, monkeypatch):
+    """Test /api/stations/nearest et /api/locations servis par l'index en mémoire"""
+    index = SpatialIndex()
+    docs = [
+        {**sample_location, "id": 1, "coordinates": {"latitude": 50.0, "longitude": 10.0}},
+        {**sample_location, "id": 2, "coordinates": {"latitude": 50.5, "longitude": 10.0}},
+        {**sample_location, "id": 3, "coordinates": {"latitude": 40.0, "longitude": 10.0}},
+    ]
+    for doc in docs:
+        index.add_location(doc)
+    index.built = True
+    monkeypatch.setattr(spatial_index, "built", True)
+    for name in ("within_radius", "within_bbox", "nearest"):
+        monkeypatch.setattr(spatial_index, name, getattr(index, name))
+
+    def find(query):
+        wanted = set(query["id"]["$in"])
+        return MockCursor([doc for doc in docs if doc["id"] in wanted])
+
+    monkeypatch.setattr(app, "mongodb", SimpleNamespace(locations=SimpleNamespace(find=find)), raising=False)
+
+    response = await async_client.get("/api/stations/nearest", params={"latitude": 50.4, "longitude": 10.0, "limit": 2})
+    assert response.status_code == 200
+    assert [loc["id"] for loc in response.json()] == [2, 1]
+    assert response.json()[0]["distance"] == pytest.approx(11.1, abs=0.1)
+
+    response = await async_client.get("/api/locations", params={
+        "latitude": 50.0, "longitude": 10.0, "radius": 100, "limit": 1, "page": 2
+    })
+    assert [loc["id"] for loc in response.json()] == [2]
+
+    response = await async_client.get("/api/locations", params={
+        "min_lat": 39, "min_lon": 9, "max_lat": 41, "max_lon": 11
+    })
+    assert [loc["id"] for loc in response.json()] == [3]
@@ -0,0 +1,95 @@
+# backend/tests/test_stale_cache.py
+import pytest
+import asyncio
+from datetime import datetime, timedelta
+
+import main
+import stale_cache
+from config import settings
+from tests.patches import MockCursor
+
+
+def test_classify():
+    """Test la classification frais / périmé / expiré"""
+    ttl = timedelta(minutes=30)
+    now = datetime.utcnow()
+    assert stale_cache.classify(now - timedelta(minutes=5), ttl) == stale_cache.HIT
+    assert stale_cache.classify(now - timedelta(hours=2), ttl) == stale_cache.STALE
+    assert stale_cache.classify(now - timedelta(hours=settings.CACHE_MAX_STALENESS_HOURS + 1), ttl) is None
+    assert stale_cache.classify(None, ttl) is None
+
+
+def test_classify_without_stale_while_revalidate(monkeypatch):
+    """Test que le mode stale-while-revalidate peut être désactivé"""
+    monkeypatch.setattr(settings, "STALE_WHILE_REVALIDATE", False)
+    assert stale_cache.classify(datetime.utcnow() - timedelta(hours=2), timedelta(minutes=30)) is None
+
+
+@pytest.mark.asyncio
+async def test_stale_locations_served_and_refreshed(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test qu'un cache périmé est renvoyé immédiatement et rafraîchi en arrière-plan"""
+    stale_location = {**sample_location, "last_fetched": datetime.utcnow() - timedelta(hours=2)}
+    monkeypatch.setattr(main.app.mongodb.locations, "find", lambda *args, **kwargs: MockCursor([stale_location]))
+
+    refreshed = asyncio.Event()
+
+    async def fake_refresh(city, cached_locations):
+        refreshed.set()
+        return cached_locations
+
+    monkeypatch.setattr(main, "_refresh_locations", fake_refresh)
+
+    response = await async_client.get("/api/locations/Test%20City")
+
+    assert response.status_code == 200
+    assert response.headers["X-Cache-Status"] == "STALE"
+    assert int(response.headers["Age"]) >= 7200
+    assert response.json()[0]["name"] == "Test Station"
+    await asyncio.wait_for(refreshed.wait(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_fresh_locations_are_a_cache_hit(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test qu'un cache valide est marqué HIT"""
+    monkeypatch.setattr(main.app.mongodb.locations, "find", lambda *args, **kwargs: MockCursor([sample_location]))
+
+    response = await async_client.get("/api/locations/Test%20City")
+
+    assert response.status_code == 200
+    assert response.headers["X-Cache-Status"] == "HIT"
+
+
+@pytest.mark.asyncio
+async def test_stale_summary_refresh_joined_by_full_request(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test qu'une requête complète jointe au rafraîchissement d'une requête fields= ne reçoit pas de résumés"""
+    from fastapi import HTTPException
+
+    stale_location = {**sample_location, "last_fetched": datetime.utcnow() - timedelta(hours=2)}
+    monkeypatch.setattr(main.app.mongodb.locations, "find", lambda *args, **kwargs: MockCursor([stale_location]))
+    release = asyncio.Event()
+    fallbacks = []
+
+    async def failing_refresh(city, cached_locations):
+        # OpenAQ en erreur : le rafraîchissement renvoie son repli
+        fallbacks.append(cached_locations)
+        await release.wait()
+        if not cached_locations:
+            raise HTTPException(status_code=502, detail="OpenAQ unavailable")
+        return cached_locations
+
+    monkeypatch.setattr(main, "_refresh_locations", failing_refresh)
+
+    summary = await async_client.get("/api/locations/Test%20City", params={"fields": "summary"})
+    assert summary.headers["X-Cache-Status"] == "STALE"
+
+    async def release_soon():
+        await asyncio.sleep(0.05)
+        release.set()
+
+    full, _ = await asyncio.gather(
+        async_client.get("/api/locations/Test%20City", params={"force_refresh": True}),
+        release_soon()
+    )
+    assert fallbacks == [[]]
+    assert full.status_code == 200
+    assert full.json()[0]["parameters"]
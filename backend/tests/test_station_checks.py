@@ -0,0 +1,73 @@
+# backend/tests/test_station_checks.py
+import pytest
+import httpx
+import mongomock
+from datetime import datetime, timedelta
+
+import openaq_client
+import station_checks
+from models import Location
+from tests.patches import AsyncMockDatabase
+
+
+@pytest.fixture
+def async_db():
+    return AsyncMockDatabase(mongomock.MongoClient().db)
+
+
+@pytest.mark.asyncio
+async def test_save_and_get_check(async_db):
+    """Test qu'une vérification positive est relue depuis le cache"""
+    await station_checks.save_check(async_db, "12345", True)
+    check = await station_checks.get_check(async_db, "12345")
+
+    assert check["exists"] is True
+    assert check["resolved_id"] == "12345"
+
+
+@pytest.mark.asyncio
+async def test_negative_check_expires_sooner(async_db):
+    """Test que les résultats négatifs expirent plus tôt que les positifs"""
+    await station_checks.save_check(async_db, "1", True)
+    await station_checks.save_check(async_db, "2", False)
+
+    positive = await station_checks.get_check(async_db, "1")
+    negative = await station_checks.get_check(async_db, "2")
+    assert negative["exists"] is False
+    assert negative["expires_at"] < positive["expires_at"]
+
+
+@pytest.mark.asyncio
+async def test_expired_check_is_ignored(async_db):
+    """Test qu'une vérification expirée n'est plus utilisée"""
+    await station_checks.save_check(async_db, "12345", True)
+    await async_db[station_checks.COLLECTION].update_one(
+        {"location_id": "12345"},
+        {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+    assert await station_checks.get_check(async_db, "12345") is None
+
+
+@pytest.mark.asyncio
+async def test_verify_station_uses_cache_and_remaps_renamed_station(async_db, sample_location):
+    """Test que la vérification n'interroge OpenAQ qu'une fois et mémorise le nouvel ID"""
+    from main import app, _verify_station
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(dict(request.url.params))
+        if "id" in request.url.params:
+            return httpx.Response(200, json={"results": []})
+        return httpx.Response(200, json={"results": [{"id": 999}]})
+
+    app.mongodb = async_db
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        location = Location(**sample_location)
+        assert await _verify_station(location, "12345", {}) == (True, "999")
+        assert len(calls) == 2  # Par ID puis par nom
+
+        assert await _verify_station(location, "12345", {}) == (True, "999")
+        assert len(calls) == 2  # Servi depuis le cache
+    finally:
+        await openaq_client.close_client()
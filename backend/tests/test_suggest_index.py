@@ -0,0 +1,148 @@
+# backend/tests/test_suggest_index.py
+import pytest
+import time
+
+from config import settings
+from derived_fields import derive_location_fields
+from suggest_index import SuggestIndex, suggest_index
+from tests.patches import AsyncMockDatabase
+
+
+def build(names):
+    index = SuggestIndex()
+    station_id = 0
+    for name, stations, is_city in names:
+        for _ in range(stations):
+            station_id += 1
+            index.add(name, is_city=is_city, station_id=station_id)
+    return index
+
+
+def test_prefix_ranking():
+    """Test le classement : nom exact, villes avant localités, puis nombre de stations"""
+    index = build([
+        ("Paris", 5, True),
+        ("Parma", 9, True),
+        ("Paris 13e Arrondissement", 1, False),
+        ("Pärnu", 2, True),
+    ])
+    assert index.suggest("par") == ["Parma", "Paris", "Pärnu", "Paris 13e Arrondissement"]
+    assert index.suggest("PARIS")[0] == "Paris"
+    assert index.suggest("par", limit=2) == ["Parma", "Paris"]
+
+
+def test_fuzzy_matches_typos_and_inner_words():
+    """Test les correspondances approximatives (fautes de frappe, mot au milieu)"""
+    index = build([("Marseille", 3, True), ("Aix-en-Provence", 1, True), ("Lyon", 2, True)])
+    assert index.suggest("marseile") == ["Marseille"]
+    assert index.suggest("provence") == ["Aix-en-Provence"]
+    assert index.suggest("zzz") == []
+
+
+def test_incremental_updates_and_ignored_names():
+    """Test l'ajout incrémental et l'exclusion des noms inconnus"""
+    index = SuggestIndex()
+    index.add_location({"id": 1, "city": "Lille", "locality": "Unknown"})
+    index.add_location({"id": 1, "city": "Lille", "locality": None})  # Même station : compté une fois
+    index.add_location({"id": 2, "city": "  lille ", "locality": "Roubaix"})
+    assert len(index) == 2
+    assert index.suggest("lil") == ["Lille"]
+    assert index.suggest("unk") == []
+
+
+def test_renamed_and_pruned_stations():
+    """Test qu'une station renommée ou disparue d'une ville n'est plus suggérée"""
+    index = SuggestIndex()
+    index.add_location({"id": 1, "city": "Lile", "locality": None})  # Faute corrigée ensuite
+    index.add_location({"id": 2, "city": "Lille", "locality": "Roubaix"})
+    index.add_location({"id": 3, "city": "Lille", "locality": "Tourcoing"})
+    index.add_location({"id": 1, "city": "Lille", "locality": None})
+    index.add_location({"id": 4, "city": "Roubaix", "locality": "Tourcoing"})
+    assert index.suggest("lil") == ["Lille"]
+
+    # Le rafraîchissement de Lille ne renvoie plus la station 3; la station 4 garde Tourcoing
+    index.prune_city("lille", [1, 2])
+    assert index.suggest("tourc") == ["Tourcoing"]
+    assert index.suggest("lil") == ["Lille"]
+
+    index.remove_station(4)
+    assert index.suggest("tourc") == []
+    assert index.suggest("roub") == ["Roubaix"]
+    index.remove_station(2)
+    assert index.suggest("roub") == []
+    assert len(index) == 1
+
+
+def test_suggest_is_fast():
+    """Test que les suggestions restent sous la milliseconde sur quelques milliers de noms"""
+    index = build([(f"City {i:05d}", 1, True) for i in range(5000)])
+    start = time.perf_counter()
+    for _ in range(100):
+        index.suggest("city 012")
+    assert (time.perf_counter() - start) / 100 < 0.001
+
+
+@pytest.mark.asyncio
+async def test_build_and_route(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test la construction depuis MongoDB et l'utilisation par /api/cities/suggest"""
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": 1, "city": "Bordeaux"},
+        {**sample_location, "id": 2, "city": "Bordères", "locality": "Béarn"},
+    ])
+    index = SuggestIndex()
+    await index.build(AsyncMockDatabase(mock_mongodb))
+    assert index.built
+    monkeypatch.setattr(suggest_index, "built", True)
+    monkeypatch.setattr(suggest_index, "suggest", index.suggest)
+
+    response = await async_client.get("/api/cities/suggest", params={"q": "bord"})
+    assert response.status_code == 200
+    assert response.json() == ["Bordeaux", "Bordères"]
+
+
+@pytest.mark.asyncio
+async def test_refresh_prunes_stored_stations(mock_mongodb, sample_location, monkeypatch):
+    """Test qu'un rafraîchissement complet supprime les stations disparues, et qu'un flux tronqué ne supprime rien"""
+    import httpx
+    import main
+    import openaq_client
+
+    mock_mongodb.locations.insert_many([
+        {**sample_location, "id": i, "locality": f"Quartier {i}", **derive_location_fields({**sample_location, "locality": f"Quartier {i}"})}
+        for i in (1, 2, 3)
+    ])
+    db = AsyncMockDatabase(mock_mongodb)
+    monkeypatch.setattr(main.app, "mongodb", db)
+    index = SuggestIndex()
+    await index.build(db)
+    monkeypatch.setattr(main, "suggest_index", index)
+
+    def handler(ids, fail_on_page=None):
+        def respond(request: httpx.Request):
+            page = int(request.url.params["page"])
+            if page == fail_on_page:
+                return httpx.Response(500, json={"message": "boom"})
+            results = [{**sample_location, "id": i, "locality": f"Quartier {i}"} for i in ids[page - 1]]
+            return httpx.Response(200, json={"meta": {"found": ">100"}, "results": results})
+        return respond
+
+    async def refresh(transport_handler):
+        openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(transport_handler))
+        try:
+            return await main._refresh_locations("Test City", [])
+        finally:
+            await openaq_client.close_client()
+
+    # Page 2 en erreur: la station 2 n'a pas été lue, rien n'est supprimé
+    monkeypatch.setattr(settings, "OPENAQ_PAGE_SIZE", 1)
+    await refresh(handler([[1], [2]], fail_on_page=2))
+    assert mock_mongodb.locations.count_documents({}) == 3
+    assert "Quartier 3" in index.suggest("quartier")
+
+    # Flux complet sans la station 3: supprimée en base et de l'index, même après reconstruction
+    monkeypatch.setattr(settings, "OPENAQ_PAGE_SIZE", 100)
+    await refresh(handler([[1, 2]]))
+    assert sorted(doc["id"] for doc in mock_mongodb.locations.find()) == [1, 2]
+    assert "Quartier 3" not in index.suggest("quartier")
+    await index.build(db)
+    assert index.suggest("quartier") == ["Quartier 1", "Quartier 2"]
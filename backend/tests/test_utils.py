@@ -2,7 +2,7 @@
 import pytest
 import asyncio
 from datetime import datetime, timedelta
-from utils import check_openaq_api_params, generate_demo_measurements, save_debug_info
+from utils import check_openaq_api_params, generate_demo_measurements, save_debug_info, gather_bounded
 import json
 import os
 import httpx
@@ -76,3 +76,91 @@ async def test_check_openaq_api_params():
         assert "timestamp" in result
         assert "test_id" in result
         assert "summary" in result
+
+@pytest.mark.asyncio
+async def test_check_openaq_api_params_uses_requester():
+    """Test que toutes les requêtes passent par la fonction fournie (limiteur OpenAQ)"""
+    urls = []
+
+    async def requester(url, **kwargs):
+        urls.append(url)
+        return httpx.Response(200, json={"results": [{"id": 1, "name": "Test Station"}]},
+                              request=httpx.Request("GET", url, params=kwargs.get("params")))
+
+    with patch("httpx.AsyncClient") as mock_client:
+        result = await check_openaq_api_params("https://api.openaq.org/v3", "1", requester=requester)
+        mock_client.assert_not_called()
+
+    assert len(urls) == 7
+    assert result["recommended_param"]
+
+@pytest.mark.asyncio
+async def test_gather_bounded_limits_concurrency():
+    """Test que gather_bounded respecte la limite de concurrence et l'ordre des résultats"""
+    running = 0
+    peak = 0
+
+    async def worker(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return item * 2
+
+    results = await gather_bounded(range(10), worker, limit=3)
+
+    assert results == [item * 2 for item in range(10)]
+    assert peak == 3
+
+@pytest.mark.asyncio
+async def test_gather_bounded_partial_failures():
+    """Test que les erreurs et timeouts d'un élément n'interrompent pas les autres"""
+    async def worker(item):
+        if item == "error":
+            raise ValueError("boom")
+        if item == "slow":
+            await asyncio.sleep(1)
+        return item
+
+    results = await gather_bounded(["ok", "error", "slow"], worker, limit=2, timeout=0.05)
+
+    assert results[0] == "ok"
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], asyncio.TimeoutError)
+
+@pytest.mark.asyncio
+async def test_slow_limiter_keeps_stored_parameters(mock_mongodb, sample_location, monkeypatch):
+    """Test que l'attente du limiteur ne compte pas dans le timeout d'enrichissement, et qu'un échec garde les paramètres stockés"""
+    import api_update
+    import openaq_client
+    from config import settings
+    from rate_limiter import TokenBucket
+    from tests.patches import AsyncMockDatabase
+
+    mock_mongodb.locations.insert_one({**sample_location, "id": 3, "parameters": [{"parameter": "no2"}], "pollutants": ["no2"]})
+    monkeypatch.setattr(api_update.app, "mongodb", AsyncMockDatabase(mock_mongodb), raising=False)
+    # Un jeton toutes les 50 ms: chaque enrichissement attend plus longtemps que son timeout
+    monkeypatch.setattr(openaq_client, "limiter", TokenBucket(rate=20.0, capacity=1))
+    monkeypatch.setattr(settings, "OPENAQ_ENRICH_TIMEOUT", 0.05)
+
+    def handler(request: httpx.Request):
+        if request.url.path.endswith("/locations"):
+            results = [{**sample_location, "id": i} for i in (1, 2, 3)]
+            return httpx.Response(200, json={"meta": {"found": 3}, "results": results})
+        if request.url.params["location_id"] == "3":
+            return httpx.Response(500, json={"message": "boom"})
+        return httpx.Response(200, json={"results": [{"parameter": {"parameter": "pm25"}}]})
+
+    openaq_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        locations = await api_update._refresh_locations_by_city("Test City", [])
+    finally:
+        await openaq_client.close_client()
+
+    assert len(locations) == 3
+    for i in (1, 2):
+        assert mock_mongodb.locations.find_one({"id": i})["pollutants"] == ["pm25"]
+    failed = mock_mongodb.locations.find_one({"id": 3})
+    assert failed["parameters"] == [{"parameter": "no2"}]
+    assert failed["pollutants"] == ["no2"]
@@ -0,0 +1,167 @@
+# backend/tests/test_write_behind.py
+import pytest
+import asyncio
+from types import SimpleNamespace
+
+import persistence
+from write_behind import PendingResults, WriteBehindQueue
+
+
+class SlowCollection:
+    """Collection factice dont bulk_write prend un peu de temps."""
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    async def bulk_write(self, operations, ordered=True):
+        await asyncio.sleep(self.delay)
+        self.batches.append(list(operations))
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_count=len(operations))
+
+
+def ops(count, start=0):
+    return [persistence.upsert_op({"id": i}, {"id": i}) for i in range(start, start + count)]
+
+
+@pytest.mark.asyncio
+async def test_direct_write_when_not_started():
+    """Test que les écritures sont directes quand le consommateur ne tourne pas"""
+    queue = WriteBehindQueue(max_size=10, batch_size=10, flush_interval=0)
+    collection = SlowCollection()
+    await queue.enqueue(collection, ops(3))
+    assert [len(b) for b in collection.batches] == [3]
+
+
+@pytest.mark.asyncio
+async def test_enqueue_returns_before_write_and_groups_batches():
+    """Test que enqueue rend la main avant l'écriture, puis que les écritures sont regroupées"""
+    queue = WriteBehindQueue(max_size=100, batch_size=50, flush_interval=0.05)
+    queue.start()
+    collection = SlowCollection()
+    try:
+        await queue.enqueue(collection, ops(10))
+        await queue.enqueue(collection, ops(10, start=10))
+        assert collection.batches == []
+        await queue.flush()
+    finally:
+        await queue.stop()
+
+    assert [len(b) for b in collection.batches] == [20]
+    stats = queue.stats()
+    assert stats["written"] == 20
+    assert stats["batches"] == 1
+    assert stats["last_batch_lag"] > 0
+
+
+@pytest.mark.asyncio
+async def test_backpressure_when_full():
+    """Test que enqueue attend quand la file est pleine"""
+    queue = WriteBehindQueue(max_size=5, batch_size=5, flush_interval=0)
+    queue.start()
+    collection = SlowCollection(delay=0.05)
+    try:
+        await asyncio.wait_for(queue.enqueue(collection, ops(20)), timeout=2)
+        assert queue.stats()["blocked_enqueues"] > 0
+        assert queue.stats()["depth"] <= 5
+    finally:
+        await queue.stop()
+    assert sum(len(b) for b in collection.batches) == 20
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_writes():
+    """Test que l'arrêt écrit les opérations en attente"""
+    queue = WriteBehindQueue(max_size=100, batch_size=10, flush_interval=0.01)
+    queue.start()
+    collection = SlowCollection(delay=0.01)
+    await queue.enqueue(collection, ops(30))
+    await queue.stop()
+    assert sum(len(b) for b in collection.batches) == 30
+    assert not queue.running
+
+
+@pytest.mark.asyncio
+async def test_stats_count_writes_not_markers():
+    """Test que la profondeur et les échecs ne comptent que les écritures, pas les marqueurs"""
+    class FailingCollection(SlowCollection):
+        async def bulk_write(self, operations, ordered=True):
+            raise ConnectionError("down")
+
+    queue = WriteBehindQueue(max_size=100, batch_size=100, flush_interval=0.05)
+    queue.start()
+    try:
+        await queue.enqueue(SlowCollection(), ops(3))
+        await queue.on_flushed(lambda: None)
+        await queue.enqueue(FailingCollection(), ops(2, start=3))
+        stats = queue.stats()
+        assert stats["depth"] == 5
+        assert stats["oldest_lag"] >= 0
+        await queue.flush()
+        stats = queue.stats()
+    finally:
+        await queue.stop()
+
+    assert stats["depth"] == 0 and stats["oldest_lag"] is None
+    assert stats["written"] == 3
+    assert stats["failed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_pending_results_until_committed():
+    """Test que le résultat d'un rafraîchissement est gardé jusqu'à l'écriture de ses données"""
+    queue = WriteBehindQueue(max_size=100, batch_size=100, flush_interval=0.05)
+    pending = PendingResults(queue)
+    queue.start()
+    collection = SlowCollection()
+
+    async def refresh():
+        await queue.enqueue(collection, ops(3))
+        return "refreshed"
+
+    try:
+        assert await pending.track("key", refresh) == "refreshed"
+        assert pending.get("key") == "refreshed"
+        await queue.flush()
+        assert pending.get("key") is None
+        assert [len(b) for b in collection.batches] == [3]
+    finally:
+        await queue.stop()
+
+    # Sans consommateur les écritures sont directes : rien n'est gardé
+    assert await pending.track("key", refresh) == "refreshed"
+    assert pending.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_request_before_flush_is_a_cache_hit(async_client, mock_mongodb, sample_location, monkeypatch):
+    """Test qu'une requête arrivant avant l'écriture différée ne relance pas de rafraîchissement"""
+    import main
+    from models import Location
+    from tests.patches import AsyncMockDatabase
+
+    queue = WriteBehindQueue(max_size=100, batch_size=100, flush_interval=0.1)
+    monkeypatch.setattr(main, "write_queue", queue)
+    monkeypatch.setattr(main, "pending_results", PendingResults(queue))
+    monkeypatch.setattr(main.app, "mongodb", AsyncMockDatabase(mock_mongodb))
+    refreshes = []
+
+    async def fake_refresh(city, cached_locations):
+        refreshes.append(city)
+        await queue.enqueue(main.app.mongodb.locations, [persistence.upsert_op({"id": 1}, {"id": 1})])
+        return [Location(**sample_location)]
+
+    monkeypatch.setattr(main, "_refresh_locations", fake_refresh)
+    queue.start()
+    try:
+        first = await async_client.get("/api/locations/Test%20City")
+        second = await async_client.get("/api/locations/Test%20City")
+        assert mock_mongodb.locations.count_documents({}) == 0
+        await queue.flush()
+    finally:
+        await queue.stop()
+
+    assert first.headers["X-Cache-Status"] == "MISS"
+    assert second.headers["X-Cache-Status"] == "HIT"
+    assert second.json() == first.json()
+    assert refreshes == ["Test City"]
+    assert mock_mongodb.locations.count_documents({}) == 1
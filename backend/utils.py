@@ -1,7 +1,8 @@
 """
 Utilitaires pour le backend WeatherWeS
 """
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Dict, Any, Optional, Tuple, List, Callable, Awaitable, Iterable
+import asyncio
 import httpx
 import json
 from datetime import datetime, timedelta
@@ -10,7 +11,9 @@ import random
 async def check_openaq_api_params(
     base_url: str, 
     test_id: str,
-    api_key: Optional[str] = None
+    api_key: Optional[str] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    requester: Optional[Callable[..., Awaitable[httpx.Response]]] = None
 ) -> Dict[str, Any]:
     """
     Tester différents formats de paramètres pour déterminer le bon format
@@ -20,141 +23,148 @@ async def check_openaq_api_params(
         base_url: URL de base de l'API OpenAQ (e.g., 'https://api.openaq.org/v3')
         test_id: ID à utiliser pour les tests
         api_key: Clé API optionnelle
+        client: Client HTTP à utiliser; un client temporaire est créé sinon
+        requester: Fonction GET à utiliser à la place du client (openaq_client.get,
+            qui passe par le limiteur de débit et les retries)
         
     Returns:
         Un dictionnaire contenant les résultats des tests
     """
+    if requester is None and client is None:
+        async with httpx.AsyncClient(timeout=10.0) as own_client:
+            return await check_openaq_api_params(base_url, test_id, api_key, client=own_client)
+
+    get = requester or client.get
     results = {}
     headers = {"X-API-Key": api_key} if api_key else {}
     station_info = {}
     
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        # Vérifier si la station existe dans l'API OpenAQ
-        try:
-            print(f"Checking if station ID {test_id} exists in OpenAQ API")
-            
-            # Essai avec l'endpoint /locations en cherchant par ID
-            locations_response = await client.get(
-                f"{base_url}/locations",
-                params={"id": test_id, "limit": 5},
-                headers=headers
-            )
-            
-            station_info["locations_by_id"] = {
-                "status": locations_response.status_code,
-                "success": locations_response.status_code == 200,
-                "url": str(locations_response.url),
-            }
-            
-            if locations_response.status_code == 200:
-                data = locations_response.json()
-                results_count = len(data.get("results", []))
-                station_info["locations_by_id"]["found"] = results_count > 0
-                station_info["locations_by_id"]["count"] = results_count
-                
-                if results_count > 0:
-                    station_info["locations_by_id"]["station"] = data["results"][0]
-            else:
-                try:
-                    station_info["locations_by_id"]["error"] = locations_response.json()
-                except:
-                    station_info["locations_by_id"]["error"] = locations_response.text
-            
-            # Essayer de trouver la station par nom
-            # Pour cela, si nous avons trouvé la station par ID, utiliser son nom
-            if station_info.get("locations_by_id", {}).get("found", False):
-                station_name = station_info["locations_by_id"]["station"].get("name", "")
-                
-                if station_name:
-                    print(f"Searching for station by name: {station_name}")
-                    name_response = await client.get(
-                        f"{base_url}/locations",
-                        params={"name": station_name, "limit": 10},
-                        headers=headers
-                    )
-                    
-                    station_info["locations_by_name"] = {
-                        "status": name_response.status_code,
-                        "success": name_response.status_code == 200,
-                        "url": str(name_response.url),
-                        "name": station_name
-                    }
-                    
-                    if name_response.status_code == 200:
-                        data = name_response.json()
-                        results_count = len(data.get("results", []))
-                        station_info["locations_by_name"]["found"] = results_count > 0
-                        station_info["locations_by_name"]["count"] = results_count
-                        
-                        if results_count > 0:
-                            # Check if any of the results have the same ID
-                            matching_stations = [
-                                station for station in data.get("results", [])
-                                if str(station.get("id")) == str(test_id)
-                            ]
-                            
-                            station_info["locations_by_name"]["matching_id_count"] = len(matching_stations)
-                    else:
-                        try:
-                            station_info["locations_by_name"]["error"] = name_response.json()
-                        except:
-                            station_info["locations_by_name"]["error"] = name_response.text
-        except Exception as e:
-            station_info["error"] = str(e)
+    # Vérifier si la station existe dans l'API OpenAQ
+    try:
+        print(f"Checking if station ID {test_id} exists in OpenAQ API")
         
-        # Test des paramètres pour measurements
-        tests = [
-            ("location_id", {"location_id": test_id}),
-            ("location", {"location": test_id}),
-            ("locations", {"locations": test_id}),
-            ("id", {"id": test_id}),
-            ("entity", {"entity": test_id})
-        ]
+        # Essai avec l'endpoint /locations en cherchant par ID
+        locations_response = await get(
+            f"{base_url}/locations",
+            params={"id": test_id, "limit": 5},
+            headers=headers
+        )
         
-        for param_name, params in tests:
+        station_info["locations_by_id"] = {
+            "status": locations_response.status_code,
+            "success": locations_response.status_code == 200,
+            "url": str(locations_response.url),
+        }
+        
+        if locations_response.status_code == 200:
+            data = locations_response.json()
+            results_count = len(data.get("results", []))
+            station_info["locations_by_id"]["found"] = results_count > 0
+            station_info["locations_by_id"]["count"] = results_count
+            
+            if results_count > 0:
+                station_info["locations_by_id"]["station"] = data["results"][0]
+        else:
             try:
-                print(f"Testing parameter format: {param_name}={test_id}")
-                response = await client.get(
-                    f"{base_url}/measurements",
-                    params={**params, "limit": 5},
+                station_info["locations_by_id"]["error"] = locations_response.json()
+            except:
+                station_info["locations_by_id"]["error"] = locations_response.text
+        
+        # Essayer de trouver la station par nom
+        # Pour cela, si nous avons trouvé la station par ID, utiliser son nom
+        if station_info.get("locations_by_id", {}).get("found", False):
+            station_name = station_info["locations_by_id"]["station"].get("name", "")
+            
+            if station_name:
+                print(f"Searching for station by name: {station_name}")
+                name_response = await get(
+                    f"{base_url}/locations",
+                    params={"name": station_name, "limit": 10},
                     headers=headers
                 )
                 
-                results[param_name] = {
-                    "status": response.status_code,
-                    "success": response.status_code == 200,
-                    "url": str(response.url),
+                station_info["locations_by_name"] = {
+                    "status": name_response.status_code,
+                    "success": name_response.status_code == 200,
+                    "url": str(name_response.url),
+                    "name": station_name
                 }
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    results[param_name]["count"] = len(data.get("results", []))
+                if name_response.status_code == 200:
+                    data = name_response.json()
+                    results_count = len(data.get("results", []))
+                    station_info["locations_by_name"]["found"] = results_count > 0
+                    station_info["locations_by_name"]["count"] = results_count
                     
-                    # Ajouter des informations sur les mesures trouvées
-                    if data.get("results"):
-                        parameter_counts = {}
-                        dates = []
-                        for measurement in data.get("results", []):
-                            parameter = measurement.get("parameter")
-                            parameter_counts[parameter] = parameter_counts.get(parameter, 0) + 1
-                            dates.append(measurement.get("date"))
+                    if results_count > 0:
+                        # Check if any of the results have the same ID
+                        matching_stations = [
+                            station for station in data.get("results", [])
+                            if str(station.get("id")) == str(test_id)
+                        ]
                         
-                        results[param_name]["parameters"] = parameter_counts
-                        if dates:
-                            results[param_name]["latest_date"] = max(dates)
-                            results[param_name]["earliest_date"] = min(dates)
+                        station_info["locations_by_name"]["matching_id_count"] = len(matching_stations)
                 else:
                     try:
-                        results[param_name]["error"] = response.json()
+                        station_info["locations_by_name"]["error"] = name_response.json()
                     except:
-                        results[param_name]["error"] = response.text
-            except Exception as e:
-                results[param_name] = {
-                    "status": "error",
-                    "success": False,
-                    "error": str(e)
-                }
+                        station_info["locations_by_name"]["error"] = name_response.text
+    except Exception as e:
+        station_info["error"] = str(e)
+    
+    # Test des paramètres pour measurements
+    tests = [
+        ("location_id", {"location_id": test_id}),
+        ("location", {"location": test_id}),
+        ("locations", {"locations": test_id}),
+        ("id", {"id": test_id}),
+        ("entity", {"entity": test_id})
+    ]
     
+    for param_name, params in tests:
+        try:
+            print(f"Testing parameter format: {param_name}={test_id}")
+            response = await get(
+                f"{base_url}/measurements",
+                params={**params, "limit": 5},
+                headers=headers
+            )
+            
+            results[param_name] = {
+                "status": response.status_code,
+                "success": response.status_code == 200,
+                "url": str(response.url),
+            }
+            
+            if response.status_code == 200:
+                data = response.json()
+                results[param_name]["count"] = len(data.get("results", []))
+                
+                # Ajouter des informations sur les mesures trouvées
+                if data.get("results"):
+                    parameter_counts = {}
+                    dates = []
+                    for measurement in data.get("results", []):
+                        parameter = measurement.get("parameter")
+                        parameter_counts[parameter] = parameter_counts.get(parameter, 0) + 1
+                        dates.append(measurement.get("date"))
+                    
+                    results[param_name]["parameters"] = parameter_counts
+                    if dates:
+                        results[param_name]["latest_date"] = max(dates)
+                        results[param_name]["earliest_date"] = min(dates)
+            else:
+                try:
+                    results[param_name]["error"] = response.json()
+                except:
+                    results[param_name]["error"] = response.text
+        except Exception as e:
+            results[param_name] = {
+                "status": "error",
+                "success": False,
+                "error": str(e)
+            }
+
     # Trouver le meilleur paramètre (celui qui a fonctionné)
     best_param = None
     for param, result in results.items():
@@ -176,6 +186,34 @@ async def check_openaq_api_params(
         }
     }
 
+async def gather_bounded(
+    items: Iterable[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    limit: int = 10,
+    timeout: Optional[float] = None
+) -> List[Any]:
+    """
+    Exécute `worker(item)` pour chaque élément en parallèle, avec au plus
+    `limit` appels simultanés et un timeout par élément.
+    
+    Args:
+        items: Éléments à traiter
+        worker: Coroutine appelée pour chaque élément
+        limit: Nombre maximal d'appels simultanés
+        timeout: Timeout en secondes pour chaque appel (None = pas de limite)
+        
+    Returns:
+        Les résultats dans l'ordre des éléments; un appel en échec est
+        remplacé par son exception (asyncio.TimeoutError en cas de timeout)
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+    
+    async def run(item):
+        async with semaphore:
+            return await asyncio.wait_for(worker(item), timeout)
+    
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
 async def save_debug_info(data: Dict[str, Any], filepath: str = "openaq_debug.json"):
     """
     Sauvegarde les informations de débogage dans un fichier JSON
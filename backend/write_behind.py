@@ -0,0 +1,235 @@
+"""
+Write-behind persistence queue.
+
+Handlers enqueue the MongoDB writes of data they already hold in memory and
+return at once; a background consumer group-commits the queued operations
+with persistence.bulk_upsert() in micro-batches. The queue is bounded
+(WRITE_BEHIND_MAX_QUEUE operations): when it is full, enqueue() waits for
+room, which slows producers down instead of growing memory. Pending writes
+are flushed on shutdown. When the consumer is not running (tests, scripts,
+apps that only copy the routes) writes go straight to MongoDB.
+
+Until a refresh's writes are committed, MongoDB still holds the previous
+data. PendingResults keeps the refresh's result in memory meanwhile, so the
+routes serve it instead of seeing a cache miss and refreshing again.
+"""
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+from collections import deque
+from dataclasses import dataclass
+import asyncio
+import logging
+import time
+
+from pymongo import UpdateOne
+
+from config import settings
+import persistence
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Write:
+    collection: Any
+    operation: UpdateOne
+    label: str
+    enqueued_at: float
+    ignore_duplicates: bool = False
+    on_commit: Optional[Callable[[], None]] = None
+
+
+class WriteBehindQueue:
+    """Bounded queue of MongoDB writes committed in the background."""
+
+    def __init__(self, max_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None):
+        self.max_size = max_size or settings.WRITE_BEHIND_MAX_QUEUE
+        self.batch_size = batch_size or settings.WRITE_BEHIND_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.WRITE_BEHIND_FLUSH_INTERVAL
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._pending: Deque[float] = deque()  # Enqueue times of the queued writes (not markers), oldest first
+        self._metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "blocked_enqueues": 0,
+            "last_batch_size": 0,
+            "last_batch_lag": 0.0,
+            "max_lag": 0.0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._consumer is not None and not self._consumer.done()
+
+    def start(self):
+        """Start the background consumer (idempotent)."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._pending.clear()
+        self._consumer = asyncio.ensure_future(self._run())
+        logger.info(f"Write-behind queue started (max {self.max_size} operations, batches of {self.batch_size})")
+
+    async def enqueue(self, collection, operations: List[UpdateOne], label: str = "documents",
+                      ignore_duplicates: bool = False, on_commit: Optional[Callable[[], None]] = None):
+        """
+        Queue `operations` for `collection`. Waits while the queue is full;
+        writes directly when the consumer is not running. See
+        persistence.bulk_upsert() for `ignore_duplicates`. `on_commit` is
+        called once all of `operations` have been written (or have failed).
+        """
+        if not operations:
+            if on_commit:
+                on_commit()
+            return
+        if not self.running:
+            try:
+                await persistence.bulk_upsert(collection, operations, label=label, ignore_duplicates=ignore_duplicates)
+            finally:
+                if on_commit:
+                    on_commit()
+            return
+        now = time.monotonic()
+        for i, operation in enumerate(operations):
+            if self._queue.full():
+                self._metrics["blocked_enqueues"] += 1
+            # Batches are committed in order: the last operation's commit covers the others
+            callback = on_commit if i == len(operations) - 1 else None
+            await self._queue.put(_Write(collection, operation, label, now, ignore_duplicates, callback))
+            self._pending.append(now)
+        self._metrics["enqueued"] += len(operations)
+
+    async def on_flushed(self, callback: Callable[[], None]):
+        """Call `callback` once every write queued so far is committed (at once when not running)."""
+        if not self.running:
+            callback()
+            return
+        await self._queue.put(_Write(None, None, "marker", time.monotonic(), on_commit=callback))
+
+    def _take(self, write: _Write) -> _Write:
+        if write.operation is not None:
+            self._pending.popleft()
+        return write
+
+    async def _next_batch(self) -> List[_Write]:
+        """Wait for a first write, then collect more for up to flush_interval."""
+        batch = [self._take(await self._queue.get())]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._take(await asyncio.wait_for(self._queue.get(), timeout)))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _commit(self, batch: List[_Write]):
+        """Group a batch by collection and write each group with one bulk_upsert."""
+        batch = [write for write in batch if write.operation is not None]  # Without on_flushed() markers
+        if not batch:
+            return
+        lag = time.monotonic() - min(write.enqueued_at for write in batch)
+        groups: Dict[tuple, List[_Write]] = {}
+        for write in batch:
+            groups.setdefault((id(write.collection), write.ignore_duplicates), []).append(write)
+        for writes in groups.values():
+            try:
+                result = await persistence.bulk_upsert(
+                    writes[0].collection,
+                    [write.operation for write in writes],
+                    label=writes[0].label,
+                    ignore_duplicates=writes[0].ignore_duplicates
+                )
+            except Exception as e:
+                self._metrics["failed"] += len(writes)
+                logger.error(f"Write-behind batch of {len(writes)} {writes[0].label} failed: {e}")
+                continue
+            self._metrics["written"] += len(writes) - len(result.errors)
+            self._metrics["failed"] += len(result.errors)
+        self._metrics["batches"] += 1
+        self._metrics["last_batch_size"] = len(batch)
+        self._metrics["last_batch_lag"] = lag
+        self._metrics["max_lag"] = max(self._metrics["max_lag"], lag)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                logger.error(f"Write-behind batch of {len(batch)} operations failed: {e}")
+            finally:
+                for write in batch:
+                    if write.on_commit:
+                        try:
+                            write.on_commit()
+                        except Exception as e:
+                            logger.error(f"Write-behind commit callback failed: {e}")
+                    self._queue.task_done()
+
+    async def flush(self):
+        """Wait until every queued write has been committed."""
+        if self.running:
+            await self._queue.join()
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Flush pending writes (up to `timeout` seconds) and stop the consumer."""
+        if self._consumer is None:
+            return
+        timeout = timeout if timeout is not None else settings.WRITE_BEHIND_SHUTDOWN_TIMEOUT
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Write-behind flush timed out, {len(self._pending)} operations not written")
+        self._consumer.cancel()
+        await asyncio.gather(self._consumer, return_exceptions=True)
+        self._consumer = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, lag and write counts for monitoring."""
+        depth = len(self._pending) if self.running else 0
+        oldest = time.monotonic() - self._pending[0] if depth else None
+        return {
+            "running": self.running,
+            "depth": depth,
+            "max_size": self.max_size,
+            "oldest_lag": oldest,
+            **self._metrics
+        }
+
+
+class PendingResults:
+    """Refresh results whose MongoDB writes are still queued, by refresh key."""
+
+    def __init__(self, queue: WriteBehindQueue):
+        self.queue = queue
+        self._results: Dict[Hashable, Tuple[object, Any]] = {}
+
+    def get(self, key: Hashable) -> Any:
+        """Result of the last refresh for `key` if its writes are not committed yet, else None."""
+        entry = self._results.get(key)
+        return entry[1] if entry else None
+
+    async def track(self, key: Hashable, refresh: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `refresh()` and keep its result under `key` until the writes it queued are committed."""
+        result = await refresh()
+        token = object()
+        self._results[key] = (token, result)
+
+        def committed():
+            # A newer refresh of the same key keeps its own entry
+            if self._results.get(key, (None,))[0] is token:
+                del self._results[key]
+
+        await self.queue.on_flushed(committed)
+        return result
+
+
+# Process-wide queue shared by the location and measurement routes
+write_queue = WriteBehindQueue()
+pending_results = PendingResults(write_queue)